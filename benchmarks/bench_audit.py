@@ -0,0 +1,111 @@
+#!/usr/bin/env python
+"""Audit log cost on the payment path and replay speed.
+
+Times record() as seen by the caller with the write-behind AuditLog against
+masking, writing and fsyncing each exchange inline, then reads the log back
+with and without rebuilding each TransactionResult.
+
+    python benchmarks/bench_audit.py [records] [threads] [directory]
+"""
+
+import os
+import sys
+import tempfile
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from pythorizenet import generate_hash
+from pythorizenet.aim import Transaction
+from pythorizenet.audit import AuditLog, encode, mask, read
+
+HOST = 'secure2.authorize.net'
+PATH = '/gateway/transact.dll'
+
+def exchange():
+    trans = Transaction(HOST, 'login', 'key')
+    trans.set_amount('10.00')
+    trans.set_credit('4222222222222', ['2030', '12'], '123')
+    trans.set_customer('John', 'Smith', address='1 Main St', city='Springfield', state='IL', zip='62701')
+    fields = [''] * 55
+    fields[:12] = ['1', '1', '1', 'This transaction has been approved.', 'ABC123', 'Y', '2000000001', '',
+        '', '10.00', 'CC', 'auth_capture']
+    fields[13:15] = ['John', 'Smith']
+    fields[37] = generate_hash('', 'login', '2000000001', '10.00')
+    fields[50] = 'XXXX2222'
+    return trans._toPost('AUTH_CAPTURE'), '|'.join(fields)
+
+def percentile(timings, fraction):
+    timings = sorted(timings)
+    return timings[min(len(timings) - 1, int(len(timings) * fraction))]
+
+def inline(path):
+    out = open(path, 'ab')
+    lock = threading.Lock()
+    def record(host, path, request_type, request, response, error, started):
+        now = time.time()
+        data = encode(now, now - started, host, path, request_type, mask(request), mask(response), error)
+        lock.acquire()
+        try:
+            out.write(data)
+            out.flush()
+            os.fsync(out.fileno())
+        finally:
+            lock.release()
+    return record, out.close
+
+def behind(path):
+    log = AuditLog(path)
+    def close():
+        log.flush()
+        log.close()
+    return log.record, close
+
+def writing(name, factory, path, records, threads):
+    if os.path.exists(path):
+        os.remove(path)
+    request, response = exchange()
+    record, close = factory(path)
+    timings = []
+    def work(count):
+        mine = []
+        for i in xrange(count):
+            started = time.time()
+            record(HOST, PATH, 'AUTH_CAPTURE', request, response, None, started)
+            mine.append(time.time() - started)
+        timings.extend(mine)
+    workers = [threading.Thread(target=work, args=(records // threads,)) for i in xrange(threads)]
+    started = time.time()
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+    close()
+    elapsed = time.time() - started
+    print '%-14s %8.0f records/s  record() p50 %7.3f ms  p99 %7.3f ms' % (
+        name, len(timings) / elapsed, percentile(timings, 0.5) * 1000, percentile(timings, 0.99) * 1000)
+
+def reading(path):
+    for name, func in (('read', lambda record: record), ('read + result', lambda record: record.result().code)):
+        started = time.time()
+        count = 0
+        for record in read(path):
+            func(record)
+            count += 1
+        print '%-14s %8.0f records/s' % (name, count / (time.time() - started))
+
+def main(records=20000, threads=8, directory=None):
+    directory = directory or tempfile.mkdtemp()
+    path = os.path.join(directory, 'bench.audit')
+    try:
+        writing('inline fsync', inline, path, records // 10, threads)
+        writing('write-behind', behind, path, records, threads)
+        reading(path)
+    finally:
+        if os.path.exists(path):
+            os.remove(path)
+
+if __name__ == '__main__':
+    args = sys.argv[1:]
+    main(*[int(arg) for arg in args[:2]] + args[2:])
@@ -0,0 +1,94 @@
+#!/usr/bin/env python
+"""Silent Post callbacks: parse and hash check per body against a typical
+hand-rolled handler, then a burst of callbacks from many web worker threads
+into a CallbackReceiver whose handler is slower than they arrive.
+
+    python benchmarks/bench_callbacks.py [callbacks] [threads]
+"""
+
+import os
+import sys
+import threading
+import time
+import urllib
+import urlparse
+from cStringIO import StringIO
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from pythorizenet import generate_hash
+from pythorizenet.callbacks import CallbackReceiver, CallbackResult
+
+LOGIN = 'merchantlogin01'
+SALT = 'salt'
+
+def bodies(count):
+    results = []
+    for i in xrange(count):
+        trans_id = str(2000000000 + i)
+        amount = '%d.%02d' % (i % 500 + 1, i % 100)
+        results.append(urllib.urlencode([
+            ('x_response_code', '1'), ('x_response_subcode', '1'), ('x_response_reason_code', '1'),
+            ('x_response_reason_text', 'This transaction has been approved.'), ('x_auth_code', 'ABC123'),
+            ('x_avs_code', 'Y'), ('x_trans_id', trans_id), ('x_invoice_num', 'INV%d' % i),
+            ('x_description', 'Monthly plan'), ('x_amount', amount), ('x_method', 'CC'),
+            ('x_type', 'auth_capture'), ('x_cust_id', str(i)), ('x_first_name', 'John'),
+            ('x_last_name', 'Smith'), ('x_address', '1 Main St'), ('x_city', 'Springfield'),
+            ('x_state', 'IL'), ('x_zip', '62701'), ('x_country', 'US'), ('x_email', 'john@example.com'),
+            ('x_MD5_Hash', generate_hash(SALT, LOGIN, trans_id, amount)), ('x_cvv2_resp_code', 'M'),
+            ('x_account_number', 'XXXX1111'), ('x_card_type', 'Visa'),
+            ('x_subscription_id', str(1000 + i)), ('x_subscription_paynum', '1'),
+        ]))
+    return results
+
+def naive(body):
+    form = dict((name, values[0]) for name, values in urlparse.parse_qs(body).items())
+    valid = form['x_MD5_Hash'].upper() == generate_hash(SALT, LOGIN, form['x_trans_id'], form['x_amount'])
+    return valid, int(form['x_response_code'])
+
+def parsing(callbacks):
+    receiver = CallbackReceiver(LOGIN, SALT, None)
+    verify = receiver.verifier.verify
+    def parsed(body):
+        result = CallbackResult(body)
+        return verify(result), result.code
+    for name, func in (('parse_qs + generate_hash', naive), ('CallbackResult + verify', parsed)):
+        started = time.time()
+        for body in callbacks:
+            func(body)
+        elapsed = time.time() - started
+        print '%-28s %9.0f callbacks/s' % (name, len(callbacks) / elapsed)
+
+def burst(callbacks, threads, queue_size, handler_delay=0.0002):
+    def handle(result):
+        time.sleep(handler_delay)
+    receiver = CallbackReceiver(LOGIN, SALT, handle, workers=2, queue_size=queue_size).start()
+    statuses = {}
+    def post(share):
+        for body in share:
+            environ = {'REQUEST_METHOD': 'POST', 'CONTENT_LENGTH': str(len(body)), 'wsgi.input': StringIO(body)}
+            seen = []
+            receiver(environ, lambda status, headers: seen.append(status))
+            statuses[seen[0]] = statuses.get(seen[0], 0) + 1
+    shares = [callbacks[i::threads] for i in xrange(threads)]
+    workers = [threading.Thread(target=post, args=(share,)) for share in shares]
+    started = time.time()
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+    accepted = time.time() - started
+    receiver.stop()
+    handled = time.time() - started
+    stats = receiver.stats()
+    print 'queue %6d: %6.0f accepted/s, all handled after %.2fs, %d answered 503, %d handled' % (
+        queue_size, stats['accepted'] / accepted, handled, stats['busy'], stats['handled'])
+
+def main(count=20000, threads=16):
+    callbacks = bodies(count)
+    parsing(callbacks)
+    burst(callbacks, threads, count)
+    burst(callbacks, threads, 100)
+
+if __name__ == '__main__':
+    main(*[int(arg) for arg in sys.argv[1:]])
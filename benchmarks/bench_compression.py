@@ -0,0 +1,62 @@
+#!/usr/bin/env python
+"""CIM profile round trips against a stub gateway that compresses its
+responses, with and without compression negotiated: body bytes over the
+wire per call and time per call. getCustomerProfile returns `size` payment
+profiles; createCustomerProfile sends as many, compressed with gzip when
+requests are.
+
+    python benchmarks/bench_compression.py [requests] [size]
+"""
+
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from pythorizenet import close_pools
+from pythorizenet.compression import GZIP
+from pythorizenet.cim import Customer
+
+from stub import StubGateway
+
+LOGIN = 'login'
+KEY = 'key'
+
+def customer(gateway, accept, request):
+    customer = Customer(gateway.host, LOGIN, KEY)
+    if accept or request:
+        customer.conn.set_compression(accept, request)
+    return customer
+
+def run(name, gateway, requests, size, accept, request):
+    get = customer(gateway, accept, request)
+    get.set_profile_id('1234')
+    create = customer(gateway, accept, request)
+    for i in xrange(size):
+        create.add_payment('4222222222222', ['2030', '12'], '123')
+    for label, call in (('get', get.get), ('create', create.create)):
+        bytes_in, bytes_out = gateway.bytes_in, gateway.bytes_out
+        started = time.time()
+        for i in xrange(requests):
+            result = call()
+            assert result.resultCode == 'Ok', result.reason
+        elapsed = time.time() - started
+        print '%-14s %-6s %8.0f bytes sent %8.0f bytes received  %7.2f ms/call' % (
+            name, label, float(gateway.bytes_in - bytes_in) / requests,
+            float(gateway.bytes_out - bytes_out) / requests, elapsed / requests * 1000)
+
+def main(requests=200, size=500):
+    requests, size = int(requests), int(size)
+    gateway = StubGateway(size=size, compress=True).start()
+    gateway.install()
+    try:
+        run('plain', gateway, requests, size, False, None)
+        run('gzip responses', gateway, requests, size, True, None)
+        run('gzip both', gateway, requests, size, True, GZIP)
+    finally:
+        close_pools()
+        gateway.stop()
+
+if __name__ == '__main__':
+    main(*sys.argv[1:])
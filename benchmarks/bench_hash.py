@@ -0,0 +1,60 @@
+#!/usr/bin/env python
+"""Compare re-verifying AIM response hashes one by one against a
+HashVerifier, for a typical short salt + login and one spanning two MD5 blocks.
+
+    python benchmarks/bench_hash.py [responses]
+"""
+
+import sys
+import time
+
+from pythorizenet import generate_hash, md5
+from pythorizenet.aim import HashVerifier, TransactionResult
+
+LOGIN = 'merchantlogin01'
+SALTS = (('short', 'salt'), ('long', 's' * 128))
+
+def responses(salt, count, corrupt_every=1000):
+    results = []
+    for i in xrange(count):
+        trans_id = str(2000000000 + i)
+        amount = '%d.%02d' % (i % 500, i % 100)
+        fields = [''] * 55
+        fields[0] = '1'
+        fields[6] = trans_id
+        fields[9] = amount
+        fields[37] = generate_hash(salt, LOGIN, trans_id, amount)
+        if i % corrupt_every == 0:
+            fields[37] = '0' * 32
+        results.append(TransactionResult('|'.join(fields)))
+    return results
+
+def naive(results, login, salt):
+    # TransactionResult.validate as it used to be.
+    return [result.hash.upper() == md5(''.join([salt, login, result.transaction_id, result.amount])).hexdigest().upper()
+        for result in results]
+
+def timed(func):
+    started = time.time()
+    value = func()
+    return value, time.time() - started
+
+def main(count=200000):
+    for name, salt in SALTS:
+        results = responses(salt, count)
+        expected, naive_time = timed(lambda: naive(results, LOGIN, salt))
+        verifier = HashVerifier(LOGIN, salt)
+        valid, batch_time = timed(lambda: verifier.verify_all(results))
+        if valid != expected:
+            raise Exception('HashVerifier disagrees with the naive check!')
+        failed = [index for index, result, hash in verifier.mismatches(results)]
+        if failed != [index for index, ok in enumerate(expected) if not ok]:
+            raise Exception('HashVerifier reported the wrong mismatches!')
+        print '%-5s prefix  naive: %9.0f/s  verifier: %9.0f/s  (%.2fx)  %d mismatches' % (
+            name, count / naive_time, count / batch_time, naive_time / batch_time, len(failed))
+
+if __name__ == '__main__':
+    if len(sys.argv) > 1:
+        main(int(sys.argv[1]))
+    else:
+        main()
@@ -0,0 +1,68 @@
+#!/usr/bin/env python
+"""Measure cold-start import time of the AIM path against the full package.
+
+Each case runs in a fresh interpreter. Exits non-zero if importing
+pythorizenet.aim loads lxml, or takes more than ratio (default 1.7) times as
+long as importing the standard library modules it cannot do without, so
+XML dependencies and eager imports creeping back onto the AIM path are
+caught.
+
+    python benchmarks/bench_import.py [runs] [ratio]
+"""
+
+import os
+import subprocess
+import sys
+import time
+
+CASES = (
+    ('aim', 'import pythorizenet.aim'),
+    ('arb + cim', 'import pythorizenet.aim, pythorizenet.arb, pythorizenet.cim'),
+    ('full, first parse', 'import pythorizenet.aim, pythorizenet.arb, pythorizenet.cim; '
+        'pythorizenet.arb.RecurringResult("<r><messages><resultCode>Ok</resultCode></messages></r>")'),
+)
+
+# What the AIM path needs from the standard library in any case.
+FLOOR = 'import array, httplib, socket, ssl, threading, time, urllib'
+
+RATIO = 1.7
+
+CHECK = 'import sys, pythorizenet.aim; sys.exit("lxml" in sys.modules)'
+
+def environ():
+    env = dict(os.environ)
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    env['PYTHONPATH'] = os.pathsep.join(filter(None, [root, env.get('PYTHONPATH')]))
+    return env
+
+def timed(code, runs, env):
+    timings = []
+    for i in xrange(runs):
+        started = time.time()
+        subprocess.check_call([sys.executable, '-c', code], env=env)
+        timings.append(time.time() - started)
+    timings.sort()
+    return timings[len(timings) // 2]
+
+def main(runs=20, ratio=RATIO):
+    runs, ratio = int(runs), float(ratio)
+    env = environ()
+    baseline = timed('pass', runs, env)
+    print '%-20s %8.1f ms' % ('interpreter', baseline * 1000)
+    added = {}
+    for name, code in (('stdlib floor', FLOOR),) + CASES:
+        elapsed = timed(code, runs, env)
+        added[name] = elapsed - baseline
+        print '%-20s %8.1f ms  (+%.1f ms)' % (name, elapsed * 1000, added[name] * 1000)
+    failed = False
+    if subprocess.call([sys.executable, '-c', CHECK], env=env):
+        print 'FAIL: importing pythorizenet.aim loads lxml'
+        failed = True
+    if added['aim'] > added['stdlib floor'] * ratio:
+        print 'FAIL: importing pythorizenet.aim takes over %.1fx the standard library it needs' % ratio
+        failed = True
+    if failed:
+        sys.exit(1)
+
+if __name__ == '__main__':
+    main(*sys.argv[1:])
@@ -0,0 +1,61 @@
+#!/usr/bin/env python
+"""Push a Batch of AIM authorizations at a stub gateway that throttles
+beyond `capacity` requests in flight, with a fixed number of workers and
+then with an AdaptiveLimiter in front of the same workers.
+
+    python benchmarks/bench_limits.py [requests] [workers] [capacity]
+"""
+
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from pythorizenet import close_pools
+from pythorizenet.aim import Merchant
+from pythorizenet.batch import Batch
+from pythorizenet.limits import AdaptiveLimiter, set_limiter
+
+from stub import StubGateway
+
+LOGIN = 'login'
+KEY = 'key'
+
+def transactions(merchant, count):
+    for i in xrange(count):
+        trans = merchant.transaction()
+        trans.set_amount('1.00')
+        trans.set_credit('4222222222222', ['2030', '12'])
+        yield trans
+
+def run(name, gateway, requests, workers, limiter=None):
+    set_limiter(LOGIN, gateway.host, limiter)
+    merchant = Merchant(gateway.host, LOGIN, KEY)
+    gateway.throttled = 0
+    approved = 0
+    started = time.time()
+    for item in Batch(transactions(merchant, requests), 'authorize', workers, ordered=False):
+        if item.error is None and item.result.code == 1:
+            approved += 1
+    elapsed = time.time() - started
+    line = '%-10s %8.0f approved/s  %5d approved  %5d throttled' % (
+        name, approved / elapsed, approved, gateway.throttled)
+    if limiter is not None:
+        stats = limiter.stats()
+        line += '  limit %.1f  cuts %d' % (stats['limit'], stats['decreases'])
+    print line
+
+def main(requests=3000, workers=64, capacity=16):
+    gateway = StubGateway(latency=0.05, capacity=capacity).start()
+    gateway.install(workers)
+    try:
+        run('fixed', gateway, requests, workers)
+        run('adaptive', gateway, requests, workers, AdaptiveLimiter(LOGIN, gateway.host, max_limit=workers))
+    finally:
+        set_limiter(LOGIN, gateway.host, None)
+        close_pools()
+        gateway.stop()
+
+if __name__ == '__main__':
+    main(*[int(arg) for arg in sys.argv[1:]])
@@ -0,0 +1,99 @@
+#!/usr/bin/env python
+"""Reconcile a generated AIM response log with 1, 2, 4, ... processes (up
+to the number of cores), checking every run against a plain loop over
+TransactionResult first.
+
+    python benchmarks/bench_reconcile.py [responses]
+"""
+
+import multiprocessing
+import os
+import sys
+import tempfile
+import time
+
+from pythorizenet import generate_hash
+from pythorizenet.aim import TransactionResult
+from pythorizenet.reconcile import reconcile, save, load, COLUMNS
+
+LOGIN = 'merchantlogin01'
+SALT = 'salt'
+
+def write_log(path, count):
+    out = open(path, 'wb')
+    try:
+        for i in xrange(count):
+            # Captures and voids reuse an earlier transaction ID.
+            trans_id = str(2000000000 + i - i % 3)
+            amount = '%d.%02d' % (i % 500, i % 100)
+            fields = [''] * 55
+            fields[0] = '1243'[i % 4]
+            fields[1] = '1'
+            fields[2] = '1'
+            fields[3] = i % 7 and 'This transaction has been approved.' or '(TESTMODE) This transaction has been approved.'
+            fields[6] = trans_id
+            fields[9] = amount
+            fields[37] = generate_hash(i % 1000 and SALT or 'wrong', LOGIN, trans_id, amount)
+            out.write('|'.join(fields) + '\n')
+    finally:
+        out.close()
+
+def naive(path):
+    totals = {}
+    for line in open(path, 'rb'):
+        result = TransactionResult(line.rstrip('\n'))
+        row = totals.setdefault(int(result.transaction_id), [0] * 9)
+        code = result.field(0)
+        if code == '3':
+            row[3] += 1
+            continue
+        column = {'1': 0, '2': 1, '4': 2}[code]
+        dollars, cents = result.amount.split('.')
+        row[column] += 1
+        row[column + 6] += int(dollars) * 100 + int(cents)
+        row[4] += result.test
+        row[5] += not result.validate(LOGIN, SALT)
+    return totals
+
+def same(totals, expected):
+    if len(totals['transaction_id']) != len(expected):
+        return False
+    for index, trans_id in enumerate(totals['transaction_id']):
+        if [int(totals[name][index]) for name in COLUMNS[1:]] != expected[int(trans_id)]:
+            return False
+    return True
+
+def main(count=1000000):
+    path = tempfile.mktemp(suffix='.log')
+    write_log(path, count)
+    try:
+        print 'log: %d responses, %.1f MB' % (count, os.path.getsize(path) / 1e6)
+        started = time.time()
+        expected = naive(path)
+        baseline = time.time() - started
+        print 'TransactionResult loop    %9.0f responses/s' % (count / baseline)
+        processes = 1
+        while processes <= multiprocessing.cpu_count():
+            started = time.time()
+            totals = reconcile(path, LOGIN, SALT, processes=processes)
+            elapsed = time.time() - started
+            if not same(totals, expected):
+                raise Exception('reconcile() disagrees with TransactionResult!')
+            print 'reconcile, %2d processes  %9.0f responses/s  (%.1fx)' % (
+                processes, count / elapsed, baseline / elapsed)
+            processes *= 2
+        output = path + '.npz'
+        save(totals, output)
+        if not same(load(output), expected):
+            raise Exception('Saved totals do not load back!')
+        print 'columnar output: %.1f KB for %d transactions' % (
+            os.path.getsize(output) / 1e3, len(totals['transaction_id']))
+        os.remove(output)
+    finally:
+        os.remove(path)
+
+if __name__ == '__main__':
+    if len(sys.argv) > 1:
+        main(int(sys.argv[1]))
+    else:
+        main()
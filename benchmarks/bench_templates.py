@@ -0,0 +1,176 @@
+#!/usr/bin/env python
+"""Compare the precompiled ARB/CIM templates against building the same
+request with an lxml tree, checking the output is byte-identical first.
+
+    python benchmarks/bench_templates.py [iterations]
+"""
+
+import datetime
+import sys
+import time
+
+from lxml import etree
+
+from pythorizenet import TYPE_CREDIT
+from pythorizenet.arb import Recurring, ANET_XMLNS
+from pythorizenet.cim import Customer, XMLNS
+
+def _address(parent, tag, entry):
+    (first_name, last_name, company, address, city, state, zip, country) = entry
+    elem = etree.SubElement(parent, tag)
+    etree.SubElement(elem, 'firstName').text = first_name
+    etree.SubElement(elem, 'lastName').text = last_name
+    if company:
+        etree.SubElement(elem, 'company').text = company
+    if address:
+        etree.SubElement(elem, 'address').text = address
+    if city:
+        etree.SubElement(elem, 'city').text = city
+    if state:
+        etree.SubElement(elem, 'state').text = state
+    if zip:
+        etree.SubElement(elem, 'zip').text = zip
+    if country:
+        etree.SubElement(elem, 'country').text = country
+
+def arb_tree(self, requestType):
+    root = etree.Element(requestType, xmlns=ANET_XMLNS)
+    auth = etree.SubElement(root, "merchantAuthentication")
+    etree.SubElement(auth, "name").text = self.login
+    etree.SubElement(auth, "transactionKey").text = self.key
+    if self.subscription_id:
+        etree.SubElement(root, 'subscriptionId').text = str(self.subscription_id)
+    if requestType != 'ARBCancelSubscriptionRequest':
+        subscription = etree.SubElement(root, 'subscription')
+        if self.schedule:
+            (start, total, count, unit) = self.schedule
+            schedule = etree.SubElement(subscription, 'paymentSchedule')
+            interval = etree.SubElement(schedule, 'interval')
+            etree.SubElement(interval, 'length').text = str(count)
+            etree.SubElement(interval, 'unit').text = str(unit)
+            etree.SubElement(schedule, 'startDate').text = start.strftime('%Y-%m-%d')
+            if self.trial:
+                total += self.trial[0]
+                etree.SubElement(schedule, 'trialOccurrences').text = str(self.trial[0])
+            etree.SubElement(schedule, 'totalOccurrences').text = str(total)
+        if self.amount:
+            etree.SubElement(subscription, 'amount').text = str(self.amount)
+        if self.trial:
+            etree.SubElement(subscription, 'trialAmount').text = str(self.trial[1])
+        if self.payment:
+            if self.payment[0] == TYPE_CREDIT:
+                (card_num, card_exp) = self.payment[1]
+                payment = etree.SubElement(subscription, 'payment')
+                credit = etree.SubElement(payment, 'creditCard')
+                etree.SubElement(credit, 'cardNumber').text = card_num
+                etree.SubElement(credit, 'expirationDate').text = '%s-%s' % card_exp
+        if self.customer:
+            _address(subscription, 'billTo', self.customer)
+    return etree.tostring(root, xml_declaration=True, encoding='utf-8')
+
+def cim_tree(self, requestType):
+    rootElem = etree.Element(requestType, xmlns=XMLNS)
+    authElem = etree.SubElement(rootElem, "merchantAuthentication")
+    etree.SubElement(authElem, "name").text = self.login
+    etree.SubElement(authElem, "transactionKey").text = self.key
+    if self.request_id:
+        etree.SubElement(rootElem, 'refId').text = str(self.request_id)
+    if self.profile_id:
+        etree.SubElement(rootElem, 'customerProfileId').text = str(self.profile_id)
+    if requestType == 'createCustomerProfileRequest':
+        parentElem = etree.SubElement(rootElem, 'profile')
+        if self.customer_id:
+            etree.SubElement(parentElem, 'merchantCustomerId').text = str(self.customer_id)
+        profileTag = 'paymentProfiles'
+    else:
+        parentElem = rootElem
+        profileTag = 'paymentProfile'
+    if self.payment or self.billto:
+        profileElem = etree.SubElement(parentElem, profileTag)
+        for entry in self.billto:
+            _address(profileElem, 'billTo', entry)
+        for type, cc_info in self.payment:
+            if type == TYPE_CREDIT:
+                (card_num, card_exp, card_code) = cc_info
+                credit = etree.SubElement(etree.SubElement(profileElem, 'payment'), 'creditCard')
+                etree.SubElement(credit, 'cardNumber').text = card_num
+                etree.SubElement(credit, 'expirationDate').text = '%s-%s' % card_exp
+                if card_code:
+                    etree.SubElement(credit, 'cardCode').text = card_code
+    for entry in self.shipping:
+        if requestType == 'createCustomerProfileRequest':
+            _address(parentElem, 'shipToList', entry)
+        else:
+            _address(rootElem, 'address', entry)
+    etree.SubElement(rootElem, 'validationMode').text = str(self.validation_mode)
+    return etree.tostring(rootElem, xml_declaration=True, encoding='utf-8')
+
+def recurring_fixtures():
+    full = Recurring('localhost', 'login', 'key&<key>')
+    full.set_schedule(start=datetime.datetime(2020, 1, 31), count=1)
+    full.set_trial(2, '0.00')
+    full.set_amount('10.00')
+    full.set_credit('4222222222222', ['2030', '3'])
+    full.set_customer('John', u'Bolidenv\xe4gen', 'ACME & Sons', '1 Main St', 'Springfield', 'IL', '62701', 'US')
+    update = Recurring('localhost', 'login', 'key')
+    update.set_subscription_id(12345)
+    update.set_amount('20.00')
+    update.set_customer(None, '')
+    cancel = Recurring('localhost', 'login', 'key')
+    cancel.set_subscription_id('12345')
+    return [
+        (full, 'ARBCreateSubscriptionRequest'),
+        (update, 'ARBUpdateSubscriptionRequest'),
+        (update, 'ARBCancelSubscriptionRequest'),
+        (cancel, 'ARBCancelSubscriptionRequest'),
+        (Recurring('localhost', 'login', 'key'), 'ARBUpdateSubscriptionRequest'),
+    ]
+
+def customer_fixtures():
+    profile = Customer('localhost', 'login', 'key')
+    profile.set_customer_id(42)
+    profile.set_request_id('r1')
+    for i in range(3):
+        profile.add_payment('4222222222222', ['2030', '12'], '123' if i else None)
+        profile.add_billto('John', 'Smith', city='Springfield\r')
+        profile.add_shipping('Jane', 'Smith', address='2 <Main> St')
+    payment = Customer('localhost', 'login', 'key')
+    payment.set_profile_id(1001)
+    payment.add_payment('4222222222222', ['2030', '1'])
+    shipping = Customer('localhost', 'login', 'key')
+    shipping.set_profile_id(1001)
+    shipping.add_shipping('Jane', 'Smith', zip='62701')
+    return [
+        (profile, 'createCustomerProfileRequest'),
+        (Customer('localhost', 'login', 'key'), 'createCustomerProfileRequest'),
+        (payment, 'createCustomerPaymentProfileRequest'),
+        (shipping, 'createCustomerShippingAddressRequest'),
+    ]
+
+def check(fixtures, tree):
+    for obj, requestType in fixtures:
+        expected = tree(obj, requestType)
+        actual = obj._toXml(requestType)
+        if actual != expected:
+            raise Exception('Template output differs for %s:\n%s\n%s' % (requestType, expected, actual))
+
+def rate(func, fixtures, iterations):
+    started = time.time()
+    for i in xrange(iterations):
+        for obj, requestType in fixtures:
+            func(obj, requestType)
+    return iterations * len(fixtures) / (time.time() - started)
+
+def main(iterations=20000):
+    for name, fixtures, tree in (('ARB', recurring_fixtures(), arb_tree), ('CIM', customer_fixtures(), cim_tree)):
+        check(fixtures, tree)
+        tree_rate = rate(tree, fixtures, iterations)
+        template_rate = rate(lambda obj, requestType: obj._toXml(requestType), fixtures, iterations)
+        print '%s  lxml tree: %9.0f req/s  template: %9.0f req/s  (%.1fx)' % (
+            name, tree_rate, template_rate, template_rate / tree_rate)
+
+if __name__ == '__main__':
+    if len(sys.argv) > 1:
+        main(int(sys.argv[1]))
+    else:
+        main()
@@ -0,0 +1,80 @@
+#!/usr/bin/env python
+"""AIM round trips from many threads over the pooled HTTP/1.1 transport and
+the HTTP/2 transport, each against its own stub gateway, with the number of
+sockets the client held open at the end.
+
+    python benchmarks/bench_transports.py [requests] [threads] [latency]
+"""
+
+import os
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from pythorizenet import close_pools
+from pythorizenet.transport import close_transports
+from pythorizenet.aim import Merchant
+
+from stub import StubGateway, H2StubGateway
+
+LOGIN = 'login'
+KEY = 'key'
+
+def percentile(timings, fraction):
+    timings = sorted(timings)
+    return timings[min(len(timings) - 1, int(len(timings) * fraction))]
+
+def sockets():
+    count = 0
+    for fd in os.listdir('/proc/self/fd'):
+        try:
+            if os.readlink('/proc/self/fd/' + fd).startswith('socket:'):
+                count += 1
+        except OSError:
+            pass
+    return count
+
+def run(name, gateway, requests, threads):
+    before = sockets()
+    gateway.install(threads)
+    merchant = Merchant(gateway.host, LOGIN, KEY)
+    timings = []
+    def work(count):
+        mine = []
+        for i in xrange(count):
+            trans = merchant.transaction()
+            trans.set_amount('1.00')
+            trans.set_credit('4222222222222', ['2030', '12'])
+            started = time.time()
+            trans.authorize()
+            mine.append(time.time() - started)
+        timings.extend(mine)
+    workers = [threading.Thread(target=work, args=(requests // threads,)) for i in xrange(threads)]
+    started = time.time()
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+    elapsed = time.time() - started
+    # The stub's own sockets are in this process too; count the client's
+    # half of each connection.
+    print '%-10s %7.0f ops/s  p50 %7.2f ms  p99 %7.2f ms  %3d client sockets' % (
+        name, len(timings) / elapsed, percentile(timings, 0.5) * 1000, percentile(timings, 0.99) * 1000,
+        (sockets() - before) // 2)
+
+def main(requests=4000, threads=64, latency=0.02):
+    http1 = StubGateway(latency=float(latency)).start()
+    http2 = H2StubGateway(latency=float(latency)).start()
+    try:
+        run('HTTP/1.1', http1, int(requests), int(threads))
+        run('HTTP/2', http2, int(requests), int(threads))
+    finally:
+        close_transports()
+        close_pools()
+        http1.stop()
+        http2.stop()
+
+if __name__ == '__main__':
+    main(*sys.argv[1:])
@@ -0,0 +1,214 @@
+#!/usr/bin/env python
+"""Benchmark suite: serialization, parsing and round trips against the stub.
+
+    python benchmarks/run.py [-o results.json] [--latency 0.01] [--quick]
+
+Every measurement reports throughput and p50/p99 latency; results are
+printed as a table and, with -o, written as JSON so runs of different
+versions can be compared.
+"""
+
+import datetime
+import json
+import optparse
+import os
+import platform
+import Queue
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from pythorizenet import aio, close_pools
+from pythorizenet.aim import Merchant, Transaction, TransactionResult
+from pythorizenet.arb import Recurring, RecurringResult
+from pythorizenet.cim import Customer, CustomerResult
+
+from stub import StubGateway
+
+LOGIN = 'login'
+KEY = 'key'
+
+def percentile(timings, fraction):
+    if not timings:
+        return 0.0
+    timings = sorted(timings)
+    return timings[min(len(timings) - 1, int(len(timings) * fraction))]
+
+def summary(name, timings, elapsed, **extra):
+    result = {
+        'name': name,
+        'count': len(timings),
+        'ops_per_sec': len(timings) / elapsed if elapsed else 0.0,
+        'p50_ms': percentile(timings, 0.50) * 1000,
+        'p99_ms': percentile(timings, 0.99) * 1000,
+    }
+    result.update(extra)
+    return result
+
+def measure(name, func, iterations):
+    timings = []
+    clock = time.time
+    started = clock()
+    for i in xrange(iterations):
+        before = clock()
+        func()
+        timings.append(clock() - before)
+    return summary(name, timings, clock() - started)
+
+def transaction(host, merchant=None):
+    if merchant is None:
+        trans = Transaction(host, LOGIN, KEY)
+    else:
+        trans = merchant.transaction()
+    trans.set_amount('1.00')
+    trans.set_credit('4222222222222', ['2030', '12'], '123')
+    trans.set_customer('John', 'Smith', address='1 Main St', city='Springfield', state='IL', zip='62701')
+    return trans
+
+def recurring(host):
+    create = Recurring(host, LOGIN, KEY)
+    create.set_schedule(start=datetime.datetime(2030, 1, 1))
+    create.set_amount('10.00')
+    create.set_credit('4222222222222', ['2030', '12'])
+    create.set_customer('John', 'Smith')
+    return create
+
+def customer(host, profiles):
+    profile = Customer(host, LOGIN, KEY)
+    profile.set_customer_id(42)
+    for i in xrange(profiles):
+        profile.add_payment('4222222222222', ['2030', '12'], '123')
+        profile.add_billto('John', 'Smith', city='Springfield')
+    return profile
+
+def serialization(iterations):
+    trans = transaction('localhost')
+    merchant = Merchant('localhost', LOGIN, KEY)
+    create = recurring('localhost')
+    profile = customer('localhost', 10)
+    return [
+        measure('serialize aim _toPost', lambda: trans._toPost('AUTH_ONLY'), iterations),
+        measure('build + serialize aim Transaction', lambda: transaction('localhost')._toPost('AUTH_ONLY'), iterations),
+        measure('build + serialize aim Merchant', lambda: transaction('localhost', merchant)._toPost('AUTH_ONLY'), iterations),
+        measure('serialize arb _toXml', lambda: create._toXml('ARBCreateSubscriptionRequest'), iterations),
+        measure('serialize cim _toXml (10 profiles)', lambda: profile._toXml('createCustomerProfileRequest'), iterations),
+    ]
+
+def parsing(gateway, iterations):
+    aim = gateway.aim(transaction('localhost')._toPost('AUTH_ONLY'))
+    arb = gateway.xml(recurring('localhost')._toXml('ARBCreateSubscriptionRequest'))
+    cim = gateway.xml(customer('localhost', 1)._toXml('createCustomerProfileRequest'))
+    def aim_result():
+        result = TransactionResult(aim)
+        return result.code, result.transaction_id, result.amount, result.hash
+    return [
+        measure('parse TransactionResult', aim_result, iterations),
+        measure('parse RecurringResult', lambda: RecurringResult(arb), iterations),
+        measure('parse CustomerResult (%d ids)' % max(1, gateway.size), lambda: CustomerResult(cim), iterations),
+    ]
+
+def threaded(name, calls, concurrency):
+    """Run calls on `concurrency` worker threads, timing each one."""
+    pending = Queue.Queue()
+    for call in calls:
+        pending.put(call)
+    timings = []
+    def work():
+        while True:
+            try:
+                call = pending.get_nowait()
+            except Queue.Empty:
+                return
+            before = time.time()
+            call()
+            timings.append(time.time() - before)
+    workers = [threading.Thread(target=work) for i in xrange(concurrency)]
+    started = time.time()
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+    return summary(name, timings, time.time() - started, concurrency=concurrency)
+
+class _StubClient(aio.AsyncAuthorizeNet):
+    secure = False
+
+def nonblocking(host, requests, concurrency):
+    """Keep `concurrency` AIM authorizations in flight on a single Loop."""
+    address, port = host.split(':')
+    client = type('StubClient', (_StubClient,), {'port': int(port)})
+    loop = aio.Loop()
+    timings = []
+    remaining = [requests]
+    def submit():
+        remaining[0] -= 1
+        trans = transaction(host)
+        trans.conn = client(address, '/gateway/transact.dll', 'application/x-www-form-urlencoded', loop)
+        started = time.time()
+        def done(future):
+            future.result()
+            timings.append(time.time() - started)
+            if remaining[0] > 0:
+                submit()
+        trans.conn.send(trans._toPost('AUTH_ONLY'), 'AUTH_ONLY').then(TransactionResult).add_done_callback(done)
+    started = time.time()
+    for i in xrange(min(concurrency, requests)):
+        submit()
+    loop.run()
+    return summary('round trip aim (select loop)', timings, time.time() - started, concurrency=concurrency)
+
+def round_trips(gateway, requests, levels):
+    results = []
+    for concurrency in levels:
+        calls = [transaction(gateway.host).authorize for i in xrange(requests)]
+        results.append(threaded('round trip aim authorize', calls, concurrency))
+        results.append(nonblocking(gateway.host, requests, concurrency))
+        calls = [recurring(gateway.host).create for i in xrange(requests)]
+        results.append(threaded('round trip arb create', calls, concurrency))
+        calls = [customer(gateway.host, 1).create for i in xrange(requests)]
+        results.append(threaded('round trip cim create', calls, concurrency))
+    return results
+
+def main():
+    parser = optparse.OptionParser()
+    parser.add_option('-o', '--output', help='write results as JSON to this file')
+    parser.add_option('--latency', type='float', default=0.005, help='stub gateway latency in seconds')
+    parser.add_option('--size', type='int', default=0, help='stub response size (see stub.py)')
+    parser.add_option('--iterations', type='int', default=20000)
+    parser.add_option('--requests', type='int', default=1000)
+    parser.add_option('--concurrency', default='1,4,16,64', help='comma separated concurrency levels')
+    parser.add_option('--quick', action='store_true', help='a short run for smoke testing')
+    options, args = parser.parse_args()
+    if options.quick:
+        options.iterations = 1000
+        options.requests = 100
+    levels = [int(level) for level in options.concurrency.split(',')]
+    gateway = StubGateway(latency=options.latency, size=options.size).start()
+    gateway.install(max(levels))
+    results = serialization(options.iterations)
+    results.extend(parsing(gateway, options.iterations))
+    results.extend(round_trips(gateway, options.requests, levels))
+    close_pools()
+    gateway.stop()
+
+    for result in results:
+        print '%-40s %5s %10.0f ops/s  p50 %8.3f ms  p99 %8.3f ms' % (
+            result['name'], result.get('concurrency', ''), result['ops_per_sec'], result['p50_ms'], result['p99_ms'])
+    if options.output:
+        report = {
+            'timestamp': datetime.datetime.utcnow().isoformat() + 'Z',
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'stub': {'latency': options.latency, 'size': options.size},
+            'results': results,
+        }
+        output = open(options.output, 'w')
+        try:
+            json.dump(report, output, indent=2, sort_keys=True)
+        finally:
+            output.close()
+
+if __name__ == '__main__':
+    main()
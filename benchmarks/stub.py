@@ -0,0 +1,422 @@
+#!/usr/bin/env python
+"""A local stand-in for the Authorize.net gateway.
+
+Speaks the AIM delimited protocol on /gateway/transact.dll and the XML API
+on /xml/v1/request.api over plain HTTP/1.1 with keep-alive. Every response
+can be delayed by a fixed latency, and padded (AIM description field) or
+lengthened (CIM id lists) to exercise larger payloads. With a capacity,
+requests beyond that many in flight at once get a 503, the way a
+throttling gateway answers. With compress, gzip or deflate request bodies
+are accepted and responses compressed for clients that ask for it.
+H2StubGateway serves the same over cleartext HTTP/2 (needs h2), every
+stream on a connection answered concurrently.
+
+    gateway = StubGateway(latency=0.02).start()
+    gateway.install()
+    trans = Transaction(gateway.host, 'login', 'key')
+
+or standalone:
+
+    python benchmarks/stub.py --port 8080 --latency 0.05
+"""
+
+import BaseHTTPServer
+import SocketServer
+import collections
+import httplib
+import itertools
+import re
+import socket
+import threading
+import time
+import urlparse
+
+from pythorizenet import generate_hash
+from pythorizenet.compression import GZIP, DEFLATE, Body, compress
+from pythorizenet.pool import ConnectionPool, set_pool
+from pythorizenet.transport import set_transport
+
+AIM_PATH = '/gateway/transact.dll'
+XML_PATH = '/xml/v1/request.api'
+XMLNS = 'AnetApi/xml/v1/schema/AnetApiSchema.xsd'
+
+_root = re.compile(r'<([A-Za-z]+)[\s>/]')
+_profile_id = re.compile(r'<customerProfileId>(\d+)</customerProfileId>')
+_payment_profile_id = re.compile(r'<customerPaymentProfileId>(\d+)</customerPaymentProfileId>')
+_card = ('<payment><creditCard><cardNumber>XXXX1111</cardNumber>'
+    '<expirationDate>XXXX</expirationDate></creditCard></payment>')
+_ids = itertools.count(2000000000)
+
+class StubPool(ConnectionPool):
+    """A ConnectionPool that talks plain HTTP to the stub."""
+    def _connect(self):
+        return httplib.HTTPConnection(self.host)
+
+class _Handler(BaseHTTPServer.BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    # Buffer each response into a single write; it is flushed after every
+    # request.
+    wbufsize = -1
+
+    def do_POST(self):
+        gateway = self.server.gateway
+        if self.headers.getheader('transfer-encoding', '').lower() == 'chunked':
+            body = self._read_chunked()
+        else:
+            body = self.rfile.read(int(self.headers.getheader('content-length', 0)))
+        body = gateway.decode(body, self.headers.getheader('content-encoding'))
+        gateway.bodies.append(body)
+        if not gateway.enter():
+            self.send_error(503)
+            return
+        try:
+            self._respond(gateway, body)
+        finally:
+            gateway.leave()
+
+    def _respond(self, gateway, body):
+        if self.path == AIM_PATH:
+            response, mime = gateway.aim(body), 'text/plain'
+        elif self.path == XML_PATH:
+            response, mime = gateway.xml(body), 'text/xml'
+        else:
+            self.send_error(404)
+            return
+        response, encoding = gateway.encode(response, self.headers.getheader('accept-encoding'))
+        if gateway.latency:
+            time.sleep(gateway.latency)
+        self.send_response(200)
+        self.send_header('Content-Type', mime)
+        if encoding is not None:
+            self.send_header('Content-Encoding', encoding)
+        self.send_header('Content-Length', str(len(response)))
+        self.end_headers()
+        self.wfile.write(response)
+
+    def _read_chunked(self):
+        chunks = []
+        while True:
+            size = int(self.rfile.readline().split(';')[0], 16)
+            if not size:
+                break
+            chunks.append(self.rfile.read(size))
+            self.rfile.readline()
+        while self.rfile.readline() not in ('\r\n', '\n', ''):
+            pass
+        return ''.join(chunks)
+
+    def log_message(self, *args):
+        pass
+
+class _Server(SocketServer.ThreadingMixIn, BaseHTTPServer.HTTPServer):
+    daemon_threads = True
+    request_queue_size = 1024
+
+class StubGateway(object):
+    def __init__(self, address='127.0.0.1', port=0, latency=0, size=0, salt='', capacity=None, compress=False):
+        self.latency = latency
+        self.size = size
+        self.salt = salt
+        self.capacity = capacity
+        self.compress = compress
+        self.active = 0
+        self.throttled = 0
+        # Request and response body bytes as they went over the wire.
+        self.bytes_in = 0
+        self.bytes_out = 0
+        self.lock = threading.Lock()
+        self.server = self._server(address, port)
+        self.server.gateway = self
+        self.host = '%s:%d' % self.server.server_address
+        self.thread = None
+        # The last few request bodies, for checking what was sent.
+        self.bodies = collections.deque(maxlen=16)
+
+    def _server(self, address, port):
+        return _Server((address, port), _Handler)
+
+    def start(self):
+        self.thread = threading.Thread(target=self.server.serve_forever)
+        self.thread.daemon = True
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+        # Give handler threads a moment to see their clients hang up.
+        time.sleep(0.1)
+
+    def enter(self):
+        """Count a request in, or return False if it is over capacity."""
+        self.lock.acquire()
+        try:
+            if self.capacity is not None and self.active >= self.capacity:
+                self.throttled += 1
+                return False
+            self.active += 1
+            return True
+        finally:
+            self.lock.release()
+
+    def leave(self):
+        self.lock.acquire()
+        try:
+            self.active -= 1
+        finally:
+            self.lock.release()
+
+    def decode(self, body, encoding):
+        """A request body with its Content-Encoding undone."""
+        self._count('bytes_in', len(body))
+        if encoding is None:
+            return body
+        decoded = Body(encoding)
+        decoded.add(body)
+        return decoded.finish()
+
+    def encode(self, response, accept):
+        """(response, Content-Encoding) for a client sending accept as its
+        Accept-Encoding."""
+        encoding = None
+        if self.compress and accept:
+            accepted = [name.split(';')[0].strip() for name in accept.lower().split(',')]
+            for name in (GZIP, DEFLATE):
+                if name in accepted:
+                    response, encoding = compress(response, name), name
+                    break
+        self._count('bytes_out', len(response))
+        return response, encoding
+
+    def _count(self, name, size):
+        self.lock.acquire()
+        try:
+            setattr(self, name, getattr(self, name) + size)
+        finally:
+            self.lock.release()
+
+    def install(self, max_size=64):
+        """Route every client for self.host to this stub over plain HTTP."""
+        set_pool(self.host, StubPool(self.host, max_size))
+
+    def aim(self, body):
+        post = dict((name, values[0]) for name, values in urlparse.parse_qs(body).items())
+        delim = post.get('x_delim_char', '|')
+        amount = post.get('x_amount', '')
+        trans_id = post.get('x_trans_id') or str(_ids.next())
+        code, reason = '1', 'This transaction has been approved.'
+        if amount.endswith('.02'):
+            code, reason = '2', 'This transaction has been declined.'
+        if post.get('x_test_request') == 'YES':
+            reason = '(TESTMODE) ' + reason
+        fields = [''] * 55
+        fields[0] = code
+        fields[1] = '1'
+        fields[2] = '1'
+        fields[3] = reason
+        fields[4] = 'STUB01'
+        fields[5] = 'Y'
+        fields[6] = trans_id
+        fields[8] = 'x' * self.size
+        fields[9] = amount
+        fields[10] = 'CC'
+        fields[11] = post.get('x_type', '').lower()
+        fields[13] = post.get('x_first_name', '')
+        fields[14] = post.get('x_last_name', '')
+        fields[37] = generate_hash(self.salt, post.get('x_login', ''), trans_id, amount)
+        fields[38] = 'M'
+        fields[50] = 'XXXX' + post.get('x_card_num', '')[-4:]
+        return delim.join(fields)
+
+    def xml(self, body):
+        match = _root.search(body.split('?>', 1)[-1])
+        requestType = match and match.group(1) or 'ErrorRequest'
+        responseType = requestType.replace('Request', 'Response')
+        ids = []
+        if requestType == 'ARBCreateSubscriptionRequest':
+            ids.append('<subscriptionId>%d</subscriptionId>' % _ids.next())
+        elif requestType == 'createCustomerProfileRequest':
+            ids.append('<customerProfileId>%d</customerProfileId>' % _ids.next())
+            ids.append('<customerPaymentProfileIdList>')
+            ids.extend(['<numericString>%d</numericString>' % _ids.next() for i in xrange(max(1, self.size))])
+            ids.append('</customerPaymentProfileIdList><customerShippingAddressIdList/>')
+        elif requestType == 'createCustomerPaymentProfileRequest':
+            ids.append('<customerPaymentProfileId>%d</customerPaymentProfileId>' % _ids.next())
+        elif requestType == 'createCustomerShippingAddressRequest':
+            ids.append('<customerAddressId>%d</customerAddressId>' % _ids.next())
+        elif requestType == 'getCustomerProfileRequest':
+            ids.append('<profile><merchantCustomerId>stub</merchantCustomerId>')
+            ids.append('<customerProfileId>%s</customerProfileId>' % _profile_id.search(body).group(1))
+            for i in xrange(max(1, self.size)):
+                ids.append('<paymentProfiles><customerPaymentProfileId>%d</customerPaymentProfileId>%s</paymentProfiles>' % (
+                    _ids.next(), _card))
+            ids.append('</profile>')
+        elif requestType == 'getCustomerPaymentProfileRequest':
+            ids.append('<paymentProfile><customerPaymentProfileId>%s</customerPaymentProfileId>%s</paymentProfile>' % (
+                _payment_profile_id.search(body).group(1), _card))
+        return ''.join([
+            '<?xml version="1.0" encoding="utf-8"?>',
+            '<%s xmlns:xsi="http://www.w3.org/2001/XMLSchema-instance" '
+            'xmlns:xsd="http://www.w3.org/2001/XMLSchema" xmlns="%s">' % (responseType, XMLNS),
+            '<messages><resultCode>Ok</resultCode>',
+            '<message><code>I00001</code><text>Successful.</text></message></messages>',
+        ] + ids + ['</%s>' % responseType])
+
+class _H2Handler(SocketServer.BaseRequestHandler):
+    def setup(self):
+        import h2.config, h2.connection, h2.events, h2.settings
+        self.events = h2.events
+        self.settings = h2.settings
+        self.conn = h2.connection.H2Connection(h2.config.H2Configuration(client_side=False, header_encoding=None))
+        self.lock = threading.Lock()
+        self.requests = {}
+        # stream ID -> response data still waiting for flow control window
+        self.pending = {}
+
+    def handle(self):
+        gateway = self.server.gateway
+        events = self.events
+        self.request.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        self.lock.acquire()
+        try:
+            self.conn.initiate_connection()
+            self.conn.update_settings({self.settings.SettingCodes.MAX_CONCURRENT_STREAMS: gateway.max_streams})
+            self._flush()
+        finally:
+            self.lock.release()
+        while True:
+            try:
+                data = self.request.recv(65536)
+            except socket.error:
+                return
+            if not data:
+                return
+            self.lock.acquire()
+            try:
+                for event in self.conn.receive_data(data):
+                    if isinstance(event, events.RequestReceived):
+                        self.requests[event.stream_id] = [dict(event.headers), []]
+                    elif isinstance(event, events.DataReceived):
+                        self.conn.acknowledge_received_data(event.flow_controlled_length, event.stream_id)
+                        self.requests[event.stream_id][1].append(event.data)
+                    elif isinstance(event, events.StreamEnded):
+                        headers, chunks = self.requests.pop(event.stream_id)
+                        self._dispatch(event.stream_id, headers, ''.join(chunks))
+                    elif isinstance(event, events.StreamReset):
+                        self.requests.pop(event.stream_id, None)
+                        self.pending.pop(event.stream_id, None)
+                    elif isinstance(event, events.WindowUpdated):
+                        for stream_id in list(self.pending):
+                            self._send(stream_id, self.pending.pop(stream_id))
+                self._flush()
+            finally:
+                self.lock.release()
+
+    def _dispatch(self, stream_id, headers, body):
+        gateway = self.server.gateway
+        path = headers[':path']
+        body = gateway.decode(body, headers.get('content-encoding'))
+        gateway.bodies.append(body)
+        if not gateway.enter():
+            self._respond(stream_id, 503, 'text/plain', 'Too many requests')
+            return
+        if path == AIM_PATH:
+            response, mime = gateway.aim(body), 'text/plain'
+        elif path == XML_PATH:
+            response, mime = gateway.xml(body), 'text/xml'
+        else:
+            gateway.leave()
+            self._respond(stream_id, 404, 'text/plain', 'Not found')
+            return
+        response, encoding = gateway.encode(response, headers.get('accept-encoding'))
+        def respond():
+            gateway.leave()
+            self.lock.acquire()
+            try:
+                self._respond(stream_id, 200, mime, response, encoding)
+                self._flush()
+            finally:
+                self.lock.release()
+        if gateway.latency:
+            timer = threading.Timer(gateway.latency, respond)
+            timer.daemon = True
+            timer.start()
+        else:
+            gateway.leave()
+            self._respond(stream_id, 200, mime, response, encoding)
+
+    def _respond(self, stream_id, status, mime, response, encoding=None):
+        headers = [(':status', str(status)), ('content-type', mime)]
+        if encoding is not None:
+            headers.append(('content-encoding', encoding))
+        headers.append(('content-length', str(len(response))))
+        try:
+            self.conn.send_headers(stream_id, headers)
+        except Exception:
+            # The client reset the stream or went away.
+            return
+        self._send(stream_id, response)
+
+    def _send(self, stream_id, data):
+        try:
+            while data:
+                size = min(len(data), self.conn.local_flow_control_window(stream_id), self.conn.max_outbound_frame_size)
+                if size <= 0:
+                    self.pending[stream_id] = data
+                    return
+                self.conn.send_data(stream_id, data[:size])
+                data = data[size:]
+            self.conn.end_stream(stream_id)
+        except Exception:
+            self.pending.pop(stream_id, None)
+
+    def _flush(self):
+        data = self.conn.data_to_send()
+        if data:
+            try:
+                self.request.sendall(data)
+            except socket.error:
+                pass
+
+class _H2Server(SocketServer.ThreadingMixIn, SocketServer.TCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+    request_queue_size = 1024
+
+class H2StubGateway(StubGateway):
+    """The stub gateway over cleartext HTTP/2 with prior knowledge."""
+    def __init__(self, address='127.0.0.1', port=0, latency=0, size=0, salt='', capacity=None, max_streams=1000,
+            compress=False):
+        self.max_streams = max_streams
+        StubGateway.__init__(self, address, port, latency, size, salt, capacity, compress)
+
+    def _server(self, address, port):
+        return _H2Server((address, port), _H2Handler)
+
+    def install(self, max_size=64):
+        """Route every client for self.host to this stub over HTTP/2."""
+        from pythorizenet.http2 import HTTP2Transport
+        set_transport(self.host, HTTP2Transport(self.host, secure=False))
+
+def main():
+    import optparse
+    parser = optparse.OptionParser()
+    parser.add_option('--address', default='127.0.0.1')
+    parser.add_option('--port', type='int', default=8080)
+    parser.add_option('--latency', type='float', default=0, help='seconds to delay each response')
+    parser.add_option('--size', type='int', default=0, help='AIM description padding / CIM id list length')
+    parser.add_option('--salt', default='', help='MD5 hash salt for AIM responses')
+    parser.add_option('--capacity', type='int', default=None, help='answer 503 beyond this many requests in flight')
+    parser.add_option('--http2', action='store_true', help='speak cleartext HTTP/2 instead of HTTP/1.1')
+    parser.add_option('--compress', action='store_true', help='gzip or deflate responses for clients that ask')
+    options, args = parser.parse_args()
+    factory = StubGateway
+    if options.http2:
+        factory = H2StubGateway
+    gateway = factory(options.address, options.port, options.latency, options.size, options.salt, options.capacity,
+        compress=options.compress)
+    print 'Stub gateway listening on %s' % gateway.host
+    gateway.server.serve_forever()
+
+if __name__ == '__main__':
+    main()
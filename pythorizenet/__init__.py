@@ -1,5 +1,15 @@
-import lxml
 import httplib
+import socket
+import sys
+import time
+
+from pythorizenet.pool import (ConnectionPool, get_pool, set_pool, close_pools, warm_up,
+    default_ssl_context, set_ssl_context)
+from pythorizenet.retry import (RetryPolicy, CircuitBreaker, CircuitOpen, get_breaker, set_breaker,
+    is_stale, deadline_exceeded, NO_RETRY, STAGE_CONNECT, STAGE_SEND, STAGE_WAIT, STAGE_READ)
+
+# audit, compression, limits, metrics and transport are imported where they
+# are first needed, so that importing the package stays cheap.
 
 try:
     from hashlib import md5
@@ -14,6 +24,8 @@ DISCOVER = 'Discover'
 MASTERCARD = 'MasterCard'
 VISA = 'Visa'
 UNKNOWN_CARD_TYPE = 'Unknown'
+DEFAULT_CONNECT_TIMEOUT = 10
+DEFAULT_READ_TIMEOUT = 60
 
 def identify_card_type(card_num):
     card_len = len(card_num)
@@ -34,25 +46,238 @@ def identify_card_type(card_num):
         card_type = VISA
     return card_type
 
+def luhn_valid(card_num):
+    """True if card_num is all digits and passes the Luhn checksum."""
+    if not card_num or not card_num.isdigit():
+        return False
+    total = 0
+    for index, digit in enumerate(reversed(card_num)):
+        digit = int(digit)
+        if index % 2:
+            digit *= 2
+            if digit > 9:
+                digit -= 9
+        total += digit
+    return total % 10 == 0
+
 def generate_hash(*args):
     """generate_hash(hash_key, trans_id, amount)"""
-    m = md5()
-    map(m.update, args)
-    return m.hexdigest().upper()
+    return md5(''.join(args)).hexdigest().upper()
+
+def _loaded(name):
+    """pythorizenet.<name> if it has been imported, else None. Observers and
+    audit sinks can only be added through their modules, so until those are
+    imported there is nothing to report to."""
+    return sys.modules.get('pythorizenet.' + name)
 
 class AuthorizeNet(object):
-    def __init__(self, host, path, mime):
+    """Sends requests to one gateway host over its shared transport.
+
+    connect_timeout bounds the TCP connect and TLS handshake, read_timeout
+    each wait for the gateway, and timeout (if set) the whole call,
+    retries included; send() also takes an absolute deadline. Failures
+    that are safe to retry are retried according to retry, and every call
+    goes through the host's circuit breaker. Unless a limiter is given,
+    each attempt waits first for the one registered for login on host at
+    the time of the call, if any (see pythorizenet.limits).
+
+    The transport is the host's (see pythorizenet.transport) unless one is
+    given; a pool given instead gets a PooledTransport of its own.
+    Compression is off until set_compression() is called."""
+    connect_timeout = DEFAULT_CONNECT_TIMEOUT
+    read_timeout = DEFAULT_READ_TIMEOUT
+    timeout = None
+    accept_encoding = None
+    request_encoding = None
+    compress_threshold = None
+
+    def __init__(self, host, path, mime, pool=None, retry=None, breaker=None, login=None, limiter=None,
+            transport=None):
         self.host = host
         self.path = path
         self.mime = mime
+        if transport is None:
+            from pythorizenet.transport import PooledTransport, get_transport
+            if pool is not None:
+                transport = PooledTransport(host, pool)
+            else:
+                transport = get_transport(host)
+        self.transport = transport
+        if retry is None:
+            retry = RetryPolicy()
+        self.retry = retry
+        if breaker is None:
+            breaker = get_breaker(host)
+        self.breaker = breaker
+        self.login = login
+        self.limiter = limiter
+
+    def set_timeouts(self, connect=None, read=None, total=None):
+        if connect is not None:
+            self.connect_timeout = connect
+        if read is not None:
+            self.read_timeout = read
+        if total is not None:
+            self.timeout = total
+
+    def set_transport(self, transport):
+        self.transport = transport
+
+    def set_compression(self, accept=True, request=None, threshold=None):
+        """Ask for gzip or deflate responses if accept, and send request
+        bodies of threshold bytes or more compressed with request (GZIP or
+        DEFLATE), for endpoints that take a Content-Encoding."""
+        from pythorizenet import compression
+        self.accept_encoding = None
+        if accept:
+            self.accept_encoding = compression.ACCEPT_ENCODING
+        self.request_encoding = request
+        if threshold is not None:
+            self.compress_threshold = threshold
+        elif self.compress_threshold is None:
+            self.compress_threshold = compression.DEFAULT_THRESHOLD
+
+    def _encode(self, data):
+        """(data as it goes on the wire, extra request headers)"""
+        headers = []
+        if self.accept_encoding is not None:
+            headers.append(('accept-encoding', self.accept_encoding))
+        encoding = self.request_encoding
+        if encoding is not None and not (isinstance(data, str) and len(data) < self.compress_threshold):
+            from pythorizenet.compression import compress
+            data = compress(data, encoding)
+            headers.append(('content-encoding', encoding))
+        return data, headers
+
+    def warm_up(self, count):
+        """Open count connections now; see ConnectionPool.warm_up."""
+        return self.transport.warm_up(count, self.connect_timeout)
 
-    def send(self, data):
-        conn = httplib.HTTPSConnection(self.host)
-        conn.putrequest('POST', self.path)
-        conn.putheader('content-type', self.mime)
-        conn.putheader('content-length', len(data))
-        conn.endheaders()
-        conn.send(data)
+    def _send(self, data, timing, deadline, feed):
+        data, headers = self._encode(data)
+        fresh = False
+        attempt = 1
+        limiter = self.limiter
+        if limiter is None and self.login is not None:
+            # Looked up per call so set_limiter() applies to clients that
+            # already exist; none can be registered before limits is imported.
+            limits = _loaded('limits')
+            if limits is not None:
+                limiter = limits.get_limiter(self.login, self.host)
+        while True:
+            if limiter is not None:
+                waited = limiter.acquire(deadline)
+                if timing is not None:
+                    timing.queue = (timing.queue or 0.0) + waited
+                started = time.time()
+            if not fresh:
+                try:
+                    self.breaker.allow()
+                except:
+                    if limiter is not None:
+                        limiter.release()
+                    raise
+            progress = [STAGE_CONNECT, None, False]
+            try:
+                status, body = self.transport.request(self, data, deadline, timing, progress, fresh, headers, feed)
+            except (httplib.HTTPException, socket.error), e:
+                reused = progress[2]
+                # The gateway hanging up on an idle socket says nothing
+                # about its health, and nor does the caller's deadline
+                # running out.
+                stale = is_stale(e, progress[0], reused)
+                blameless = stale or deadline_exceeded(e, deadline)
+                if limiter is not None:
+                    if blameless:
+                        limiter.release()
+                    else:
+                        limiter.failure(started)
+                if blameless:
+                    self.breaker.release()
+                else:
+                    self.breaker.failure()
+                if not self.retry.retryable(e, progress[0], reused):
+                    raise
+                if not stale:
+                    # A fresh connection replacing a stale one is not a retry.
+                    if attempt >= self.retry.attempts:
+                        raise
+                    delay = self.retry.delay(attempt)
+                    if deadline is not None and time.time() + delay >= deadline:
+                        raise
+                    time.sleep(delay)
+                    attempt += 1
+                fresh = stale
+                continue
+            except:
+                if limiter is not None:
+                    limiter.release()
+                self.breaker.failure()
+                raise
+            if limiter is not None:
+                limiter.success(started, status)
+            self.breaker.success()
+            return body
 
-        response = conn.getresponse()
-        return response.read()
+    def send(self, data, request_type=None, deadline=None, feed=None):
+        """POST data, a string or an iterable of string chunks sent with
+        chunked transfer encoding, and return the response body. An
+        iterable must yield the same chunks again if the call is retried.
+        If feed is given, e.g. ResponseParser.feed, each piece of the body is
+        passed to it as it is read instead of being kept, and send() returns
+        None."""
+        if deadline is None and self.timeout is not None:
+            deadline = time.time() + self.timeout
+        metrics, audit = _loaded('metrics'), _loaded('audit')
+        observers = metrics is not None and metrics.observers
+        sinks = audit is not None and audit.sinks
+        if not observers and not sinks:
+            return self._send(data, None, deadline, feed)
+        started = time.time()
+        pieces = None
+        if feed is not None and sinks:
+            # Audit sinks need the whole response after all.
+            pieces = []
+            def feed(piece, feed=feed):
+                pieces.append(piece)
+                feed(piece)
+        head = None
+        if feed is not None and observers:
+            # Count the body as it goes by and keep enough of its start for
+            # the result code.
+            head = [0, '']
+            def feed(piece, feed=feed):
+                head[0] += len(piece)
+                if len(head[1]) < 2048:
+                    head[1] += piece[:2048 - len(head[1])]
+                feed(piece)
+        timing = None
+        if observers:
+            size = None
+            if isinstance(data, str):
+                size = len(data)
+            timing = metrics.RequestTiming(self.host, self.path, request_type, size)
+        try:
+            body = self._send(data, timing, deadline, feed)
+        except Exception, e:
+            if timing is not None:
+                timing.error = e
+                timing.finish()
+                metrics.notify(timing)
+            if sinks:
+                audit.record(self.host, self.path, request_type, data, None, e, started)
+            raise
+        if timing is not None:
+            if body is not None:
+                timing.response_size = len(body)
+                timing.result_code = metrics.result_code(body)
+            elif head is not None:
+                timing.response_size, timing.result_code = head[0], metrics.result_code(head[1])
+            timing.finish()
+            metrics.notify(timing)
+        if sinks:
+            response = body
+            if pieces is not None:
+                response = ''.join(pieces)
+            audit.record(self.host, self.path, request_type, data, response, None, started)
+        return body
@@ -1,188 +1,393 @@
-#!/usr/bin/env python
-
-from pythorizenet import AuthorizeNet, identify_card_type, TYPE_CREDIT
-import httplib, urllib
-
-FIELD_DELIM = '|'
-RESPONSE_CODES = {
-    '1': 'approved',
-    '2': 'declined',
-    '3': 'error',
-    '4': 'held for review'
-}
-TESTING_PREFIX = '(TESTMODE) '
-HOST_PROD = 'secure2.authorize.net'
-HOST_TEST = 'secure2.authorize.net'
-
-class TransactionResult(object):
-    def __init__(self, data, delim=FIELD_DELIM):
-        fields = data.split(delim)
-        self.code = int(fields[0])
-        self.type = RESPONSE_CODES[fields[0]]
-        self.subcode = int(fields[2])
-        self.reason = fields[3]
-        if self.reason.startswith(TESTING_PREFIX):
-            self.test = True
-            self.reason = self.reason.replace(TESTING_PREFIX, '')
-        else:
-            self.test = False
-        self.approval = fields[4]
-        self.transaction_id = fields[6]
-        self.amount = fields[9]
-        self.hash = fields[37]
-        self.card_type = None
-
-    def validate(self, login, salt):
-        value = ''.join([salt, login, self.transaction_id, self.amount])
-        return self.hash.upper() == md5(value).hexdigest().upper()
-
-class Transaction(object):
-    def __init__(self, host, login, key):
-        self.conn = AuthorizeNet(host, '/gateway/transact.dll', 'application/x-www-form-urlencoded')
-        self.login = login
-        self.key = key
-        self.delimiter = FIELD_DELIM
-        self.amount = None
-        self.payment = None
-        self.customer = None
-        self.is_test = False
-        self.require_ccv = False
-        self.require_avs = False
-        self.duplicate_window = None
-
-    def set_amount(self, amount):
-        if not isinstance(amount, str):
-            raise Exception('You must provide the amount as a string!')
-        self.amount = amount
-
-    def set_credit(self, card_num, card_exp, card_code=None):
-        if not isinstance(card_exp, (tuple, list)):
-            raise Exception('card_exp must be a tuple or list!')
-        if len(card_exp) != 2:
-            raise Exception('card_exp must contain two items (year and month)!')
-        if len(card_exp[0]) != 4:
-            raise Exception('First item of card_exp must be year as YYYY!')
-        if len(card_exp[1]) == 1:
-            card_exp[1] = '0' + card_exp[1]
-        elif len(card_exp[1]) > 2:
-            raise Exception('Second item of card_exp must be month as MM!')
-        self.payment = (TYPE_CREDIT, card_num, tuple(card_exp), card_code)
-
-    def set_customer(self, first_name, last_name, company=None, address=None, city=None, state=None, zip=None, ip=None):
-        self.customer = (first_name, last_name, company, address, city, state, zip, ip)
-
-    def set_transaction_id(self, id):
-        self.trans_id = id
-
-    def set_is_test(self, is_test=False):
-        self.is_test = is_test
-
-    def set_require_ccv(self, require_ccv=False):
-        self.require_ccv = require_ccv
-
-    def set_require_avs(self, require_avs=False):
-        self.require_avs = require_avs
-
-    def set_duplicate_window(self, duplicate_window=None):
-        self.duplicate_window = duplicate_window
-
-    def _toPost(self, requestType):
-        post = {
-            'x_login': self.login,
-            'x_tran_key': self.key,
-            'x_version': '3.1',
-            'x_type': requestType,
-            'x_recurring_billing': 'NO',
-            'x_delim_data': 'TRUE',
-            'x_delim_char': self.delimiter,
-            'x_relay_response': 'FALSE',
-        }
-        if self.amount:
-            post['x_amount'] = self.amount
-        if self.payment:
-            if self.payment[0] == TYPE_CREDIT:
-                post['x_method'] = 'CC'
-            type, card_num, exp_date, ccv = self.payment
-            post.update(
-                {
-                    'x_card_num': card_num,
-                    'x_exp_date': '%s-%s' % exp_date
-                }
-            )
-            if self.require_ccv:
-                if not ccv:
-                    raise Exception('CCV required by options but not provided!')
-                post['x_card_code'] = ccv
-        if self.is_test:
-            post['x_test_request'] = 'YES'
-        if self.duplicate_window is not None:
-            post['x_duplicate_window'] = str(self.duplicate_window)
-        if requestType in ('CREDIT', 'PRIOR_AUTH_CAPTURE', 'VOID'):
-            if not self.trans_id:
-                raise Exception('You must provide a trans_id for %s transactions!' % requestType)
-            post['x_trans_id'] = self.trans_id
-        if self.customer:
-            (first_name, last_name, company, address, city, state, zip, ip) = self.customer
-            post['x_first_name'] = first_name
-            post['x_last_name'] = last_name
-            if self.require_avs:
-                if not (address and city and state and zip):
-                    raise Exception('AVS required by options but no customer data provided!')
-                if company:
-                    post['x_company'] = company
-                if address:
-                    post['x_address'] = address
-                if city:
-                    post['x_city'] = city
-                if state:
-                    post['x_state'] = state
-                if zip:
-                    post['x_zip'] = zip
-                if ip:
-                    post['x_customer_ip'] = ip
-        for name, value in post.items():
-            post[name] = value.encode('utf-8')
-        return urllib.urlencode(post)
-
-    def _fromPost(self, data):
-        return TransactionResult(data, self.delimiter)
-
-    def authorize(self):
-        data = self._toPost('AUTH_ONLY')
-        response = self.conn.send(data)
-        return self._fromPost(response)
-
-    def capture(self):
-        data = self._toPost('PRIOR_AUTH_CAPTURE')
-        response = self.conn.send(data)
-        return self._fromPost(response)
-
-    def auth_capture(self):
-        data = self._toPost('AUTH_CAPTURE')
-        response = self.conn.send(data)
-        return self._fromPost(response)
-
-    def credit(self):
-        pass
-
-    def void(self):
-        data = self._toPost('VOID')
-        response = self.conn.send(data)
-        return self._fromPost(response)
-
-if __name__ == '__main__':
-    import sys
-    if len(sys.argv) != 3:
-        print 'You must provide your login and trans id as parameters!'
-        sys.exit()
-    import pdb; pdb.set_trace()
-    trans = Transaction(HOST_PROD, sys.argv[1], sys.argv[2])
-    trans.set_is_test(True)
-    trans.set_amount('1.00')
-    trans.set_credit('4222222222222', ('2010', '03'))
-    trans.set_customer('john', u'Bolidenv\xe4gen')
-    result = trans.authorize()
-    void = Transaction(HOST_PROD, sys.argv[1], sys.argv[2])
-    void.set_transaction_id(result.transaction_id)
-    result = void.void()
-    
+#!/usr/bin/env python
+
+from pythorizenet import AuthorizeNet, identify_card_type, md5, TYPE_CREDIT
+import array, httplib, urllib
+
+try:
+    from hmac import compare_digest
+except ImportError:
+    def compare_digest(a, b):
+        if len(a) != len(b):
+            return False
+        result = 0
+        for x, y in zip(a, b):
+            result |= ord(x) ^ ord(y)
+        return result == 0
+
+FIELD_DELIM = '|'
+RESPONSE_CODES = {
+    '1': 'approved',
+    '2': 'declined',
+    '3': 'error',
+    '4': 'held for review'
+}
+TESTING_PREFIX = '(TESTMODE) '
+HOST_PROD = 'secure2.authorize.net'
+HOST_TEST = 'secure2.authorize.net'
+# The gateway's duplicate window when x_duplicate_window is not sent.
+DEFAULT_DUPLICATE_WINDOW = 120
+
+# Positions of the standard AIM response fields. 41-50 are reserved by
+# the gateway.
+FIELDS = (
+    'response_code', 'response_subcode', 'reason_code', 'reason_text',
+    'approval', 'avs_response', 'transaction_id', 'invoice_number',
+    'description', 'amount', 'method', 'transaction_type', 'customer_id',
+    'first_name', 'last_name', 'company', 'address', 'city', 'state', 'zip',
+    'country', 'phone', 'fax', 'email', 'ship_to_first_name',
+    'ship_to_last_name', 'ship_to_company', 'ship_to_address', 'ship_to_city',
+    'ship_to_state', 'ship_to_zip', 'ship_to_country', 'tax', 'duty',
+    'freight', 'tax_exempt', 'po_number', 'hash', 'card_code_response',
+    'cavv_response', None, None, None, None, None, None, None, None, None,
+    None, 'account_number', 'gateway_card_type', 'split_tender_id',
+    'requested_amount', 'balance_on_card',
+)
+
+class _Field(object):
+    def __init__(self, index):
+        self.index = index
+
+    def __get__(self, result, cls):
+        if result is None:
+            return self
+        return result.field(self.index)
+
+class TransactionResult(object):
+    """A delimited AIM response.
+
+    Only the offset of each field is recorded up front; fields are sliced
+    out of the original response the first time they are read."""
+    __slots__ = ('data', 'delim', 'offsets', 'card_type')
+
+    def __init__(self, data, delim=FIELD_DELIM):
+        self.data = data
+        self.delim = delim
+        offsets = array.array('I', [0])
+        step = len(delim)
+        pos = data.find(delim)
+        while pos != -1:
+            offsets.append(pos + step)
+            pos = data.find(delim, pos + step)
+        self.offsets = offsets
+        # Set by the caller if it wants it; the gateway's own is
+        # gateway_card_type.
+        self.card_type = None
+        if self.field(0) not in RESPONSE_CODES:
+            raise Exception('Unexpected AIM response code %r!' % self.field(0))
+
+    def field(self, index):
+        """Return the raw value of the field at (0-based) index."""
+        offsets = self.offsets
+        count = len(offsets)
+        if index >= count:
+            return ''
+        if index + 1 < count:
+            return self.data[offsets[index]:offsets[index + 1] - len(self.delim)]
+        return self.data[offsets[index]:]
+
+    def fields(self):
+        """Return a dict of every named field."""
+        return dict((name, self.field(index)) for index, name in enumerate(FIELDS) if name)
+
+    @property
+    def code(self):
+        return int(self.field(0))
+
+    @property
+    def type(self):
+        return RESPONSE_CODES[self.field(0)]
+
+    @property
+    def subcode(self):
+        return int(self.field(2))
+
+    @property
+    def reason(self):
+        reason = self.field(3)
+        if reason.startswith(TESTING_PREFIX):
+            reason = reason.replace(TESTING_PREFIX, '')
+        return reason
+
+    @property
+    def test(self):
+        return self.field(3).startswith(TESTING_PREFIX)
+
+    def validate(self, login, salt):
+        return HashVerifier(login, salt).verify(self)
+
+for index, name in enumerate(FIELDS):
+    if name and not hasattr(TransactionResult, name):
+        setattr(TransactionResult, name, _Field(index))
+del index, name
+
+class HashVerifier(object):
+    """Checks the MD5 hash of AIM responses for one merchant.
+
+    The hash covers salt + login + transaction_id + amount. MD5 consumes its
+    input in 64 byte blocks, so every whole block of the constant salt +
+    login prefix is digested once here and the saved state copied for each
+    response; shorter prefixes are cheaper to rehash than to copy."""
+    def __init__(self, login, salt):
+        prefix = salt + login
+        whole = len(prefix) - len(prefix) % 64
+        self.state = None
+        if whole:
+            self.state = md5(prefix[:whole])
+        self.prefix = prefix[whole:]
+
+    def hash(self, trans_id, amount):
+        if self.state is None:
+            return md5(self.prefix + trans_id + amount).hexdigest().upper()
+        m = self.state.copy()
+        m.update(self.prefix + trans_id + amount)
+        return m.hexdigest().upper()
+
+    def verify(self, result):
+        field = result.field
+        received = field(37)
+        expected = self.hash(field(6), field(9))
+        # In constant time, so a forger learns nothing from how long a wrong
+        # hash took to turn down.
+        return compare_digest(received.upper(), expected)
+
+    def verify_all(self, results):
+        """Return a list of True/False, one per result."""
+        verify = self.verify
+        return [verify(result) for result in results]
+
+    def mismatches(self, results):
+        """Yield (index, result, expected hash) for each result that fails."""
+        hash = self.hash
+        for index, result in enumerate(results):
+            field = result.field
+            received = field(37)
+            expected = hash(field(6), field(9))
+            if not compare_digest(received.upper(), expected):
+                yield index, result, expected
+
+def _encode(value):
+    if isinstance(value, unicode):
+        return value.encode('utf-8')
+    return value
+
+class _Request(object):
+    """Setters and the per-transaction form fields shared by Transaction and
+    MerchantTransaction."""
+    __slots__ = ()
+
+    def set_amount(self, amount):
+        if not isinstance(amount, str):
+            raise Exception('You must provide the amount as a string!')
+        self.amount = amount
+
+    def set_credit(self, card_num, card_exp, card_code=None):
+        if not isinstance(card_exp, (tuple, list)):
+            raise Exception('card_exp must be a tuple or list!')
+        if len(card_exp) != 2:
+            raise Exception('card_exp must contain two items (year and month)!')
+        if len(card_exp[0]) != 4:
+            raise Exception('First item of card_exp must be year as YYYY!')
+        if len(card_exp[1]) == 1:
+            card_exp[1] = '0' + card_exp[1]
+        elif len(card_exp[1]) > 2:
+            raise Exception('Second item of card_exp must be month as MM!')
+        self.payment = (TYPE_CREDIT, card_num, tuple(card_exp), card_code)
+
+    def set_customer(self, first_name, last_name, company=None, address=None, city=None, state=None, zip=None, ip=None):
+        self.customer = (first_name, last_name, company, address, city, state, zip, ip)
+
+    def set_transaction_id(self, id):
+        self.trans_id = id
+
+    def set_require_ccv(self, require_ccv=False):
+        self.require_ccv = require_ccv
+
+    def set_require_avs(self, require_avs=False):
+        self.require_avs = require_avs
+
+    def _fields(self, requestType):
+        """The (name, value) pairs that change from one request to the next."""
+        post = [('x_type', requestType)]
+        if self.amount:
+            post.append(('x_amount', self.amount))
+        if self.payment:
+            type, card_num, exp_date, ccv = self.payment
+            if type == TYPE_CREDIT:
+                post.append(('x_method', 'CC'))
+            post.append(('x_card_num', _encode(card_num)))
+            post.append(('x_exp_date', '%s-%s' % exp_date))
+            if self.require_ccv:
+                if not ccv:
+                    raise Exception('CCV required by options but not provided!')
+                post.append(('x_card_code', _encode(ccv)))
+        if requestType in ('CREDIT', 'PRIOR_AUTH_CAPTURE', 'VOID'):
+            if not self.trans_id:
+                raise Exception('You must provide a trans_id for %s transactions!' % requestType)
+            post.append(('x_trans_id', _encode(self.trans_id)))
+        if self.customer:
+            (first_name, last_name, company, address, city, state, zip, ip) = self.customer
+            post.append(('x_first_name', _encode(first_name)))
+            post.append(('x_last_name', _encode(last_name)))
+            if self.require_avs:
+                if not (address and city and state and zip):
+                    raise Exception('AVS required by options but no customer data provided!')
+                if company:
+                    post.append(('x_company', _encode(company)))
+                if address:
+                    post.append(('x_address', _encode(address)))
+                if city:
+                    post.append(('x_city', _encode(city)))
+                if state:
+                    post.append(('x_state', _encode(state)))
+                if zip:
+                    post.append(('x_zip', _encode(zip)))
+                if ip:
+                    post.append(('x_customer_ip', _encode(ip)))
+        return post
+
+    def _fromPost(self, data):
+        return TransactionResult(data, self.delimiter)
+
+    def _duplicate_check(self, requestType):
+        """(fingerprint, window) to check requestType against the duplicate
+        cache with, or None if there is nothing to check."""
+        window = self.duplicate_window
+        if window is None:
+            window = DEFAULT_DUPLICATE_WINDOW
+        if self.duplicate_cache is None or not int(window):
+            return None
+        return self.duplicate_cache.fingerprint(self, requestType), int(window)
+
+    def _send(self, requestType):
+        data = self._toPost(requestType)
+        check = self._duplicate_check(requestType)
+        if check is None:
+            return self._fromPost(self.conn.send(data, requestType))
+        key, window = check
+        return self.duplicate_cache.submit(key, window,
+            lambda: self._fromPost(self.conn.send(data, requestType)))
+
+    def authorize(self):
+        return self._send('AUTH_ONLY')
+
+    def capture(self):
+        return self._send('PRIOR_AUTH_CAPTURE')
+
+    def auth_capture(self):
+        return self._send('AUTH_CAPTURE')
+
+    def credit(self):
+        pass
+
+    def void(self):
+        return self._send('VOID')
+
+def _static_fields(login, key, delimiter, is_test, duplicate_window):
+    post = [
+        ('x_login', _encode(login)),
+        ('x_tran_key', _encode(key)),
+        ('x_version', '3.1'),
+        ('x_recurring_billing', 'NO'),
+        ('x_delim_data', 'TRUE'),
+        ('x_delim_char', delimiter),
+        ('x_relay_response', 'FALSE'),
+    ]
+    if is_test:
+        post.append(('x_test_request', 'YES'))
+    if duplicate_window is not None:
+        post.append(('x_duplicate_window', str(duplicate_window)))
+    return post
+
+class Transaction(_Request):
+    def __init__(self, host, login, key):
+        self.conn = AuthorizeNet(host, '/gateway/transact.dll', 'application/x-www-form-urlencoded', login=login)
+        self.login = login
+        self.key = key
+        self.delimiter = FIELD_DELIM
+        self.amount = None
+        self.payment = None
+        self.customer = None
+        self.trans_id = None
+        self.is_test = False
+        self.require_ccv = False
+        self.require_avs = False
+        self.duplicate_window = None
+        self.duplicate_cache = None
+
+    def set_is_test(self, is_test=False):
+        self.is_test = is_test
+
+    def set_duplicate_window(self, duplicate_window=None):
+        self.duplicate_window = duplicate_window
+
+    def set_duplicate_cache(self, duplicate_cache=None):
+        self.duplicate_cache = duplicate_cache
+
+    def _toPost(self, requestType):
+        post = _static_fields(self.login, self.key, self.delimiter, self.is_test, self.duplicate_window)
+        return urllib.urlencode(post + self._fields(requestType))
+
+class Merchant(object):
+    """Long-lived settings for one merchant account.
+
+    The constant part of every AIM form body (credentials, version, delimiter,
+    test mode and duplicate window) is encoded once, and every transaction
+    made with transaction() shares the one AuthorizeNet transport:
+
+        merchant = Merchant(HOST_PROD, login, key)
+        trans = merchant.transaction()
+        trans.set_amount('10.00')
+        trans.set_credit(card_num, ('2030', '12'))
+        result = trans.auth_capture()
+    """
+    def __init__(self, host, login, key, delimiter=FIELD_DELIM, is_test=False, duplicate_window=None, duplicate_cache=None):
+        self.conn = AuthorizeNet(host, '/gateway/transact.dll', 'application/x-www-form-urlencoded', login=login)
+        self.login = login
+        self.key = key
+        self.delimiter = delimiter
+        self.is_test = is_test
+        self.duplicate_window = duplicate_window
+        self.duplicate_cache = duplicate_cache
+        self.prefix = urllib.urlencode(_static_fields(login, key, delimiter, is_test, duplicate_window)) + '&'
+
+    def transaction(self):
+        return MerchantTransaction(self)
+
+class MerchantTransaction(_Request):
+    """A Transaction for a Merchant; only the fields that vary are stored."""
+    __slots__ = ('merchant', 'amount', 'payment', 'customer', 'trans_id', 'require_ccv', 'require_avs')
+
+    def __init__(self, merchant):
+        self.merchant = merchant
+        self.amount = None
+        self.payment = None
+        self.customer = None
+        self.trans_id = None
+        self.require_ccv = False
+        self.require_avs = False
+
+    conn = property(lambda self: self.merchant.conn)
+    login = property(lambda self: self.merchant.login)
+    delimiter = property(lambda self: self.merchant.delimiter)
+    duplicate_window = property(lambda self: self.merchant.duplicate_window)
+    duplicate_cache = property(lambda self: self.merchant.duplicate_cache)
+
+    def _toPost(self, requestType):
+        return self.merchant.prefix + urllib.urlencode(self._fields(requestType))
+
+if __name__ == '__main__':
+    import sys
+    if len(sys.argv) != 3:
+        print 'You must provide your login and trans id as parameters!'
+        sys.exit()
+    import pdb; pdb.set_trace()
+    trans = Transaction(HOST_PROD, sys.argv[1], sys.argv[2])
+    trans.set_is_test(True)
+    trans.set_amount('1.00')
+    trans.set_credit('4222222222222', ('2010', '03'))
+    trans.set_customer('john', u'Bolidenv\xe4gen')
+    result = trans.authorize()
+    void = Transaction(HOST_PROD, sys.argv[1], sys.argv[2])
+    void.set_transaction_id(result.transaction_id)
+    result = void.void()
+    
@@ -0,0 +1,403 @@
+"""Non-blocking clients for the AIM, ARB and CIM APIs.
+
+Operations return a Future immediately; a single Loop drives every request
+in flight with select() until they complete:
+
+    loop = Loop()
+    futures = []
+    for trans_id in trans_ids:
+        trans = AsyncTransaction(HOST_PROD, login, key, loop)
+        trans.set_transaction_id(trans_id)
+        futures.append(trans.capture())
+    loop.run()
+    results = [future.result() for future in futures]
+"""
+
+import errno
+import httplib
+import select
+import socket
+import ssl
+import time
+from cStringIO import StringIO
+
+from pythorizenet import audit, metrics, DEFAULT_CONNECT_TIMEOUT, DEFAULT_READ_TIMEOUT
+from pythorizenet.aim import Transaction
+from pythorizenet.arb import Recurring
+from pythorizenet.cim import Customer
+from pythorizenet.pool import default_ssl_context
+
+STATE_CONNECTING = 'connecting'
+STATE_HANDSHAKE = 'handshake'
+STATE_WRITING = 'writing'
+STATE_READING = 'reading'
+STATE_DONE = 'done'
+
+WANT_READ = 'read'
+WANT_WRITE = 'write'
+
+READ_SIZE = 65536
+WRITE_SIZE = 16384
+
+class Future(object):
+    def __init__(self):
+        self.done = False
+        self.value = None
+        self.error = None
+        self.callbacks = []
+
+    def set_result(self, value):
+        self.done = True
+        self.value = value
+        self._fire()
+
+    def set_exception(self, error):
+        self.done = True
+        self.error = error
+        self._fire()
+
+    def _fire(self):
+        callbacks, self.callbacks = self.callbacks, []
+        for callback in callbacks:
+            callback(self)
+
+    def add_done_callback(self, callback):
+        if self.done:
+            callback(self)
+        else:
+            self.callbacks.append(callback)
+
+    def result(self):
+        if not self.done:
+            raise Exception('Future is not done yet, run the loop first!')
+        if self.error is not None:
+            raise self.error
+        return self.value
+
+    def then(self, func):
+        """Return a Future for func(result) of this one."""
+        chained = Future()
+        def callback(future):
+            if future.error is not None:
+                chained.set_exception(future.error)
+                return
+            try:
+                value = func(future.value)
+            except Exception, e:
+                chained.set_exception(e)
+            else:
+                chained.set_result(value)
+        self.add_done_callback(callback)
+        return chained
+
+class _FakeSocket(object):
+    def __init__(self, data):
+        self.data = data
+
+    def makefile(self, *args, **kwargs):
+        return StringIO(self.data)
+
+class AsyncRequest(Future):
+    """A single POST driven through connect, TLS handshake, write and read."""
+    def __init__(self, client, data, deadline=None, timing=None, request_type=None):
+        Future.__init__(self)
+        self.client = client
+        self.data = data
+        self.deadline = deadline
+        self.timing = timing
+        self.request_type = request_type
+        self.started = self.mark = time.time()
+        self.request = ''.join([
+            'POST %s HTTP/1.1\r\n' % client.path,
+            'Host: %s\r\n' % client.host,
+            'Content-Type: %s\r\n' % client.mime,
+            'Content-Length: %d\r\n' % len(data),
+            'Connection: close\r\n',
+            '\r\n',
+            data,
+        ])
+        self.offset = 0
+        self.chunks = []
+        self.sock = None
+        self.state = STATE_CONNECTING
+        self.want = WANT_WRITE
+
+    def _phase(self, phase):
+        if self.timing is not None:
+            now = time.time()
+            setattr(self.timing, phase, now - self.mark)
+            self.mark = now
+
+    def _finish(self, body=None, error=None):
+        if audit.sinks:
+            client = self.client
+            audit.record(client.host, client.path, self.request_type, self.data, body, error, self.started)
+        timing = self.timing
+        if timing is None:
+            return
+        if error is not None:
+            timing.error = error
+        else:
+            timing.response_size = len(body)
+            timing.result_code = metrics.result_code(body)
+        timing.finish()
+        metrics.notify(timing)
+
+    def start(self):
+        # Name resolution is still blocking; everything after it is not.
+        family, socktype, proto, canonname, address = socket.getaddrinfo(
+            self.client.host, self.client.port, 0, socket.SOCK_STREAM)[0]
+        self.sock = socket.socket(family, socktype, proto)
+        self.sock.setblocking(0)
+        err = self.sock.connect_ex(address)
+        if err not in (0, errno.EINPROGRESS, errno.EWOULDBLOCK):
+            raise socket.error(err, errno.errorcode.get(err, 'connect failed'))
+
+    def fileno(self):
+        return self.sock.fileno()
+
+    def step(self):
+        try:
+            if self.state == STATE_CONNECTING:
+                self._connected()
+            elif self.state == STATE_HANDSHAKE:
+                self._handshake()
+            elif self.state == STATE_WRITING:
+                self._write()
+            elif self.state == STATE_READING:
+                self._read()
+        except ssl.SSLWantReadError:
+            self.want = WANT_READ
+        except ssl.SSLWantWriteError:
+            self.want = WANT_WRITE
+        except Exception, e:
+            self.fail(e)
+
+    def _connected(self):
+        err = self.sock.getsockopt(socket.SOL_SOCKET, socket.SO_ERROR)
+        if err:
+            raise socket.error(err, errno.errorcode.get(err, 'connect failed'))
+        self._phase('connect')
+        if self.client.secure:
+            self.sock = self.client.ssl_context.wrap_socket(self.sock,
+                server_hostname=self.client.host, do_handshake_on_connect=False)
+            self.state = STATE_HANDSHAKE
+            self._handshake()
+        else:
+            self.state = STATE_WRITING
+            self._write()
+
+    def _handshake(self):
+        self.sock.do_handshake()
+        self._phase('tls')
+        self.state = STATE_WRITING
+        self.want = WANT_WRITE
+        self._write()
+
+    def _write(self):
+        while self.offset < len(self.request):
+            try:
+                sent = self.sock.send(self.request[self.offset:self.offset + WRITE_SIZE])
+            except socket.error, e:
+                if e.args[0] in (errno.EAGAIN, errno.EWOULDBLOCK):
+                    self.want = WANT_WRITE
+                    return
+                raise
+            self.offset += sent
+        self._phase('upload')
+        self.state = STATE_READING
+        self.want = WANT_READ
+        self._read()
+
+    def _read(self):
+        # Drain everything available, including bytes already decrypted and
+        # buffered by the SSL layer that select() cannot see.
+        while True:
+            try:
+                chunk = self.sock.recv(READ_SIZE)
+            except socket.error, e:
+                if e.args[0] in (errno.EAGAIN, errno.EWOULDBLOCK):
+                    self.want = WANT_READ
+                    return
+                raise
+            if not chunk:
+                break
+            if not self.chunks:
+                self._phase('wait')
+            self.chunks.append(chunk)
+        self._close()
+        response = httplib.HTTPResponse(_FakeSocket(''.join(self.chunks)))
+        response.begin()
+        body = response.read()
+        self.chunks = []
+        self._phase('download')
+        self.state = STATE_DONE
+        self._finish(body)
+        self.set_result(body)
+
+    def _close(self):
+        if self.sock is not None:
+            self.sock.close()
+
+    def fail(self, error):
+        self._close()
+        self.state = STATE_DONE
+        self._finish(error=error)
+        self.set_exception(error)
+
+class Loop(object):
+    """select()-driven loop that owns every AsyncRequest in flight."""
+    def __init__(self):
+        self.pending = []
+
+    def add(self, request):
+        try:
+            request.start()
+        except Exception, e:
+            request.fail(e)
+            return request
+        self.pending.append(request)
+        return request
+
+    def run_once(self, timeout=None):
+        readers = [r for r in self.pending if r.want == WANT_READ]
+        writers = [r for r in self.pending if r.want == WANT_WRITE]
+        deadlines = [r.deadline for r in self.pending if r.deadline is not None]
+        if deadlines:
+            wait = max(0, min(deadlines) - time.time())
+            if timeout is None or wait < timeout:
+                timeout = wait
+        try:
+            readable, writable, errored = select.select(readers, writers, [], timeout)
+        except select.error, e:
+            if e.args[0] == errno.EINTR:
+                return
+            raise
+        for request in set(readable + writable):
+            request.step()
+        now = time.time()
+        for request in self.pending:
+            if request.state != STATE_DONE and request.deadline is not None and now >= request.deadline:
+                request.fail(socket.timeout('Gateway request timed out while %s' % request.state))
+        self.pending = [r for r in self.pending if r.state != STATE_DONE]
+
+    def run(self):
+        while self.pending:
+            self.run_once()
+
+default_loop = Loop()
+
+class AsyncAuthorizeNet(object):
+    """Sends requests through a Loop. Each fails with socket.timeout unless
+    it completes within timeout seconds, by default as long as the
+    blocking client allows for connecting and waiting for the gateway."""
+    port = 443
+    secure = True
+
+    def __init__(self, host, path, mime, loop=None, timeout=None):
+        self.host = host
+        self.path = path
+        self.mime = mime
+        if loop is None:
+            loop = default_loop
+        self.loop = loop
+        if timeout is None:
+            timeout = DEFAULT_CONNECT_TIMEOUT + DEFAULT_READ_TIMEOUT
+        self.timeout = timeout
+        self.ssl_context = None
+        if self.secure:
+            self.ssl_context = default_ssl_context()
+
+    def send(self, data, request_type=None):
+        deadline = None
+        if self.timeout is not None:
+            deadline = time.time() + self.timeout
+        timing = None
+        if metrics.observers:
+            timing = metrics.RequestTiming(self.host, self.path, request_type, len(data))
+        return self.loop.add(AsyncRequest(self, data, deadline, timing, request_type))
+
+class AsyncTransaction(Transaction):
+    def __init__(self, host, login, key, loop=None, timeout=None):
+        Transaction.__init__(self, host, login, key)
+        self.conn = AsyncAuthorizeNet(host, self.conn.path, self.conn.mime, loop, timeout)
+
+    def _send(self, requestType):
+        data = self._toPost(requestType)
+        check = self._duplicate_check(requestType)
+        if check is None:
+            return self.conn.send(data, requestType).then(self._fromPost)
+        key, window = check
+        return self.duplicate_cache.submit_async(key, window,
+            lambda: self.conn.send(data, requestType).then(self._fromPost), Future())
+
+    def authorize(self):
+        return self._send('AUTH_ONLY')
+
+    def capture(self):
+        return self._send('PRIOR_AUTH_CAPTURE')
+
+    def auth_capture(self):
+        return self._send('AUTH_CAPTURE')
+
+    def void(self):
+        return self._send('VOID')
+
+class AsyncRecurring(Recurring):
+    def __init__(self, host, login, key, loop=None, timeout=None):
+        Recurring.__init__(self, host, login, key)
+        self.conn = AsyncAuthorizeNet(host, self.conn.path, self.conn.mime, loop, timeout)
+
+    def _send(self, requestType):
+        return self.conn.send(self._toXml(requestType), requestType).then(self._fromXml)
+
+    def create(self):
+        return self._send('ARBCreateSubscriptionRequest')
+
+    def update(self):
+        return self._send('ARBUpdateSubscriptionRequest')
+
+    def cancel(self):
+        return self._send('ARBCancelSubscriptionRequest')
+
+class AsyncCustomer(Customer):
+    """Customer with Futures for results. get() and getPayment() are served
+    from and fill the profile cache as Customer's do, and creations drop
+    the cached profile they change once they complete."""
+    def __init__(self, host, login, key, loop=None, timeout=None):
+        Customer.__init__(self, host, login, key)
+        self.conn = AsyncAuthorizeNet(host, self.conn.path, self.conn.mime, loop, timeout)
+
+    def _send(self, requestType):
+        return self.conn.send(self._toXml(requestType), requestType).then(self._fromXml)
+
+    def _lookup(self, requestType, payment_profile_id=None):
+        result = self._cached(payment_profile_id)
+        if result is not None:
+            future = Future()
+            future.set_result(result)
+            return future
+        profile_id = self.profile_id
+        return self._send(requestType).then(
+            lambda result: self._store(profile_id, payment_profile_id, result))
+
+    def _invalidating(self, requestType):
+        profile_id = self.profile_id
+        future = self._send(requestType)
+        future.add_done_callback(lambda future: self._invalidate(profile_id))
+        return future
+
+    def create(self):
+        def invalidate(result):
+            self._invalidate(result.profile_id)
+            return result
+        return self._send('createCustomerProfileRequest').then(invalidate)
+
+    def createPayment(self):
+        return self._invalidating('createCustomerPaymentProfileRequest')
+
+    def createShipping(self):
+        return self._invalidating('createCustomerShippingAddressRequest')
+
+    def createTransaction(self):
+        return self._send('createCustomerProfileTransactionRequest')
@@ -1,6 +1,7 @@
 import datetime
-from lxml import etree
 from pythorizenet import AuthorizeNet, TYPE_CREDIT
+from pythorizenet.parser import MESSAGES, ResponseParser, parse
+from pythorizenet.template import Template, text, opt, group, ADDRESS, address_values
 
 UNIT_MONTH = 'months'
 UNIT_DAYS = 'days'
@@ -12,21 +13,63 @@ HOST_TEST = 'apitest.authorize.net'
 PATH = '/xml/v1/request.api'
 ANET_XMLNS = 'AnetApi/xml/v1/schema/AnetApiSchema.xsd'
 
+SUBSCRIPTION = [
+    group('merchantAuthentication', [
+        text('name', 'login'),
+        text('transactionKey', 'key'),
+    ]),
+    opt('subscriptionId', 'subscriptionId'),
+    group('subscription', [
+        group('paymentSchedule', [
+            group('interval', [
+                text('length', 'length'),
+                text('unit', 'unit'),
+            ]),
+            text('startDate', 'startDate'),
+            opt('trialOccurrences', 'trialOccurrences'),
+            text('totalOccurrences', 'totalOccurrences'),
+        ], when='schedule'),
+        opt('amount', 'amount'),
+        opt('trialAmount', 'trialAmount'),
+        group('payment', [
+            group('creditCard', [
+                text('cardNumber', 'cardNumber'),
+                text('expirationDate', 'expirationDate'),
+            ]),
+        ], when='payment'),
+        group('billTo', ADDRESS, when='billTo'),
+    ], when='subscription'),
+]
+
+TEMPLATES = dict((requestType, Template(requestType, ANET_XMLNS, SUBSCRIPTION)) for requestType in (
+    'ARBCreateSubscriptionRequest',
+    'ARBUpdateSubscriptionRequest',
+    'ARBCancelSubscriptionRequest',
+))
+
+RESULT_FIELDS = dict(MESSAGES)
+RESULT_FIELDS[('subscriptionId',)] = 'subscriptionId'
+
 class RecurringResult(object):
+    """data is a response body, or a ResponseParser for RESULT_FIELDS
+    that has been fed one."""
     def __init__(self, data):
-        root = etree.XML(data)
-        messages = root.find('messages')
-        self.resultCode = messages.find('resultCode').text
-        self.code = messages.find('message/code').text
-        self.reason = messages.find('message/text').text
+        if isinstance(data, ResponseParser):
+            root, values = data.close()
+        else:
+            root, values = parse(data, RESULT_FIELDS)
+        if 'resultCode' not in values:
+            raise Exception('No result code in %s response!' % root)
+        self.resultCode = values['resultCode']
+        self.code = values.get('code')
+        self.reason = values.get('text')
         self.subscription_id = None
-        subscription_id = root.find('subscriptionId')
-        if root.tag == 'ARBCreateSubscriptionResponse' and subscription_id is not None:
-            self.subscription_id = subscription_id.text
+        if root == 'ARBCreateSubscriptionResponse':
+            self.subscription_id = values.get('subscriptionId')
 
 class Recurring(object):
     def __init__(self, host, login, key):
-        self.conn = AuthorizeNet(host, PATH, 'text/xml')
+        self.conn = AuthorizeNet(host, PATH, 'text/xml', login=login)
         self.login = login
         self.key = key
         self.schedule = None
@@ -66,77 +109,60 @@ class Recurring(object):
     def set_subscription_id(self, subscription_id):
         self.subscription_id = subscription_id
 
-    def _toXml(self, requestType):
-        root = etree.Element(requestType, xmlns=ANET_XMLNS)
-        auth = etree.SubElement(root, "merchantAuthentication")
-        etree.SubElement(auth, "name").text = self.login
-        etree.SubElement(auth, "transactionKey").text = self.key
+    def _values(self, requestType):
+        values = {
+            'login': self.login,
+            'key': self.key,
+            'subscription': requestType != 'ARBCancelSubscriptionRequest',
+        }
         if self.subscription_id:
-            etree.SubElement(root, 'subscriptionId').text = str(self.subscription_id)
-        if requestType != 'ARBCancelSubscriptionRequest':
-            subscription = etree.SubElement(root, 'subscription')
-            if self.schedule:
-                (start, total, count, unit) = self.schedule
-                schedule = etree.SubElement(subscription, 'paymentSchedule')
-                interval = etree.SubElement(schedule, 'interval')
-                etree.SubElement(interval, 'length').text = str(count)
-                etree.SubElement(interval, 'unit').text = str(unit)
-                etree.SubElement(schedule, 'startDate').text = start.strftime('%Y-%m-%d')
-                if self.trial:
-                    total += self.trial[0]
-                    etree.SubElement(schedule, 'trialOccurrences').text = str(self.trial[0])
-                etree.SubElement(schedule, 'totalOccurrences').text = str(total)
-            if self.amount:
-                etree.SubElement(subscription, 'amount').text = str(self.amount)
+            values['subscriptionId'] = str(self.subscription_id)
+        if self.schedule:
+            (start, total, count, unit) = self.schedule
+            values['schedule'] = True
+            values['length'] = str(count)
+            values['unit'] = str(unit)
+            values['startDate'] = start.strftime('%Y-%m-%d')
             if self.trial:
-                etree.SubElement(subscription, 'trialAmount').text = str(self.trial[1])
-            if self.payment:
-                type = self.payment[0]
-                if type == TYPE_CREDIT:
-                    (card_num, card_exp) = self.payment[1]
-                    payment = etree.SubElement(subscription, 'payment')
-                    credit = etree.SubElement(payment, 'creditCard')
-                    etree.SubElement(credit, 'cardNumber').text = card_num
-                    etree.SubElement(credit, 'expirationDate').text = '%s-%s' % card_exp
-            if self.customer:
-                (first_name, last_name, company, address, city, state, zip, country) = self.customer
-                customer = etree.SubElement(subscription, 'billTo')
-                etree.SubElement(customer, 'firstName').text = first_name
-                etree.SubElement(customer, 'lastName').text = last_name
-                if company:
-                    etree.SubElement(customer, 'company').text = company
-                if address:
-                    etree.SubElement(customer, 'address').text = address
-                if city:
-                    etree.SubElement(customer, 'city').text = city
-                if state:
-                    etree.SubElement(customer, 'state').text = state
-                if zip:
-                    etree.SubElement(customer, 'zip').text = zip
-                if country:
-                    etree.SubElement(customer, 'country').text = country
-        return etree.tostring(root, xml_declaration=True, encoding='utf-8')
+                total += self.trial[0]
+                values['trialOccurrences'] = str(self.trial[0])
+            values['totalOccurrences'] = str(total)
+        if self.amount:
+            values['amount'] = str(self.amount)
+        if self.trial:
+            values['trialAmount'] = str(self.trial[1])
+        if self.payment:
+            type = self.payment[0]
+            if type == TYPE_CREDIT:
+                (card_num, card_exp) = self.payment[1]
+                values['payment'] = True
+                values['cardNumber'] = card_num
+                values['expirationDate'] = '%s-%s' % card_exp
+        if self.customer:
+            values['billTo'] = True
+            values.update(address_values(*self.customer))
+        return values
+
+    def _toXml(self, requestType):
+        return TEMPLATES[requestType].render(self._values(requestType))
 
     def _fromXml(self, response):
-        #TODO: investigate why etree will not parse this document when this namespace definition is intact.
-        # for now just remove it :-)
-        response = response.replace(ANET_XMLNS, '')
         return RecurringResult(response)
 
+    def _send(self, requestType):
+        xml = self._toXml(requestType)
+        parser = ResponseParser(RESULT_FIELDS)
+        self.conn.send(xml, requestType, feed=parser.feed)
+        return RecurringResult(parser)
+
     def create(self):
-        xml = self._toXml('ARBCreateSubscriptionRequest')
-        response = self.conn.send(xml)
-        return self._fromXml(response)
+        return self._send('ARBCreateSubscriptionRequest')
 
     def update(self):
-        xml = self._toXml('ARBUpdateSubscriptionRequest')
-        response = self.conn.send(xml)
-        return self._fromXml(response)
+        return self._send('ARBUpdateSubscriptionRequest')
 
     def cancel(self):
-        xml = self._toXml('ARBCancelSubscriptionRequest')
-        response = self.conn.send(xml)
-        return self._fromXml(response)
+        return self._send('ARBCancelSubscriptionRequest')
 
 if __name__ == '__main__':
     import sys
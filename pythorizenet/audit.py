@@ -0,0 +1,316 @@
+"""Write-behind audit log of every gateway exchange.
+
+    log = AuditLog('gateway.audit')
+    add_sink(log)
+    ...
+    for record in read('gateway.audit'):
+        print record.time, record.request_type, record.result().code
+
+With a sink registered, AuthorizeNet.send hands it each request and its
+response (or error) after the call returns, and AsyncAuthorizeNet once
+the request completes. record() only queues them; a
+background thread masks card numbers, card codes and transaction keys,
+encodes the records and appends them in batches, calling fsync once
+sync_bytes have been written or sync_interval seconds have passed since
+the first record that is not yet on disk. flush() waits until everything
+recorded so far is, and close() flushes and stops the thread. A record()
+caller only ever waits when queue_size records are already waiting to be
+written, so a stalled disk slows payments down instead of losing records.
+Write errors never fail a payment; they are raised from flush() and close(),
+and the log is cut back to its last whole record before the next append.
+
+Each record is length-prefixed and checksummed:
+
+    uint32 payload length, uint32 CRC-32 of payload
+    payload: float64 time, float64 elapsed, uint8 flags,
+             uint16 len(host), uint16 len(path), uint16 len(request_type),
+             uint32 len(request), uint32 len(response),
+             host, path, request_type, request, response
+
+all little-endian, after an 8 byte MAGIC at the start of the file. A record
+with FLAG_ERROR holds the error as `ExceptionName: message` in place of the
+response. Opening a log again drops a partly written last record left by a
+crash before appending.
+"""
+
+import os
+import Queue
+import re
+import struct
+import threading
+import time
+import urllib
+import zlib
+
+MAGIC = 'PNAUDIT1'
+FLAG_ERROR = 1
+DEFAULT_SYNC_BYTES = 1024 * 1024
+DEFAULT_SYNC_INTERVAL = 0.05
+DEFAULT_QUEUE_SIZE = 100000
+MAX_BATCH = 4096
+
+_HEADER = struct.Struct('<II')
+_FIXED = struct.Struct('<ddBHHHII')
+
+_CARD = re.compile(r'(x_card_num=|<cardNumber>)([^&<]*)')
+_SECRET = re.compile(r'(x_tran_key=|x_card_code=|<transactionKey>|<cardCode>)([^&<]*)')
+
+sinks = []
+
+_CLOSE = object()
+
+def add_sink(sink):
+    if sink not in sinks:
+        sinks.append(sink)
+
+def remove_sink(sink):
+    if sink in sinks:
+        sinks.remove(sink)
+
+def record(host, path, request_type, request, response, error, started):
+    for sink in list(sinks):
+        try:
+            sink.record(host, path, request_type, request, response, error, started)
+        except Exception:
+            # The payment has already gone through; never fail it here.
+            pass
+
+def _mask_card(match):
+    return match.group(1) + 'XXXX' + match.group(2)[-4:]
+
+def mask(data):
+    """data with card numbers cut to their last four digits and card codes
+    and transaction keys replaced."""
+    return _SECRET.sub(r'\1XXXX', _CARD.sub(_mask_card, data))
+
+def encode(when, elapsed, host, path, request_type, request, response, error=None):
+    flags = 0
+    if error is not None:
+        flags = FLAG_ERROR
+        response = '%s: %s' % (error.__class__.__name__, error)
+    request_type = request_type or ''
+    response = response or ''
+    payload = ''.join([
+        _FIXED.pack(when, elapsed, flags, len(host), len(path), len(request_type), len(request), len(response)),
+        host, path, request_type, request, response,
+    ])
+    return _HEADER.pack(len(payload), zlib.crc32(payload) & 0xffffffff) + payload
+
+class AuditRecord(object):
+    __slots__ = ('time', 'elapsed', 'host', 'path', 'request_type', 'request', 'response', 'error', 'offset')
+
+    def __init__(self, payload, offset):
+        when, elapsed, flags, host, path, request_type, request, response = _FIXED.unpack_from(payload)
+        self.time = when
+        self.elapsed = elapsed
+        self.offset = offset
+        pos = _FIXED.size
+        values = []
+        for length in (host, path, request_type, request, response):
+            values.append(payload[pos:pos + length])
+            pos += length
+        self.host, self.path, self.request_type, self.request, self.response = values
+        self.error = None
+        if flags & FLAG_ERROR:
+            self.error, self.response = self.response, None
+
+    def result(self):
+        """The response as a TransactionResult, RecurringResult or
+        CustomerResult, or None for a failed call."""
+        if self.response is None:
+            return None
+        if self.path == '/gateway/transact.dll':
+            from pythorizenet.aim import FIELD_DELIM, TransactionResult
+            match = re.search(r'(?:^|&)x_delim_char=([^&]*)', self.request)
+            delim = FIELD_DELIM
+            if match:
+                delim = urllib.unquote_plus(match.group(1))
+            return TransactionResult(self.response, delim)
+        if self.request_type.startswith('ARB'):
+            from pythorizenet.arb import RecurringResult
+            return RecurringResult(self.response)
+        from pythorizenet.cim import CustomerResult
+        return CustomerResult(self.response)
+
+def _records(source, offset):
+    """Yield (record payload, offset) until the end of the file or the first
+    record that is incomplete or fails its checksum."""
+    read = source.read
+    while True:
+        header = read(_HEADER.size)
+        if len(header) < _HEADER.size:
+            return
+        length, crc = _HEADER.unpack(header)
+        payload = read(length)
+        if len(payload) < length or zlib.crc32(payload) & 0xffffffff != crc:
+            return
+        yield payload, offset
+        offset += _HEADER.size + length
+
+def _open(path):
+    source = open(path, 'rb')
+    if source.read(len(MAGIC)) != MAGIC:
+        source.close()
+        raise Exception('%s is not an audit log!' % path)
+    return source
+
+def read(path):
+    """Yield every complete AuditRecord in the log at path, in order."""
+    source = _open(path)
+    try:
+        for payload, offset in _records(source, len(MAGIC)):
+            yield AuditRecord(payload, offset)
+    finally:
+        source.close()
+
+class AuditLog(object):
+    def __init__(self, path, sync_bytes=DEFAULT_SYNC_BYTES, sync_interval=DEFAULT_SYNC_INTERVAL,
+            queue_size=DEFAULT_QUEUE_SIZE, fsync=True):
+        self.path = path
+        self.sync_bytes = sync_bytes
+        self.sync_interval = sync_interval
+        self.fsync = fsync
+        self.queue = Queue.Queue(queue_size)
+        self.out = self._open()
+        self.lock = threading.Lock()
+        self.synced = threading.Condition(self.lock)
+        self.recorded = 0
+        self.durable = 0
+        self.syncs = 0
+        self.error = None
+        self.thread = threading.Thread(target=self._write)
+        self.thread.daemon = True
+        self.thread.start()
+
+    def _open(self):
+        if not os.path.exists(self.path) or os.path.getsize(self.path) == 0:
+            out = open(self.path, 'wb')
+            out.write(MAGIC)
+            return out
+        source = _open(self.path)
+        try:
+            end = len(MAGIC)
+            for payload, offset in _records(source, end):
+                end = offset + _HEADER.size + len(payload)
+        finally:
+            source.close()
+        out = open(self.path, 'r+b')
+        out.truncate(end)
+        out.seek(end)
+        return out
+
+    def record(self, host, path, request_type, request, response, error, started):
+        """Queue one exchange; request may be a string or re-iterable chunks."""
+        now = time.time()
+        self.lock.acquire()
+        try:
+            self.recorded += 1
+        finally:
+            self.lock.release()
+        self.queue.put((now, now - started, host, path, request_type, request, response, error))
+
+    def _encode(self, item):
+        when, elapsed, host, path, request_type, request, response, error = item
+        if not isinstance(request, str):
+            request = ''.join(request)
+        if response is not None:
+            response = mask(response)
+        return encode(when, elapsed, host, path, request_type, mask(request), response, error)
+
+    def _write(self):
+        queue = self.queue
+        pending = 0
+        pending_bytes = 0
+        first = None
+        closing = False
+        while not closing:
+            try:
+                if pending:
+                    item = queue.get(True, max(0.001, first + self.sync_interval - time.time()))
+                else:
+                    item = queue.get()
+            except Queue.Empty:
+                item = None
+            batch = []
+            while item is not None:
+                if item is _CLOSE:
+                    closing = True
+                    break
+                batch.append(item)
+                if len(batch) >= MAX_BATCH:
+                    break
+                try:
+                    item = queue.get_nowait()
+                except Queue.Empty:
+                    item = None
+            if batch:
+                if not pending:
+                    first = time.time()
+                chunks = []
+                for item in batch:
+                    try:
+                        chunks.append(self._encode(item))
+                    except Exception, e:
+                        self.error = e
+                data = ''.join(chunks)
+                try:
+                    self.out.write(data)
+                except Exception, e:
+                    self.error = e
+                    self._recover()
+                pending += len(batch)
+                pending_bytes += len(data)
+            if pending and (closing or pending_bytes >= self.sync_bytes or time.time() - first >= self.sync_interval):
+                self._sync(pending)
+                pending = 0
+                pending_bytes = 0
+
+    def _recover(self):
+        # Reopening cuts the log back to its last whole record. Appending
+        # after a partly written one would hide everything that follows
+        # from the next _open() and from read().
+        try:
+            self.out.close()
+        except Exception:
+            pass
+        try:
+            self.out = self._open()
+        except Exception, e:
+            self.error = e
+
+    def _sync(self, count):
+        try:
+            self.out.flush()
+            if self.fsync:
+                os.fsync(self.out.fileno())
+        except Exception, e:
+            self.error = e
+            self._recover()
+        self.lock.acquire()
+        try:
+            self.durable += count
+            self.syncs += 1
+            self.synced.notify_all()
+        finally:
+            self.lock.release()
+
+    def flush(self):
+        """Wait until everything recorded so far is on disk."""
+        self.lock.acquire()
+        try:
+            target = self.recorded
+            while self.durable < target and self.thread.is_alive():
+                self.synced.wait()
+        finally:
+            self.lock.release()
+        if self.error is not None:
+            raise self.error
+
+    def close(self):
+        if self.thread.is_alive():
+            self.queue.put(_CLOSE)
+            self.thread.join()
+        self.out.close()
+        remove_sink(self)
+        if self.error is not None:
+            raise self.error
@@ -0,0 +1,164 @@
+"""Run many prepared Transactions (or Recurring subscriptions) through a
+bounded pool of worker threads.
+
+    batch = Batch(transactions, operation='capture', concurrency=16)
+    for item in batch:
+        if item.error is not None:
+            ...
+        else:
+            item.result.code
+    print batch.stats.rate()
+
+Workers share the per-host connection pool, so give it at least
+`concurrency` idle slots (see pythorizenet.pool.set_pool) to keep every
+worker on a warm socket.
+"""
+
+import Queue
+import threading
+import time
+
+DEFAULT_CONCURRENCY = 8
+DEFAULT_WINDOW = 4
+OPERATIONS = ('authorize', 'capture', 'auth_capture', 'void', 'create', 'update', 'cancel')
+
+_DONE = object()
+
+class BatchItem(object):
+    __slots__ = ('index', 'transaction', 'operation', 'result', 'error', 'elapsed')
+
+    def __init__(self, index, transaction, operation):
+        self.index = index
+        self.transaction = transaction
+        self.operation = operation
+        self.result = None
+        self.error = None
+        self.elapsed = None
+
+class BatchStats(object):
+    def __init__(self):
+        self.started = None
+        self.finished = None
+        self.succeeded = 0
+        self.failed = 0
+
+    @property
+    def count(self):
+        return self.succeeded + self.failed
+
+    def elapsed(self):
+        if self.started is None:
+            return 0.0
+        return (self.finished or time.time()) - self.started
+
+    def rate(self):
+        """Completed transactions per second."""
+        elapsed = self.elapsed()
+        if not elapsed:
+            return 0.0
+        return self.count / elapsed
+
+class Batch(object):
+    """Iterate to run the batch; items come back in input order unless
+    ordered=False, in which case they come back as they complete.
+
+    items yields Transaction or Recurring objects, which run `operation`,
+    or (transaction, operation) pairs. A failing item carries its exception in
+    item.error and never aborts the rest of the batch. At most
+    concurrency * window items are buffered at any time, so arbitrarily long
+    iterables stream through in constant memory."""
+    def __init__(self, items, operation='capture', concurrency=DEFAULT_CONCURRENCY, ordered=True, window=DEFAULT_WINDOW):
+        if operation not in OPERATIONS:
+            raise Exception('Unknown batch operation %s!' % operation)
+        if concurrency < 1:
+            raise Exception('concurrency must be at least 1!')
+        self.items = items
+        self.operation = operation
+        self.concurrency = concurrency
+        self.ordered = ordered
+        self.slots = threading.Semaphore(concurrency * window)
+        self.inbox = Queue.Queue(concurrency)
+        self.outbox = Queue.Queue()
+        self.stats = BatchStats()
+        self.feed_error = None
+
+    def _feed(self):
+        try:
+            for index, item in enumerate(self.items):
+                if isinstance(item, (tuple, list)):
+                    transaction, operation = item
+                else:
+                    transaction, operation = item, self.operation
+                self.slots.acquire()
+                self.inbox.put(BatchItem(index, transaction, operation))
+        except Exception, e:
+            self.feed_error = e
+        for i in xrange(self.concurrency):
+            self.inbox.put(_DONE)
+
+    def _work(self):
+        while True:
+            item = self.inbox.get()
+            if item is _DONE:
+                self.outbox.put(_DONE)
+                return
+            started = time.time()
+            try:
+                if item.operation not in OPERATIONS:
+                    raise Exception('Unknown batch operation %s!' % item.operation)
+                item.result = getattr(item.transaction, item.operation)()
+            except Exception, e:
+                item.error = e
+            item.elapsed = time.time() - started
+            self.outbox.put(item)
+
+    def _start(self):
+        self.stats.started = time.time()
+        threads = [threading.Thread(target=self._feed)]
+        threads.extend([threading.Thread(target=self._work) for i in xrange(self.concurrency)])
+        for thread in threads:
+            thread.daemon = True
+            thread.start()
+
+    def _completed(self):
+        running = self.concurrency
+        while running:
+            item = self.outbox.get()
+            if item is _DONE:
+                running -= 1
+                continue
+            if item.error is None:
+                self.stats.succeeded += 1
+            else:
+                self.stats.failed += 1
+            yield item
+
+    def __iter__(self):
+        self._start()
+        if self.ordered:
+            completed = self._inOrder(self._completed())
+        else:
+            completed = self._completed()
+        for item in completed:
+            self.slots.release()
+            yield item
+        self.stats.finished = time.time()
+        if self.feed_error is not None:
+            raise self.feed_error
+
+    def _inOrder(self, completed):
+        waiting = {}
+        next_index = 0
+        for item in completed:
+            waiting[item.index] = item
+            while next_index in waiting:
+                yield waiting.pop(next_index)
+                next_index += 1
+
+    def run(self):
+        """Run the whole batch and return every item as a list."""
+        return list(self)
+
+def capture_all(transactions, concurrency=DEFAULT_CONCURRENCY):
+    """Capture prior authorizations, yielding items as they complete."""
+    return Batch(transactions, 'capture', concurrency, ordered=False)
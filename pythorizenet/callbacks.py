@@ -0,0 +1,234 @@
+"""Receive Silent Post and relay response callbacks from the gateway.
+
+    def handle(result):
+        if result.code == 1:
+            orders.paid(result.invoice_number, result.transaction_id)
+
+    receiver = CallbackReceiver(login, salt, handle, workers=4).start()
+    # a WSGI application, e.g. mounted at /authorize-net/silent-post
+    application = receiver
+
+Each callback's form body is parsed into a CallbackResult, which reads like
+the TransactionResult of the original request, and its MD5 hash is checked
+against salt + login + transaction ID + amount. Callbacks that pass are
+put on a bounded queue and handled on `workers` threads, so a web worker
+only waits for the handler when the queue is full, and then for at most
+put_timeout seconds: past that the callback is answered with a 503 rather
+than silently dropped. A bad hash gets a 403 and malformed bodies a 400.
+Anyone can post to the receiver, so the salt is required; only pass
+verify=False when something in front of it has already checked the hash.
+
+Servers that are not WSGI can call receive(body) with the raw form body
+and send back the status it returns.
+"""
+
+import Queue
+import threading
+import urllib
+
+from pythorizenet.aim import FIELDS, RESPONSE_CODES, TransactionResult, HashVerifier
+
+DEFAULT_QUEUE_SIZE = 10000
+DEFAULT_WORKERS = 1
+DEFAULT_PUT_TIMEOUT = 0.1
+MAX_BODY = 65536
+
+STATUS_OK = '200 OK'
+STATUS_MALFORMED = '400 Bad Request'
+STATUS_BAD_HASH = '403 Forbidden'
+STATUS_TOO_LARGE = '413 Request Entity Too Large'
+STATUS_BUSY = '503 Service Unavailable'
+
+# Callback form field -> position in an AIM response. The names differ
+# from FIELDS where the gateway's form names do.
+FORM_FIELDS = {
+    'x_response_code': 0,
+    'x_response_subcode': 1,
+    'x_response_reason_code': 2,
+    'x_response_reason_text': 3,
+    'x_auth_code': 4,
+    'x_avs_code': 5,
+    'x_trans_id': 6,
+    'x_invoice_num': 7,
+    'x_description': 8,
+    'x_amount': 9,
+    'x_method': 10,
+    'x_type': 11,
+    'x_cust_id': 12,
+    'x_po_num': 36,
+    'x_MD5_Hash': 37,
+    'x_md5_hash': 37,
+    'x_cvv2_resp_code': 38,
+    'x_cavv_response': 39,
+    'x_account_number': 50,
+    'x_card_type': 51,
+    'x_split_tender_id': 52,
+    'x_prepaid_requested_amount': 53,
+    'x_prepaid_balance_on_card': 54,
+}
+for index, name in enumerate(FIELDS):
+    if name and 13 <= index < 36:
+        FORM_FIELDS['x_' + name] = index
+del index, name
+
+_DONE = object()
+
+class CallbackResult(TransactionResult):
+    """A callback's form fields in the shape of a TransactionResult.
+
+    Form fields with no place in an AIM response (x_subscription_id,
+    merchant defined fields) are kept in `extra`."""
+    __slots__ = ('values', 'extra')
+
+    def __init__(self, body):
+        values = [''] * len(FIELDS)
+        extra = {}
+        index = FORM_FIELDS.get
+        unquote = urllib.unquote_plus
+        for pair in body.split('&'):
+            name, equals, value = pair.partition('=')
+            if not name:
+                continue
+            if '%' in value or '+' in value:
+                value = unquote(value)
+            position = index(name)
+            if position is None:
+                position = index(name.lower())
+                if position is None:
+                    extra[unquote(name)] = value
+                    continue
+            values[position] = value
+        self.values = values
+        self.extra = extra
+        self.data = body
+        self.delim = None
+        self.offsets = None
+        self.card_type = None
+        if values[0] not in RESPONSE_CODES:
+            raise Exception('Unexpected callback response code %r!' % values[0])
+
+    def field(self, index):
+        if index < len(self.values):
+            return self.values[index]
+        return ''
+
+class CallbackReceiver(object):
+    def __init__(self, login, salt, handler, workers=DEFAULT_WORKERS, queue_size=DEFAULT_QUEUE_SIZE,
+            put_timeout=DEFAULT_PUT_TIMEOUT, response='', content_type='text/html', verify=True):
+        self.verifier = None
+        if verify:
+            if not salt:
+                raise Exception('You must provide the MD5 hash salt, or pass verify=False to accept unsigned callbacks!')
+            self.verifier = HashVerifier(login, salt)
+        self.handler = handler
+        self.workers = workers
+        self.queue = Queue.Queue(queue_size)
+        self.put_timeout = put_timeout
+        self.response = response
+        self.content_type = content_type
+        self.threads = []
+        self.lock = threading.Lock()
+        self.received = 0
+        self.accepted = 0
+        self.busy = 0
+        self.bad_hash = 0
+        self.malformed = 0
+        self.handled = 0
+        self.failed = 0
+        self.last_error = None
+
+    def start(self):
+        for i in xrange(self.workers):
+            thread = threading.Thread(target=self._work)
+            thread.daemon = True
+            thread.start()
+            self.threads.append(thread)
+        return self
+
+    def stop(self):
+        """Handle every queued callback, then stop the workers."""
+        for thread in self.threads:
+            self.queue.put(_DONE)
+        for thread in self.threads:
+            thread.join()
+        self.threads = []
+
+    def _count(self, name):
+        self.lock.acquire()
+        try:
+            setattr(self, name, getattr(self, name) + 1)
+        finally:
+            self.lock.release()
+
+    def _work(self):
+        while True:
+            result = self.queue.get()
+            if result is _DONE:
+                return
+            try:
+                self.handler(result)
+            except Exception, e:
+                self.last_error = e
+                self._count('failed')
+            else:
+                self._count('handled')
+
+    def receive(self, body, timeout=None):
+        """Parse, check and queue one callback body; return the HTTP status
+        to answer with. Waits up to timeout (default put_timeout) seconds
+        for room in the queue; 0 never waits."""
+        self._count('received')
+        try:
+            result = CallbackResult(body)
+        except Exception:
+            self._count('malformed')
+            return STATUS_MALFORMED
+        if self.verifier is not None and not self.verifier.verify(result):
+            self._count('bad_hash')
+            return STATUS_BAD_HASH
+        if timeout is None:
+            timeout = self.put_timeout
+        try:
+            if timeout:
+                self.queue.put(result, True, timeout)
+            else:
+                self.queue.put_nowait(result)
+        except Queue.Full:
+            self._count('busy')
+            return STATUS_BUSY
+        self._count('accepted')
+        return STATUS_OK
+
+    def __call__(self, environ, start_response):
+        if environ.get('REQUEST_METHOD', 'POST') != 'POST':
+            start_response('405 Method Not Allowed', [('Allow', 'POST'), ('Content-Length', '0')])
+            return ['']
+        try:
+            length = int(environ.get('CONTENT_LENGTH') or 0)
+        except ValueError:
+            length = 0
+        if length > MAX_BODY:
+            status = STATUS_TOO_LARGE
+        else:
+            status = self.receive(environ['wsgi.input'].read(length))
+        body = ''
+        if status == STATUS_OK:
+            body = self.response
+        start_response(status, [('Content-Type', self.content_type), ('Content-Length', str(len(body)))])
+        return [body]
+
+    def stats(self):
+        self.lock.acquire()
+        try:
+            return {
+                'received': self.received,
+                'accepted': self.accepted,
+                'busy': self.busy,
+                'bad_hash': self.bad_hash,
+                'malformed': self.malformed,
+                'handled': self.handled,
+                'failed': self.failed,
+                'queued': self.queue.qsize(),
+            }
+        finally:
+            self.lock.release()
@@ -0,0 +1,92 @@
+"""Bulk card brand identification and Luhn validation with NumPy.
+
+classify() takes a sequence of card numbers -- ideally a NumPy fixed-width
+byte array such as numpy.array(numbers, dtype='S19') -- and returns an
+array of card types (using the same rules as identify_card_type) and an
+array of Luhn validity flags, without a Python-level loop per card.
+Numbers containing anything but digits are Unknown and invalid:
+
+    types, valid = classify(numbers)
+    numbers[valid]
+
+NumPy is only needed for this module; it is imported on first use.
+"""
+
+from pythorizenet import AMEX, DISCOVER, MASTERCARD, VISA, UNKNOWN_CARD_TYPE
+
+CARD_TYPES = (UNKNOWN_CARD_TYPE, AMEX, DISCOVER, MASTERCARD, VISA)
+CHUNK_SIZE = 65536
+
+def _numpy():
+    try:
+        import numpy
+    except ImportError:
+        raise Exception('numpy is required for bulk card validation!')
+    return numpy
+
+def _as_bytes(numpy, numbers):
+    numbers = numpy.asarray(numbers)
+    if numbers.dtype.kind == 'U':
+        numbers = numpy.char.encode(numbers, 'ascii')
+    elif numbers.dtype.kind != 'S':
+        numbers = numbers.astype('S')
+    if numbers.ndim != 1:
+        numbers = numbers.reshape(-1)
+    return numbers
+
+def _classify(numpy, numbers):
+    count = len(numbers)
+    width = numbers.dtype.itemsize
+    raw = numbers.view(numpy.uint8).reshape(count, width)
+    # Fixed-width byte strings are padded on the right with NULs.
+    present = raw != 0
+    lengths = present.sum(axis=1)
+    digits = raw.astype(numpy.int16) - ord('0')
+    well_formed = ((digits >= 0) & (digits <= 9) | ~present).all(axis=1) & (lengths > 0)
+    digits[~present] = 0
+
+    # Luhn: double every second digit counting from the rightmost one.
+    from_right = lengths[:, None] - 1 - numpy.arange(width)[None, :]
+    doubled = digits * 2
+    doubled[doubled > 9] -= 9
+    checksum = numpy.where(from_right % 2 == 1, doubled, digits)
+    checksum[from_right < 0] = 0
+    valid = well_formed & (checksum.sum(axis=1) % 10 == 0)
+
+    types = numpy.zeros(count, dtype=numpy.uint8)
+    if width >= 4:
+        first = digits[:, 0]
+        two = first * 10 + digits[:, 1]
+        four = two * 100 + digits[:, 2] * 10 + digits[:, 3]
+        types[(lengths == 13) & (first == 4)] = CARD_TYPES.index(VISA)
+        sixteen = lengths == 16
+        types[sixteen & (first == 4)] = CARD_TYPES.index(VISA)
+        types[sixteen & ((four == 6011) | (two == 65))] = CARD_TYPES.index(DISCOVER)
+        types[sixteen & (two >= 51) & (two <= 55)] = CARD_TYPES.index(MASTERCARD)
+        types[(lengths == 15) & ((two == 34) | (two == 37))] = CARD_TYPES.index(AMEX)
+        types[~well_formed] = 0
+    return types, valid
+
+def classify_codes(numbers):
+    """Return (indexes into CARD_TYPES, Luhn validity) as NumPy arrays."""
+    numpy = _numpy()
+    numbers = _as_bytes(numpy, numbers)
+    types = numpy.empty(len(numbers), dtype=numpy.uint8)
+    valid = numpy.empty(len(numbers), dtype=bool)
+    # Work in chunks so the per-digit temporaries stay small.
+    for start in xrange(0, len(numbers), CHUNK_SIZE):
+        end = start + CHUNK_SIZE
+        types[start:end], valid[start:end] = _classify(numpy, numbers[start:end])
+    return types, valid
+
+def classify(numbers):
+    """Return (card type names, Luhn validity) as NumPy arrays."""
+    numpy = _numpy()
+    codes, valid = classify_codes(numbers)
+    return numpy.array(CARD_TYPES)[codes], valid
+
+def identify_card_types(numbers):
+    return classify(numbers)[0]
+
+def luhn_check(numbers):
+    return classify_codes(numbers)[1]
@@ -1,169 +1,283 @@
-#!/usr/bin/env python
-
-from pythorizenet import AuthorizeNet, HOST_PROD, HOST_TEST
-import httplib, urllib
-
-PATH = '/xml/v1/request.api'
-ANET_XMLNS = ' xmlns="AnetApi/xml/v1/schema/AnetApiSchema.xsd"'
-
-VALIDATION_MODE_LIVE = 'liveMode'
-VALIDATION_MODE_TEST = 'testMode'
-
-class CustomerResult(object):
-    def __init__(self, data):
-        root = etree.XML(data)
-        messages = root.find('messages')
-        self.resultCode = messages.find('resultCode').text
-        self.code = messages.find('message/code').text
-        self.reason = messages.find('message/text').text
-        self.subscription_id = None
-        subscription_id = root.find('subscriptionId')
-        if root.tag == 'ARBCreateSubscriptionResponse' and subscription_id is not None:
-            self.subscription_id = subscription_id.text
-
-class Customer(object):
-    def __init__(self, host, login, key):
-        self.conn = AuthorizeNet(host, PATH, 'text/xml')
-        self.login = login
-        self.key = key
-        self.payment = []
-        self.billto = []
-        self.shipping = []
-        self.amount = None
-        self.customer_id = None
-        self.request_id = None
-        self.validation_mode = 'none'
-
-    def set_amount(self, amount):
-        self.amount = str(amount)
-
-    def add_payment(self, card_num, card_exp, card_code=None):
-        if not isinstance(card_exp, (tuple, list)):
-            raise Exception('card_exp must be a tuple or list!')
-        if len(card_exp) != 2:
-            raise Exception('card_exp must contain two items (year and month)!')
-        if len(card_exp[0]) != 4:
-            raise Exception('First item of card_exp must be year as YYYY!')
-        if len(card_exp[1]) == 1:
-            card_exp[1] = '0' + card_exp[1]
-        elif len(card_exp[1]) > 2:
-            raise Exception('Second item of card_exp must be month as MM!')
-        self.payment.append((TYPE_CREDIT, (card_num, tuple(card_exp), card_code)))
-
-    def add_billto(self, first_name, last_name, company=None, address=None, city=None, state=None, zip=None, country=None):
-        self.billto.append((first_name, last_name, company, address, city, state, zip, country))
-
-    def add_shipping(self, first_name, last_name, company=None, address=None, city=None, state=None, zip=None, country=None):
-        self.shipping.append((first_name, last_name, company, address, city, state, zip, country))
-
-    def set_customer_id(self, customer_id):
-        self.customer_id = customer_id
-
-    def set_profile_id(self, profile_id):
-        self.profile_id = profile_id
-
-    def set_request_id(self, request_id):
-        self.request_id = request_id
-
-    def set_validation_mode(self, validation_mode):
-        self.validation_mode = validation_mode
-
-    def _toXml(self, requestType):
-        rootElem = etree.Element(requestType, xmlns=ANET_XMLNS)
-        authElem = etree.SubElement(rootElem, "merchantAuthentication")
-        etree.SubElement(authElem, "name").text = self.login
-        etree.SubElement(authElem, "transactionKey").text = self.key
-        if self.reference_id:
-            etree.SubElement(rootElem, 'refId').text = str(self.reference_id)
-        if self.profile_id:
-            etree.SubElement(rootElem, 'customerProfileId').text = str(self.profile_id)
-        if requestType == 'createCustomerProfileRequest':
-            profileElem = etree.SubElement(rootElem, 'profile')
-            if self.customer_id:
-                etree.SubElement(profileElem, 'merchantCustomerId').text = str(self.customer_id)
-            profileElem = etree.SubElement(profileElem, 'paymentProfiles')
-        else:
-            profileElem = etree.SubElement(profileElem, 'paymentProfile')
-        if self.payment or self.billto:
-            if self.billto:
-                for first_name, last_name, company, address, city, state, zip, country in self.billto:
-                    billToElem = etree.SubElement(profileElem, 'billTo')
-                    etree.SubElement(billToElem, 'firstName').text = first_name
-                    etree.SubElement(billToElem, 'lastName').text = last_name
-                    if company:
-                        etree.SubElement(billToElem, 'company').text = company
-                    if address:
-                        etree.SubElement(billToElem, 'address').text = address
-                    if city:
-                        etree.SubElement(billToElem, 'city').text = city
-                    if state:
-                        etree.SubElement(billToElem, 'state').text = state
-                    if zip:
-                        etree.SubElement(billToElem, 'zip').text = zip
-                    if country:
-                        etree.SubElement(billToElem, 'country').text = country
-            if self.payment:
-                for type, cc_info in self.payment:
-                    if type == TYPE_CREDIT:
-                        (card_num, card_exp, card_code) = cc_info
-                        credit = etree.SubElement(etree.SubElement(profileElem, 'payment'), 'creditCard')
-                        etree.SubElement(credit, 'cardNumber').text = card_num
-                        etree.SubElement(credit, 'expirationDate').text = '%s-%s' % card_exp
-                        if card_code:
-                            etree.SubElement(credit, 'cardCode').text = card_code
-        if self.shipping:
-            for first_name, last_name, company, address, city, state, zip, country in self.shipping:
-                if requestType == 'createCustomerProfileRequest':
-                    shippingElem = etree.SubElement(profileElem, 'shipToList')
-                else:
-                    shippingElem = etree.SubElement(rootElem, 'address')
-                etree.SubElement(shippingElem, 'firstName').text = first_name
-                etree.SubElement(shippingElem, 'lastName').text = last_name
-                if company:
-                    etree.SubElement(shippingElem, 'company').text = company
-                if address:
-                    etree.SubElement(shippingElem, 'address').text = address
-                if city:
-                    etree.SubElement(shippingElem, 'city').text = city
-                if state:
-                    etree.SubElement(shippingElem, 'state').text = state
-                if zip:
-                    etree.SubElement(shippingElem, 'zip').text = zip
-                if country:
-                    etree.SubElement(shippingElem, 'country').text = country
-        etree.subElement(rootElem, 'validationMode').text = str(self.validation_mode)
-        return etree.tostring(root, xml_declaration=True, encoding='utf-8')
-
-    def _fromXml(self, response):
-        #TODO: investigate why etree will not parse this document when this namespace definition is intact.
-        # for now just remove it :-)
-        response = response.replace(ANET_XMLNS, '')
-        return CustomerResult(response)
-
-    def create(self):
-        xml = self._toXml('createCustomerProfileRequest')
-        response = self.conn.send(xml)
-        return self._fromXml(response)
-
-    def createPayment(self):
-        xml = self._toXml('createCustomerPaymentProfileRequest')
-        response = self.conn.send(xml)
-        return self._fromXml(response)
-
-    def createShipping(self):
-        xml = self._toXml('createCustomerShippingAddressRequest')
-        response = self.conn.send(xml)
-        return self._fromXml(response)
-
-    def createTransaction(self):
-        xml = self._toXml('createCustomerProfileTransactionRequest')
-        response = self.conn.send(xml)
-        return self._fromXml(response)
-
-if __name__ == '__main__':
-    import sys
-    if len(sys.argv) != 3:
-        print 'You must provide your login and trans id as parameters!'
-        sys.exit()
-    import pdb; pdb.set_trace()
-    create = Customer(HOST_PROD, sys.argv[1], sys.argv[2])
+#!/usr/bin/env python
+
+from pythorizenet import AuthorizeNet, HOST_PROD, HOST_TEST, TYPE_CREDIT
+from pythorizenet.parser import MESSAGES, ResponseParser, parse
+from pythorizenet.template import Template, text, opt, group, repeat, ADDRESS, address_values
+import httplib, urllib
+
+PATH = '/xml/v1/request.api'
+XMLNS = 'AnetApi/xml/v1/schema/AnetApiSchema.xsd'
+
+# Requests with at least this many payment, billing and shipping entries
+# are rendered and sent in chunks rather than as one string.
+DEFAULT_STREAM_THRESHOLD = 64
+
+VALIDATION_MODE_LIVE = 'liveMode'
+VALIDATION_MODE_TEST = 'testMode'
+
+PAYMENT_PROFILE = [
+    repeat('billTo', 'billTo', ADDRESS),
+    repeat('payment', 'payment', [
+        group('creditCard', [
+            text('cardNumber', 'cardNumber'),
+            text('expirationDate', 'expirationDate'),
+            opt('cardCode', 'cardCode'),
+        ]),
+    ]),
+]
+
+PROFILE = [
+    group('merchantAuthentication', [
+        text('name', 'login'),
+        text('transactionKey', 'key'),
+    ]),
+    opt('refId', 'refId'),
+    opt('customerProfileId', 'customerProfileId'),
+    group('profile', [
+        opt('merchantCustomerId', 'merchantCustomerId'),
+        group('paymentProfiles', PAYMENT_PROFILE, when='paymentProfile'),
+        repeat('shipToList', 'shipping', ADDRESS),
+    ]),
+    text('validationMode', 'validationMode'),
+]
+
+PAYMENT = [
+    group('merchantAuthentication', [
+        text('name', 'login'),
+        text('transactionKey', 'key'),
+    ]),
+    opt('refId', 'refId'),
+    opt('customerProfileId', 'customerProfileId'),
+    group('paymentProfile', PAYMENT_PROFILE, when='paymentProfile'),
+    repeat('address', 'shipping', ADDRESS),
+    text('validationMode', 'validationMode'),
+]
+
+LOOKUP = [
+    group('merchantAuthentication', [
+        text('name', 'login'),
+        text('transactionKey', 'key'),
+    ]),
+    opt('refId', 'refId'),
+    text('customerProfileId', 'customerProfileId'),
+    opt('customerPaymentProfileId', 'customerPaymentProfileId'),
+]
+
+TEMPLATES = {
+    'createCustomerProfileRequest': Template('createCustomerProfileRequest', XMLNS, PROFILE),
+}
+for requestType in ('createCustomerPaymentProfileRequest', 'createCustomerShippingAddressRequest', 'createCustomerProfileTransactionRequest'):
+    TEMPLATES[requestType] = Template(requestType, XMLNS, PAYMENT)
+for requestType in ('getCustomerProfileRequest', 'getCustomerPaymentProfileRequest'):
+    TEMPLATES[requestType] = Template(requestType, XMLNS, LOOKUP)
+del requestType
+
+RESULT_FIELDS = dict(MESSAGES)
+RESULT_FIELDS.update({
+    ('customerProfileId',): 'customerProfileId',
+    ('customerPaymentProfileId',): 'customerPaymentProfileId',
+    ('customerAddressId',): 'customerAddressId',
+    ('directResponse',): 'directResponse',
+    ('profile', 'customerProfileId'): 'customerProfileId',
+    ('profile', 'merchantCustomerId'): 'merchantCustomerId',
+    ('profile', 'email'): 'email',
+    ('paymentProfile', 'customerPaymentProfileId'): 'customerPaymentProfileId',
+    ('paymentProfile', 'payment', 'creditCard', 'cardNumber'): 'cardNumber',
+    ('paymentProfile', 'payment', 'creditCard', 'expirationDate'): 'expirationDate',
+})
+RESULT_LISTS = {
+    ('customerPaymentProfileIdList', 'numericString'): 'customerPaymentProfileIdList',
+    ('customerShippingAddressIdList', 'numericString'): 'customerShippingAddressIdList',
+    ('profile', 'paymentProfiles', 'customerPaymentProfileId'): 'customerPaymentProfileIdList',
+    ('profile', 'shipToList', 'customerAddressId'): 'customerShippingAddressIdList',
+}
+
+class CustomerResult(object):
+    """data is a response body, or a ResponseParser for RESULT_FIELDS
+    and RESULT_LISTS that has been fed one."""
+    def __init__(self, data):
+        if isinstance(data, ResponseParser):
+            root, values = data.close()
+        else:
+            root, values = parse(data, RESULT_FIELDS, RESULT_LISTS)
+        if 'resultCode' not in values:
+            raise Exception('No result code in %s response!' % root)
+        self.resultCode = values['resultCode']
+        self.code = values.get('code')
+        self.reason = values.get('text')
+        self.profile_id = values.get('customerProfileId')
+        self.payment_profile_id = values.get('customerPaymentProfileId')
+        self.payment_profile_ids = values.get('customerPaymentProfileIdList', [])
+        self.shipping_address_id = values.get('customerAddressId')
+        self.shipping_address_ids = values.get('customerShippingAddressIdList', [])
+        self.direct_response = values.get('directResponse')
+        self.merchant_customer_id = values.get('merchantCustomerId')
+        self.email = values.get('email')
+        self.card_number = values.get('cardNumber')
+        self.expiration_date = values.get('expirationDate')
+
+class Customer(object):
+    def __init__(self, host, login, key):
+        self.conn = AuthorizeNet(host, PATH, 'text/xml', login=login)
+        self.login = login
+        self.key = key
+        self.payment = []
+        self.billto = []
+        self.shipping = []
+        self.amount = None
+        self.customer_id = None
+        self.profile_id = None
+        self.payment_profile_id = None
+        self.request_id = None
+        self.validation_mode = 'none'
+        self.profile_cache = None
+        self.stream_threshold = DEFAULT_STREAM_THRESHOLD
+
+    def set_amount(self, amount):
+        self.amount = str(amount)
+
+    def add_payment(self, card_num, card_exp, card_code=None):
+        if not isinstance(card_exp, (tuple, list)):
+            raise Exception('card_exp must be a tuple or list!')
+        if len(card_exp) != 2:
+            raise Exception('card_exp must contain two items (year and month)!')
+        if len(card_exp[0]) != 4:
+            raise Exception('First item of card_exp must be year as YYYY!')
+        if len(card_exp[1]) == 1:
+            card_exp[1] = '0' + card_exp[1]
+        elif len(card_exp[1]) > 2:
+            raise Exception('Second item of card_exp must be month as MM!')
+        self.payment.append((TYPE_CREDIT, (card_num, tuple(card_exp), card_code)))
+
+    def add_billto(self, first_name, last_name, company=None, address=None, city=None, state=None, zip=None, country=None):
+        self.billto.append((first_name, last_name, company, address, city, state, zip, country))
+
+    def add_shipping(self, first_name, last_name, company=None, address=None, city=None, state=None, zip=None, country=None):
+        self.shipping.append((first_name, last_name, company, address, city, state, zip, country))
+
+    def set_customer_id(self, customer_id):
+        self.customer_id = customer_id
+
+    def set_profile_id(self, profile_id):
+        self.profile_id = profile_id
+
+    def set_payment_profile_id(self, payment_profile_id):
+        self.payment_profile_id = payment_profile_id
+
+    def set_profile_cache(self, profile_cache=None):
+        self.profile_cache = profile_cache
+
+    def set_stream_threshold(self, stream_threshold=None):
+        self.stream_threshold = stream_threshold
+
+    def set_request_id(self, request_id):
+        self.request_id = request_id
+
+    def set_validation_mode(self, validation_mode):
+        self.validation_mode = validation_mode
+
+    def _values(self, requestType):
+        values = {
+            'login': self.login,
+            'key': self.key,
+            'validationMode': str(self.validation_mode),
+        }
+        if self.request_id:
+            values['refId'] = str(self.request_id)
+        if self.profile_id:
+            values['customerProfileId'] = str(self.profile_id)
+        if requestType == 'getCustomerPaymentProfileRequest' and self.payment_profile_id:
+            values['customerPaymentProfileId'] = str(self.payment_profile_id)
+        if requestType == 'createCustomerProfileRequest' and self.customer_id:
+            values['merchantCustomerId'] = str(self.customer_id)
+        if self.payment or self.billto:
+            values['paymentProfile'] = True
+            values['billTo'] = [address_values(*billto) for billto in self.billto]
+            payments = values['payment'] = []
+            for type, cc_info in self.payment:
+                if type == TYPE_CREDIT:
+                    (card_num, card_exp, card_code) = cc_info
+                    payment = {'cardNumber': card_num, 'expirationDate': '%s-%s' % card_exp}
+                    if card_code:
+                        payment['cardCode'] = card_code
+                    payments.append(payment)
+        values['shipping'] = [address_values(*shipping) for shipping in self.shipping]
+        return values
+
+    def _toXml(self, requestType):
+        return TEMPLATES[requestType].render(self._values(requestType))
+
+    def _fromXml(self, response):
+        return CustomerResult(response)
+
+    def _body(self, requestType):
+        entries = len(self.payment) + len(self.billto) + len(self.shipping)
+        if self.stream_threshold is not None and entries >= self.stream_threshold:
+            return TEMPLATES[requestType].stream(self._values(requestType))
+        return self._toXml(requestType)
+
+    def _send(self, requestType):
+        xml = self._body(requestType)
+        # Parsed as it arrives, a compressed response decompressed on the way.
+        parser = ResponseParser(RESULT_FIELDS, RESULT_LISTS)
+        self.conn.send(xml, requestType, feed=parser.feed)
+        return CustomerResult(parser)
+
+    def _cached(self, payment_profile_id=None):
+        """The cached result for the profile (or payment profile) set, if any."""
+        if self.profile_cache is None:
+            return None
+        return self.profile_cache.get(self.login, self.profile_id, payment_profile_id)
+
+    def _store(self, profile_id, payment_profile_id, result):
+        if self.profile_cache is not None and result.resultCode == 'Ok':
+            self.profile_cache.put(self.login, profile_id, payment_profile_id, result)
+        return result
+
+    def _lookup(self, requestType, payment_profile_id=None):
+        result = self._cached(payment_profile_id)
+        if result is None:
+            result = self._store(self.profile_id, payment_profile_id, self._send(requestType))
+        return result
+
+    def _invalidate(self, profile_id):
+        if self.profile_cache is not None and profile_id:
+            self.profile_cache.invalidate(self.login, profile_id)
+
+    def create(self):
+        result = self._send('createCustomerProfileRequest')
+        self._invalidate(result.profile_id)
+        return result
+
+    def createPayment(self):
+        try:
+            return self._send('createCustomerPaymentProfileRequest')
+        finally:
+            self._invalidate(self.profile_id)
+
+    def createShipping(self):
+        try:
+            return self._send('createCustomerShippingAddressRequest')
+        finally:
+            self._invalidate(self.profile_id)
+
+    def createTransaction(self):
+        return self._send('createCustomerProfileTransactionRequest')
+
+    def get(self):
+        if not self.profile_id:
+            raise Exception('You must provide a profile_id to look up a profile!')
+        return self._lookup('getCustomerProfileRequest')
+
+    def getPayment(self):
+        if not (self.profile_id and self.payment_profile_id):
+            raise Exception('You must provide a profile_id and payment_profile_id to look up a payment profile!')
+        return self._lookup('getCustomerPaymentProfileRequest', self.payment_profile_id)
+
+if __name__ == '__main__':
+    import sys
+    if len(sys.argv) != 3:
+        print 'You must provide your login and trans id as parameters!'
+        sys.exit()
+    import pdb; pdb.set_trace()
+    create = Customer(HOST_PROD, sys.argv[1], sys.argv[2])
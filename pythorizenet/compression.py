@@ -0,0 +1,118 @@
+"""gzip and deflate bodies for gateway requests and responses.
+
+    conn = AuthorizeNet(HOST_PROD, '/xml/v1/request.api', 'text/xml')
+    conn.set_compression(accept=True, request=GZIP, threshold=4096)
+
+With accept, requests carry Accept-Encoding: gzip, deflate and a
+compressed response is decompressed piece by piece as it is read, each
+piece handed on at once (Customer feeds them straight into its
+ResponseParser), so the compressed body is never held in full. Request
+bodies are only compressed when request is set, which should only be done
+for endpoints known to take a Content-Encoding, and then only from
+threshold bytes up; chunk iterables are always compressed, on the fly.
+"""
+
+import zlib
+
+GZIP = 'gzip'
+DEFLATE = 'deflate'
+IDENTITY = 'identity'
+ACCEPT_ENCODING = 'gzip, deflate'
+DEFAULT_THRESHOLD = 1024
+DEFAULT_LEVEL = 6
+
+_WBITS = {
+    GZIP: 16 + zlib.MAX_WBITS,
+    DEFLATE: zlib.MAX_WBITS,
+}
+
+def _wbits(encoding):
+    try:
+        return _WBITS[encoding]
+    except KeyError:
+        raise Exception('Unsupported content encoding %s!' % encoding)
+
+def compress(data, encoding, level=DEFAULT_LEVEL):
+    """data, a string or an iterable of string chunks, compressed."""
+    wbits = _wbits(encoding)
+    if isinstance(data, str):
+        compressor = zlib.compressobj(level, zlib.DEFLATED, wbits)
+        return compressor.compress(data) + compressor.flush()
+    return CompressedChunks(data, encoding, level)
+
+class CompressedChunks(object):
+    """Chunks compressed as they are iterated, however often that is, so
+    a retried request sends the same bytes again."""
+    def __init__(self, chunks, encoding, level=DEFAULT_LEVEL):
+        self.chunks = chunks
+        self.wbits = _wbits(encoding)
+        self.level = level
+
+    def __iter__(self):
+        compressor = zlib.compressobj(self.level, zlib.DEFLATED, self.wbits)
+        for chunk in self.chunks:
+            data = compressor.compress(chunk)
+            if data:
+                yield data
+        yield compressor.flush()
+
+class Decoder(object):
+    def __init__(self, encoding):
+        self.encoding = encoding = encoding.strip().lower()
+        self.head = None
+        if encoding == DEFLATE:
+            # Told apart from raw deflate by the first two bytes.
+            self.decompressor = None
+            self.head = ''
+        else:
+            self.decompressor = zlib.decompressobj(_wbits(encoding))
+
+    def decompress(self, data):
+        if self.head is not None:
+            data = self.head + data
+            if len(data) < 2:
+                self.head = data
+                return ''
+            self.head = None
+            wbits = zlib.MAX_WBITS
+            if ord(data[0]) & 0x0f != 8 or (ord(data[0]) << 8 | ord(data[1])) % 31:
+                # Some servers send deflate without the zlib wrapper.
+                wbits = -zlib.MAX_WBITS
+            self.decompressor = zlib.decompressobj(wbits)
+        return self.decompressor.decompress(data)
+
+    def flush(self):
+        if self.head:
+            raise zlib.error('Truncated %s response!' % self.encoding)
+        if self.decompressor is None:
+            return ''
+        return self.decompressor.flush()
+
+class Body(object):
+    """A response body as it is read, decoded according to its
+    Content-Encoding. Decoded pieces are passed to feed if one is given and
+    only kept otherwise, so a fed body is never held in full."""
+    def __init__(self, encoding=None, feed=None):
+        self.decoder = None
+        if encoding and encoding.strip().lower() != IDENTITY:
+            self.decoder = Decoder(encoding)
+        self.feed = feed
+        self.chunks = []
+
+    def add(self, data):
+        if self.decoder is not None:
+            data = self.decoder.decompress(data)
+        if data:
+            if self.feed is None:
+                self.chunks.append(data)
+            else:
+                self.feed(data)
+
+    def finish(self):
+        """The whole decoded body, or None if it went to feed."""
+        decoder, self.decoder = self.decoder, None
+        if decoder is not None:
+            self.add(decoder.flush())
+        if self.feed is not None:
+            return None
+        return ''.join(self.chunks)
@@ -0,0 +1,275 @@
+"""Client-side duplicate transaction detection.
+
+The gateway rejects a transaction identical to one it saw within the
+duplicate window (x_duplicate_window, 120 seconds unless set) with reason
+code 11. DuplicateCache answers those locally instead of paying a round
+trip for the rejection:
+
+    cache = DuplicateCache()
+    trans = Transaction(HOST_PROD, login, key)
+    trans.set_duplicate_cache(cache)
+
+Identical submissions made while the first one is still in flight wait
+for it rather than going to the gateway themselves. Transactions are
+matched on a fingerprint of the login, type and amount, plus the trans_id
+for follow-ups (PRIOR_AUTH_CAPTURE, VOID, CREDIT) and otherwise an HMAC of
+the card number and the customer data; card numbers are never kept. The
+HMAC key is random per process unless one is passed as key, so a
+fingerprint cannot be matched against a table of hashed card numbers.
+AsyncTransaction uses the cache too, through submit_async().
+
+Pass a memcached-style client (get(key), set(key, value, time)) as shared
+to detect duplicates across processes as well; every process sharing it
+must then be given the same secret key.
+"""
+
+import hmac
+import os
+import threading
+import time
+from collections import OrderedDict
+
+from pythorizenet.aim import TransactionResult
+
+try:
+    from hashlib import sha1
+except ImportError:
+    from sha import new as sha1
+
+DEFAULT_MAX_SIZE = 10000
+DUPLICATE_REASON_CODE = '11'
+DUPLICATE_REASON = 'A duplicate transaction has been submitted.'
+KEY_PREFIX = 'pythorizenet:duplicate:'
+
+# Only approvals, declines and held transactions count; a request that
+# errored may be retried straight away.
+_RECORDED_CODES = ('1', '2', '4')
+
+# Follow-ups act on an earlier transaction and are told apart by its
+# trans_id; anything else by what is paid with and by whom.
+FOLLOW_UP_TYPES = ('PRIOR_AUTH_CAPTURE', 'VOID', 'CREDIT')
+
+_process_key = os.urandom(32)
+
+def fingerprint(transaction, requestType, key=None):
+    fields = [transaction.login, requestType, transaction.amount or '']
+    if requestType in FOLLOW_UP_TYPES:
+        fields.append(transaction.trans_id or '')
+    if transaction.payment:
+        type, card_num, exp_date, ccv = transaction.payment
+        fields.append(hmac.new(key or _process_key, _encode(card_num), sha1).hexdigest())
+        fields.append('%s-%s' % exp_date)
+    if transaction.customer and requestType not in FOLLOW_UP_TYPES:
+        fields.extend([value or '' for value in transaction.customer])
+    m = sha1()
+    for field in fields:
+        m.update(_encode(field))
+        m.update('\0')
+    return m.hexdigest()
+
+def _encode(field):
+    if isinstance(field, unicode):
+        return field.encode('utf-8')
+    return str(field)
+
+def duplicate_result(original):
+    """The response the gateway would give for a resubmission of original."""
+    fields = [''] * 55
+    fields[0] = '3'
+    fields[1] = '1'
+    fields[2] = DUPLICATE_REASON_CODE
+    fields[3] = DUPLICATE_REASON
+    fields[5] = 'P'
+    fields[6] = original.transaction_id
+    fields[9] = original.amount
+    fields[11] = original.transaction_type
+    return TransactionResult(original.delim.join(fields), original.delim)
+
+class LRUCache(object):
+    """A thread-safe dict of at most max_size entries, each with a TTL."""
+    def __init__(self, max_size=DEFAULT_MAX_SIZE):
+        self.max_size = max_size
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+
+    def get(self, key):
+        self.lock.acquire()
+        try:
+            entry = self.entries.pop(key, None)
+            if entry is None or entry[1] <= time.time():
+                return None
+            self.entries[key] = entry
+            return entry[0]
+        finally:
+            self.lock.release()
+
+    def set(self, key, value, ttl):
+        self.lock.acquire()
+        try:
+            self.entries.pop(key, None)
+            self.entries[key] = (value, time.time() + ttl)
+            while len(self.entries) > self.max_size:
+                self.entries.popitem(last=False)
+        finally:
+            self.lock.release()
+
+    def delete(self, key):
+        self.lock.acquire()
+        try:
+            self.entries.pop(key, None)
+        finally:
+            self.lock.release()
+
+    def __len__(self):
+        return len(self.entries)
+
+class _InFlight(object):
+    def __init__(self):
+        self.event = threading.Event()
+        self.result = None
+        self.callbacks = []
+
+class DuplicateCache(object):
+    def __init__(self, max_size=DEFAULT_MAX_SIZE, shared=None, key=None):
+        if shared is not None and not key:
+            raise Exception('You must provide a key shared by every process to use a shared duplicate cache!')
+        self.local = LRUCache(max_size)
+        self.shared = shared
+        self.key = key
+        self.inflight = {}
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.collapsed = 0
+
+    def fingerprint(self, transaction, requestType):
+        return fingerprint(transaction, requestType, self.key)
+
+    def _shared_get(self, key):
+        try:
+            value = self.shared.get(KEY_PREFIX + key)
+        except Exception:
+            # A shared cache outage must not stop payments.
+            return None
+        if value is not None:
+            return TransactionResult(*value)
+        return None
+
+    def _record(self, key, result, window):
+        self.local.set(key, result, window)
+        if self.shared is not None:
+            try:
+                self.shared.set(KEY_PREFIX + key, (result.data, result.delim), int(window))
+            except Exception:
+                pass
+
+    def _claim(self, key, callback=None):
+        """(original, pending, first): the transaction recorded for key if
+        there is one, else the submission of key in flight and whether the
+        caller has just started it and must send it. callback is called once
+        a submission started by someone else is over."""
+        self.lock.acquire()
+        try:
+            original = self.local.get(key)
+            if original is not None:
+                self.hits += 1
+                return original, None, False
+            pending = self.inflight.get(key)
+            if pending is None:
+                pending = self.inflight[key] = _InFlight()
+                return None, pending, True
+            self.collapsed += 1
+            if callback is not None:
+                pending.callbacks.append(callback)
+            return None, pending, False
+        finally:
+            self.lock.release()
+
+    def _shared_original(self, key):
+        original = None
+        if self.shared is not None:
+            original = self._shared_get(key)
+        if original is not None:
+            self.hits += 1
+        else:
+            self.misses += 1
+        return original
+
+    def _store(self, key, pending, result, window):
+        if result.field(0) in _RECORDED_CODES:
+            pending.result = result
+            self._record(key, result, window)
+
+    def _release(self, key, pending):
+        self.lock.acquire()
+        try:
+            del self.inflight[key]
+        finally:
+            self.lock.release()
+        pending.event.set()
+        for callback in pending.callbacks:
+            callback()
+
+    def submit(self, key, window, send):
+        """Return send()'s TransactionResult, or a duplicate rejection if an
+        identical transaction went through in the last window seconds."""
+        while True:
+            original, pending, first = self._claim(key)
+            if original is not None:
+                return duplicate_result(original)
+            if first:
+                break
+            pending.event.wait()
+            if pending.result is not None:
+                return duplicate_result(pending.result)
+            # The first submission failed or errored; try again ourselves.
+        try:
+            original = self._shared_original(key)
+            if original is not None:
+                pending.result = original
+                return duplicate_result(original)
+            result = send()
+            self._store(key, pending, result, window)
+            return result
+        finally:
+            self._release(key, pending)
+
+    def submit_async(self, key, window, send, future):
+        """submit() without blocking, for a send() that returns a Future of
+        the TransactionResult (see pythorizenet.aio). The outcome is set on
+        future, which is returned; a submission identical to one in flight
+        is settled once that one is over instead of being waited for."""
+        def retry():
+            if pending.result is not None:
+                future.set_result(duplicate_result(pending.result))
+            else:
+                self.submit_async(key, window, send, future)
+        original, pending, first = self._claim(key, retry)
+        if original is not None:
+            future.set_result(duplicate_result(original))
+            return future
+        if not first:
+            return future
+        original = self._shared_original(key)
+        if original is not None:
+            pending.result = original
+            self._release(key, pending)
+            future.set_result(duplicate_result(original))
+            return future
+        def finished(sent):
+            try:
+                result = sent.result()
+            except Exception, e:
+                self._release(key, pending)
+                future.set_exception(e)
+                return
+            self._store(key, pending, result, window)
+            self._release(key, pending)
+            future.set_result(result)
+        try:
+            sent = send()
+        except:
+            self._release(key, pending)
+            raise
+        sent.add_done_callback(finished)
+        return future
@@ -0,0 +1,474 @@
+"""An HTTP/2 transport: every concurrent request to a host shares one
+connection, one stream each.
+
+    set_transport(HOST_PROD, HTTP2Transport(HOST_PROD))
+
+Needs the h2 package (pip install pythorizenet[http2]), imported when the
+first connection is made. TLS connections negotiate h2 with ALPN;
+secure=False speaks HTTP/2 in the clear with prior knowledge, which is
+what the local stub in benchmarks/stub.py understands.
+
+Threads calling request() only hand their stream to the connection and
+wait; one I/O thread per connection does all reading and writing, so the
+socket (and its TLS state) is never used from two threads at once. It
+also fails streams that run past their read timeout or deadline.
+
+A stream the server refused, or one above the last stream ID in a GOAWAY,
+never reached the gateway; it fails with StreamRefused, a retry.Refused,
+so the retry policy sends it again as a counted attempt after a backoff
+(a connection that is going away is replaced first).
+"""
+
+import errno
+import os
+import select
+import socket
+import ssl
+import threading
+import time
+
+from pythorizenet.compression import Body
+from pythorizenet.pool import DEFAULT_WARM_UP_TIMEOUT
+from pythorizenet.retry import Refused, STAGE_SEND, STAGE_WAIT, STAGE_READ
+from pythorizenet.transport import Transport, budget
+
+READ_SIZE = 65536
+
+_ssl_context = None
+
+def _h2():
+    try:
+        import h2.config, h2.connection, h2.events, h2.errors
+    except ImportError:
+        raise Exception('h2 is required for HTTP/2!')
+    return h2
+
+def default_ssl_context():
+    """A context like pool.default_ssl_context() that offers h2 with ALPN."""
+    global _ssl_context
+    if _ssl_context is None:
+        context = ssl.create_default_context()
+        context.set_alpn_protocols(['h2'])
+        _ssl_context = context
+    return _ssl_context
+
+class StreamRefused(Refused):
+    pass
+
+class _Stream(object):
+    __slots__ = ('stream_id', 'done', 'status', 'chunks', 'error', 'read_timeout', 'deadline',
+        'expires', 'sent', 'headers', 'encoding')
+
+    def __init__(self, read_timeout, deadline):
+        self.stream_id = None
+        # Held until the I/O thread finishes the stream; a blocking acquire
+        # wakes the caller at once, where a timed wait would poll.
+        self.done = threading.Lock()
+        self.done.acquire()
+        self.status = None
+        self.chunks = []
+        self.error = None
+        self.read_timeout = read_timeout
+        self.deadline = deadline
+        self.expires = None
+        self.sent = None
+        self.headers = None
+        self.encoding = None
+
+    def touch(self, now):
+        expires = None
+        if self.read_timeout is not None:
+            expires = now + self.read_timeout
+        if self.deadline is not None and (expires is None or self.deadline < expires):
+            expires = self.deadline
+        self.expires = expires
+
+class HTTP2Connection(object):
+    def __init__(self, host, port, secure=True, ssl_context=None, timeout=None):
+        h2 = _h2()
+        self.host = host
+        self.port = port
+        self.h2 = h2
+        self.connect_time = None
+        self.tls_time = None
+        started = time.time()
+        sock = socket.create_connection((host, port), timeout)
+        sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        self.connect_time = time.time() - started
+        self.scheme = 'http'
+        if secure:
+            self.scheme = 'https'
+            started = time.time()
+            sock = (ssl_context or default_ssl_context()).wrap_socket(sock, server_hostname=host)
+            if sock.selected_alpn_protocol() != 'h2':
+                sock.close()
+                raise socket.error(errno.EPROTO, '%s did not agree to HTTP/2!' % host)
+            self.tls_time = time.time() - started
+        sock.settimeout(None)
+        self.sock = sock
+        self.conn = h2.connection.H2Connection(h2.config.H2Configuration(client_side=True, header_encoding=None))
+        self.conn.initiate_connection()
+        self.lock = threading.Lock()
+        # Signalled when the peer opens the flow control window or a stream
+        # slot frees up.
+        self.window = threading.Condition(self.lock)
+        self.streams = {}
+        self.used = False
+        self.closed = False
+        self.retired = False
+        self.error = None
+        self.last_stream_id = None
+        self.wake_read, self.wake_write = os.pipe()
+        self.woken = False
+        self.sock.sendall(self.conn.data_to_send())
+        self.thread = threading.Thread(target=self._run)
+        self.thread.daemon = True
+        self.thread.start()
+
+    @property
+    def available(self):
+        return not (self.closed or self.retired) and self.last_stream_id is None
+
+    def _wake(self):
+        # One byte in the pipe is enough to get the I/O thread round its
+        # loop, and every write is a system call.
+        if self.woken:
+            return
+        self.lock.acquire()
+        try:
+            # Once _shutdown has closed the pipe its descriptor may already
+            # belong to another file.
+            if self.woken or self.wake_write is None:
+                return
+            self.woken = True
+            try:
+                os.write(self.wake_write, 'x')
+            except OSError:
+                pass
+        finally:
+            self.lock.release()
+
+    def request(self, path, mime, data, read_timeout, deadline, timing, progress, extra=(), feed=None):
+        stream = _Stream(read_timeout, deadline)
+        headers = [
+            (':method', 'POST'),
+            (':scheme', self.scheme),
+            (':authority', self.host),
+            (':path', path),
+            ('content-type', mime),
+        ]
+        headers.extend(extra)
+        if isinstance(data, str):
+            headers.append(('content-length', str(len(data))))
+        try:
+            return self._request(stream, headers, data, timing, progress, feed)
+        except StreamRefused:
+            # The gateway never saw it, whatever stage it got to.
+            progress[0] = STAGE_SEND
+            progress[2] = False
+            raise
+
+    def _request(self, stream, headers, data, timing, progress, feed):
+        started = time.time()
+        self.lock.acquire()
+        try:
+            progress[2] = self.used
+            self.used = True
+            while not self.closed and len(self.streams) >= self.conn.remote_settings.max_concurrent_streams:
+                self._wait_window(stream)
+            self._check(stream)
+            stream.stream_id = stream_id = self.conn.get_next_available_stream_id()
+            progress[0] = STAGE_SEND
+            self.conn.send_headers(stream_id, headers)
+            self.streams[stream_id] = stream
+            stream.touch(time.time())
+            if isinstance(data, str) and len(data) <= min(self.conn.local_flow_control_window(stream_id),
+                    self.conn.max_outbound_frame_size):
+                # The usual small request: headers and body go out together.
+                self.conn.send_data(stream_id, data, end_stream=True)
+                stream.sent = time.time()
+                data = None
+        finally:
+            self.lock.release()
+        self._wake()
+        if data is not None:
+            if isinstance(data, str):
+                data = [data]
+            try:
+                for chunk in data:
+                    self._send_data(stream, chunk)
+                self.lock.acquire()
+                try:
+                    self._check(stream)
+                    self.conn.end_stream(stream.stream_id)
+                    stream.sent = time.time()
+                finally:
+                    self.lock.release()
+                self._wake()
+            except:
+                self._cancel(stream)
+                raise
+        if timing is not None:
+            timing.upload = stream.sent - started
+        progress[0] = STAGE_WAIT
+        stream.done.acquire()
+        if stream.headers is not None:
+            progress[0] = STAGE_READ
+        if timing is not None and stream.headers is not None:
+            timing.wait = stream.headers - stream.sent
+            timing.download = time.time() - stream.headers
+        if stream.error is not None:
+            raise stream.error
+        progress[1] = stream.status
+        if stream.encoding is None and feed is None:
+            return stream.status, ''.join(stream.chunks)
+        # Decoded here rather than on the I/O thread, which every other
+        # stream is waiting on.
+        body = Body(stream.encoding, feed)
+        for chunk in stream.chunks:
+            body.add(chunk)
+        return stream.status, body.finish()
+
+    def _check(self, stream):
+        if stream.error is not None:
+            raise stream.error
+        if self.closed:
+            raise StreamRefused(errno.ECONNRESET, self.error or 'HTTP/2 connection closed!')
+        if stream.stream_id is None and self.last_stream_id is not None:
+            raise StreamRefused(errno.ECONNRESET, 'HTTP/2 connection is going away!')
+
+    def _wait_window(self, stream):
+        if stream.deadline is None and stream.read_timeout is None:
+            self.window.wait()
+            return
+        expires = stream.expires or time.time() + budget(stream.read_timeout, stream.deadline)
+        remaining = expires - time.time()
+        if remaining <= 0:
+            raise socket.timeout('HTTP/2 flow control window stayed closed!')
+        stream.expires = expires
+        self.window.wait(remaining)
+
+    def _send_data(self, stream, chunk):
+        while chunk:
+            self.lock.acquire()
+            try:
+                while True:
+                    self._check(stream)
+                    size = min(len(chunk), self.conn.local_flow_control_window(stream.stream_id),
+                        self.conn.max_outbound_frame_size)
+                    if size > 0:
+                        break
+                    self._wait_window(stream)
+                self.conn.send_data(stream.stream_id, chunk[:size])
+            finally:
+                self.lock.release()
+            self._wake()
+            chunk = chunk[size:]
+
+    def _cancel(self, stream):
+        self.lock.acquire()
+        try:
+            if self.streams.pop(stream.stream_id, None) is not None and not self.closed:
+                self.conn.reset_stream(stream.stream_id, self.h2.errors.ErrorCodes.CANCEL)
+                self.window.notify_all()
+        finally:
+            self.lock.release()
+        self._wake()
+
+    def _finish(self, stream_id, error=None):
+        stream = self.streams.pop(stream_id, None)
+        if stream is None:
+            return
+        stream.error = error
+        self.window.notify_all()
+        stream.done.release()
+
+    def _handle(self, events, now):
+        h2 = self.h2
+        for event in events:
+            stream = self.streams.get(getattr(event, 'stream_id', None))
+            if isinstance(event, h2.events.ResponseReceived):
+                if stream is not None:
+                    headers = dict(event.headers)
+                    stream.headers = now
+                    stream.status = int(headers[':status'])
+                    stream.encoding = headers.get('content-encoding')
+                    stream.touch(now)
+            elif isinstance(event, h2.events.DataReceived):
+                self.conn.acknowledge_received_data(event.flow_controlled_length, event.stream_id)
+                if stream is not None:
+                    stream.chunks.append(event.data)
+                    stream.touch(now)
+            elif isinstance(event, h2.events.StreamEnded):
+                self._finish(event.stream_id)
+            elif isinstance(event, h2.events.StreamReset):
+                if event.error_code == h2.errors.ErrorCodes.REFUSED_STREAM:
+                    error = StreamRefused(errno.ECONNRESET, 'HTTP/2 stream refused!')
+                else:
+                    error = socket.error(errno.ECONNRESET, 'HTTP/2 stream reset (%s)!' % event.error_code)
+                self._finish(event.stream_id, error)
+            elif isinstance(event, h2.events.ConnectionTerminated):
+                self.last_stream_id = event.last_stream_id or 0
+                for stream_id in list(self.streams):
+                    if stream_id > self.last_stream_id:
+                        self._finish(stream_id, StreamRefused(errno.ECONNRESET, 'HTTP/2 stream refused by GOAWAY!'))
+            elif isinstance(event, (h2.events.WindowUpdated, h2.events.RemoteSettingsChanged)):
+                self.window.notify_all()
+
+    def _expire(self, now):
+        """Fail streams that timed out; return seconds to the next expiry."""
+        nearest = None
+        for stream_id, stream in self.streams.items():
+            if stream.expires is None:
+                continue
+            if stream.expires <= now:
+                self.conn.reset_stream(stream_id, self.h2.errors.ErrorCodes.CANCEL)
+                self._finish(stream_id, socket.timeout('Gateway request timed out on HTTP/2!'))
+            elif nearest is None or stream.expires < nearest:
+                nearest = stream.expires
+        if nearest is None:
+            return None
+        return nearest - now
+
+    def _run(self):
+        sock = self.sock
+        wake = self.wake_read
+        timeout = None
+        try:
+            while True:
+                readable, writable, errored = select.select([sock, wake], [], [], timeout)
+                if wake in readable:
+                    os.read(wake, 4096)
+                    # Only now: cleared before the read, a wake-up written in
+                    # between would be swallowed and leave woken set for good.
+                    self.woken = False
+                data = None
+                if sock in readable:
+                    data = sock.recv(READ_SIZE)
+                    if not data:
+                        raise socket.error(errno.ECONNRESET, 'HTTP/2 connection closed by the gateway!')
+                    pending = getattr(sock, 'pending', None)
+                    while pending is not None and pending():
+                        data += sock.recv(READ_SIZE)
+                self.lock.acquire()
+                try:
+                    now = time.time()
+                    if data:
+                        self._handle(self.conn.receive_data(data), now)
+                    timeout = self._expire(now)
+                    if self.retired and not self.streams:
+                        self._close()
+                    out = self.conn.data_to_send()
+                    done = self.closed or (self.last_stream_id is not None and not self.streams)
+                finally:
+                    self.lock.release()
+                if out:
+                    sock.sendall(out)
+                if done:
+                    break
+        except Exception, e:
+            self.error = str(e)
+        self._shutdown()
+
+    def _shutdown(self):
+        self.lock.acquire()
+        try:
+            self.closed = True
+            for stream_id, stream in self.streams.items():
+                # Streams that never got an answer may or may not have been
+                # acted on.
+                self._finish(stream_id, socket.error(errno.ECONNRESET, self.error or 'HTTP/2 connection closed!'))
+            self.window.notify_all()
+            wake_write, self.wake_write = self.wake_write, None
+        finally:
+            self.lock.release()
+        try:
+            self.sock.close()
+        finally:
+            os.close(self.wake_read)
+            os.close(wake_write)
+
+    def _close(self):
+        if self.closed:
+            return
+        self.closed = True
+        self.error = 'HTTP/2 connection closed!'
+        try:
+            self.conn.close_connection()
+        except Exception:
+            pass
+
+    def close(self):
+        self.lock.acquire()
+        try:
+            self._close()
+        finally:
+            self.lock.release()
+        self._wake()
+
+    def retire(self):
+        """Take no new streams, and close once those open are done."""
+        self.lock.acquire()
+        try:
+            self.retired = True
+        finally:
+            self.lock.release()
+        self._wake()
+
+class HTTP2Transport(Transport):
+    def __init__(self, host, secure=True, ssl_context=None):
+        self.host = host
+        name, colon, port = host.rpartition(':')
+        if colon and port.isdigit():
+            self.address, self.port = name, int(port)
+        else:
+            self.address, self.port = host, 443
+        self.secure = secure
+        self.ssl_context = ssl_context
+        self.connection = None
+        self.lock = threading.Lock()
+
+    def _connection(self, client, deadline, timing, fresh):
+        self.lock.acquire()
+        try:
+            conn = self.connection
+            if conn is not None and fresh:
+                # Other threads may still be waiting on streams of this one;
+                # it closes itself once they are done.
+                conn.retire()
+            elif conn is not None and conn.available:
+                return conn
+            conn = HTTP2Connection(self.address, self.port, self.secure, self.ssl_context,
+                budget(client.connect_timeout, deadline))
+            self.connection = conn
+        finally:
+            self.lock.release()
+        if timing is not None:
+            timing.connect = conn.connect_time
+            timing.tls = conn.tls_time
+        return conn
+
+    def request(self, client, data, deadline, timing, progress, fresh=False, headers=(), feed=None):
+        conn = self._connection(client, deadline, timing, fresh)
+        if timing is not None:
+            timing.reused = conn.used
+        return conn.request(client.path, client.mime, data, client.read_timeout, deadline, timing, progress,
+            headers, feed)
+
+    def warm_up(self, count, timeout=DEFAULT_WARM_UP_TIMEOUT):
+        """HTTP/2 needs a single connection, whatever count is."""
+        client = type('WarmUp', (object,), {'connect_timeout': timeout})()
+        try:
+            self._connection(client, None, None, False)
+        except (socket.error, ssl.SSLError):
+            return 0
+        return 1
+
+    def close(self):
+        self.lock.acquire()
+        try:
+            conn, self.connection = self.connection, None
+        finally:
+            self.lock.release()
+        if conn is not None:
+            conn.close()
@@ -0,0 +1,255 @@
+"""Adaptive concurrency and rate limits per merchant login and host.
+
+    set_limiter(login, HOST_PROD, AdaptiveLimiter(login, HOST_PROD, rate=50))
+    batch = Batch(transactions, concurrency=64)
+
+Requests for a login with a registered limiter wait in AuthorizeNet for a
+slot before each attempt. The number of slots starts at `initial` and is
+adjusted AIMD style: it grows by about one per round trip while responses
+come back quickly, and is cut by `decrease` when the gateway throttles
+(HTTP 429 or 503), the attempt fails on the network, or the smoothed
+response time passes `tolerance` times the recent best latency (or
+max_latency, if set). Only one cut is made per round trip, so a burst of
+slow responses to requests sent before the cut does not collapse the
+limit. A rate, in
+requests per second, is a hard cap on top of that, enforced by a token
+bucket holding up to `burst` requests.
+
+Give a Batch at least max_limit workers; the limiter decides how many of
+them are actually talking to the gateway. stats() and prometheus() report
+each limiter's current limit, requests in flight and queue depth.
+"""
+
+import socket
+import threading
+import time
+
+DEFAULT_INITIAL = 8
+DEFAULT_MIN_LIMIT = 1
+DEFAULT_MAX_LIMIT = 256
+DEFAULT_DECREASE = 0.7
+DEFAULT_TOLERANCE = 2.0
+DEFAULT_WINDOW = 250
+DEFAULT_SMOOTHING = 0.1
+THROTTLE_STATUSES = (429, 503)
+
+class TokenBucket(object):
+    """Lets `rate` requests a second through, with bursts of up to `burst`."""
+    def __init__(self, rate, burst=None):
+        if rate <= 0:
+            raise Exception('rate must be greater than zero!')
+        self.rate = float(rate)
+        self.burst = float(burst or max(1, rate))
+        self.tokens = self.burst
+        self.updated = time.time()
+        self.lock = threading.Lock()
+
+    def acquire(self, deadline=None):
+        """Take a token, sleeping until it is due; return the seconds slept."""
+        self.lock.acquire()
+        try:
+            now = time.time()
+            self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            # The token is reserved now and paid for by sleeping, so callers
+            # are let through in the order they arrived.
+            wait = (1 - self.tokens) / self.rate
+            if wait > 0 and deadline is not None and now + wait >= deadline:
+                raise socket.timeout('Gateway request deadline exceeded waiting for the rate limit!')
+            self.tokens -= 1
+        finally:
+            self.lock.release()
+        if wait > 0:
+            time.sleep(wait)
+            return wait
+        return 0.0
+
+class AdaptiveLimiter(object):
+    def __init__(self, login, host, rate=None, burst=None, initial=DEFAULT_INITIAL,
+            min_limit=DEFAULT_MIN_LIMIT, max_limit=DEFAULT_MAX_LIMIT, decrease=DEFAULT_DECREASE,
+            tolerance=DEFAULT_TOLERANCE, max_latency=None, window=DEFAULT_WINDOW,
+            smoothing=DEFAULT_SMOOTHING):
+        if not 1 <= min_limit <= initial <= max_limit:
+            raise Exception('Limits must satisfy 1 <= min_limit <= initial <= max_limit!')
+        self.login = login
+        self.host = host
+        self.bucket = None
+        if rate is not None:
+            self.bucket = TokenBucket(rate, burst)
+        self.limit = float(initial)
+        self.min_limit = min_limit
+        self.max_limit = max_limit
+        self.decrease = decrease
+        self.tolerance = tolerance
+        self.max_latency = max_latency
+        self.window = window
+        self.smoothing = smoothing
+        self.in_flight = 0
+        self.waiting = 0
+        # Best latency over the previous and the current window of samples.
+        self.baseline = None
+        self.window_best = None
+        self.samples = 0
+        # Single responses are too noisy to act on; this is an
+        # exponentially weighted moving average.
+        self.latency = None
+        self.decreased = 0.0
+        self.throttled = 0
+        self.failures = 0
+        self.decreases = 0
+        self.condition = threading.Condition(threading.Lock())
+
+    def acquire(self, deadline=None):
+        """Wait for a slot (and a token); return the seconds spent waiting."""
+        started = time.time()
+        condition = self.condition
+        condition.acquire()
+        try:
+            self.waiting += 1
+            try:
+                while self.in_flight >= int(self.limit):
+                    if deadline is None:
+                        condition.wait()
+                        continue
+                    remaining = deadline - time.time()
+                    if remaining <= 0:
+                        raise socket.timeout('Gateway request deadline exceeded waiting for a slot!')
+                    condition.wait(remaining)
+            finally:
+                self.waiting -= 1
+            self.in_flight += 1
+        finally:
+            condition.release()
+        if self.bucket is not None:
+            try:
+                self.bucket.acquire(deadline)
+            except:
+                self.release()
+                raise
+        return time.time() - started
+
+    def release(self):
+        """Give a slot back without saying anything about the gateway."""
+        self.condition.acquire()
+        try:
+            self._release()
+        finally:
+            self.condition.release()
+
+    def success(self, started, status=None):
+        """An attempt that began at `started` got a response."""
+        now = time.time()
+        latency = now - started
+        self.condition.acquire()
+        try:
+            used = self.in_flight
+            self._release()
+            if status in THROTTLE_STATUSES:
+                self.throttled += 1
+                self._decrease(started, now)
+            elif self._slow(latency):
+                self._decrease(started, now)
+            elif used >= self.limit / 2:
+                # Only grow while the slots are actually being used.
+                self.limit = min(self.max_limit, self.limit + 1.0 / self.limit)
+        finally:
+            self.condition.release()
+
+    def failure(self, started):
+        """An attempt that began at `started` failed on the network."""
+        now = time.time()
+        self.condition.acquire()
+        try:
+            self._release()
+            self.failures += 1
+            self._decrease(started, now)
+        finally:
+            self.condition.release()
+
+    def _release(self):
+        self.in_flight -= 1
+        free = int(self.limit) - self.in_flight
+        if free > 0 and self.waiting:
+            self.condition.notify(free)
+
+    def _slow(self, latency):
+        if self.latency is None:
+            self.latency = latency
+        else:
+            self.latency += (latency - self.latency) * self.smoothing
+        if self.max_latency is not None and self.latency > self.max_latency:
+            return True
+        if self.window_best is None or latency < self.window_best:
+            self.window_best = latency
+        if self.baseline is None or self.window_best < self.baseline:
+            self.baseline = self.window_best
+        self.samples += 1
+        if self.samples >= self.window:
+            # Forget old minimums so a gateway that got slower for good
+            # does not look congested forever.
+            self.baseline = self.window_best
+            self.window_best = None
+            self.samples = 0
+        return self.tolerance is not None and self.latency > self.baseline * self.tolerance
+
+    def _decrease(self, started, now):
+        # Requests sent before the last cut saw the old limit; one cut per
+        # round trip is enough.
+        if started < self.decreased:
+            return
+        self.limit = max(self.min_limit, self.limit * self.decrease)
+        self.decreased = now
+        self.decreases += 1
+
+    def stats(self):
+        self.condition.acquire()
+        try:
+            return {
+                'login': self.login,
+                'host': self.host,
+                'limit': self.limit,
+                'in_flight': self.in_flight,
+                'waiting': self.waiting,
+                'rate': self.bucket and self.bucket.rate,
+                'latency': self.latency,
+                'baseline': self.baseline,
+                'throttled': self.throttled,
+                'failures': self.failures,
+                'decreases': self.decreases,
+            }
+        finally:
+            self.condition.release()
+
+_limiters = {}
+_limiters_lock = threading.Lock()
+
+def get_limiter(login, host):
+    """Return the limiter for login on host, or None if it has none."""
+    return _limiters.get((login, host))
+
+def set_limiter(login, host, limiter):
+    """Limit every client for login on host from now on; None removes it."""
+    _limiters_lock.acquire()
+    try:
+        if limiter is None:
+            _limiters.pop((login, host), None)
+        else:
+            _limiters[(login, host)] = limiter
+    finally:
+        _limiters_lock.release()
+
+def stats():
+    """stats() of every registered limiter."""
+    return [limiter.stats() for limiter in _limiters.values()]
+
+def prometheus(prefix='pythorizenet'):
+    """Every registered limiter's state in Prometheus text format."""
+    gauges = (('limit', 'concurrency_limit'), ('in_flight', 'in_flight'), ('waiting', 'queue_depth'))
+    counters = (('throttled', 'throttled_total'), ('failures', 'failures_total'), ('decreases', 'decreases_total'))
+    limiters = sorted(stats(), key=lambda item: (item['login'], item['host']))
+    lines = []
+    for key, name, kind in [gauge + ('gauge',) for gauge in gauges] + [counter + ('counter',) for counter in counters]:
+        lines.append('# TYPE %s_limiter_%s %s' % (prefix, name, kind))
+        for item in limiters:
+            lines.append('%s_limiter_%s{login="%s",host="%s"} %s' % (prefix, name, item['login'], item['host'], item[key]))
+    return '\n'.join(lines) + '\n'
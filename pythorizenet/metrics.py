@@ -0,0 +1,181 @@
+"""Per-request timing emitted by the transport.
+
+Register an observer with add_observer(); AuthorizeNet.send then hands it
+a RequestTiming for every gateway call, broken down into queue (time spent
+waiting for a limiter slot), connect, TLS handshake, upload, wait (time to
+the response headers) and download.
+With no observer registered the transport skips all of this.
+
+HistogramObserver keeps in-process latency histograms per request type and
+phase that can be read with snapshot() or scraped as Prometheus text.
+"""
+
+import bisect
+import re
+import threading
+import time
+
+PHASES = ('queue', 'connect', 'tls', 'upload', 'wait', 'download', 'total')
+BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+observers = []
+
+_result_code = re.compile(r'<resultCode>\s*(\w+)\s*</resultCode>')
+
+def add_observer(observer):
+    if observer not in observers:
+        observers.append(observer)
+
+def remove_observer(observer):
+    if observer in observers:
+        observers.remove(observer)
+
+def notify(timing):
+    for observer in list(observers):
+        try:
+            observer.request_finished(timing)
+        except Exception:
+            # Metrics must never fail a payment.
+            pass
+
+def result_code(body):
+    """The AIM response code or XML resultCode at the start of body."""
+    if body[:1].isdigit():
+        return body[:1]
+    match = _result_code.search(body, 0, 2048)
+    if match:
+        return match.group(1)
+    return None
+
+class RequestTiming(object):
+    __slots__ = ('host', 'path', 'request_type', 'request_size', 'response_size',
+        'result_code', 'reused', 'error', 'started', 'queue', 'connect', 'tls', 'upload',
+        'wait', 'download', 'total')
+
+    def __init__(self, host, path, request_type, request_size):
+        self.host = host
+        self.path = path
+        self.request_type = request_type
+        self.request_size = request_size
+        self.response_size = None
+        self.result_code = None
+        self.reused = None
+        self.error = None
+        self.started = time.time()
+        self.queue = None
+        self.connect = None
+        self.tls = None
+        self.upload = None
+        self.wait = None
+        self.download = None
+        self.total = None
+
+    def finish(self):
+        self.total = time.time() - self.started
+
+    def phases(self):
+        """(phase, seconds) for every phase that happened."""
+        return [(phase, getattr(self, phase)) for phase in PHASES if getattr(self, phase) is not None]
+
+class Observer(object):
+    def request_finished(self, timing):
+        pass
+
+class Histogram(object):
+    def __init__(self, buckets=BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.count = 0
+        self.sum = 0.0
+        self.lock = threading.Lock()
+
+    def observe(self, value):
+        index = bisect.bisect_left(self.buckets, value)
+        self.lock.acquire()
+        try:
+            self.counts[index] += 1
+            self.count += 1
+            self.sum += value
+        finally:
+            self.lock.release()
+
+    def percentile(self, fraction):
+        """Upper bound of the bucket holding the given fraction of samples."""
+        target = self.count * fraction
+        seen = 0
+        for index, count in enumerate(self.counts):
+            seen += count
+            if count and seen >= target:
+                if index < len(self.buckets):
+                    return self.buckets[index]
+                return float('inf')
+        return None
+
+    def snapshot(self):
+        self.lock.acquire()
+        try:
+            return {'buckets': self.buckets, 'counts': list(self.counts), 'count': self.count, 'sum': self.sum}
+        finally:
+            self.lock.release()
+
+class HistogramObserver(Observer):
+    def __init__(self, buckets=BUCKETS):
+        self.buckets = buckets
+        self.histograms = {}
+        self.results = {}
+        self.lock = threading.Lock()
+
+    def _histogram(self, key):
+        histogram = self.histograms.get(key)
+        if histogram is None:
+            self.lock.acquire()
+            try:
+                histogram = self.histograms.setdefault(key, Histogram(self.buckets))
+            finally:
+                self.lock.release()
+        return histogram
+
+    def request_finished(self, timing):
+        request_type = timing.request_type or 'unknown'
+        for phase, seconds in timing.phases():
+            self._histogram((request_type, phase)).observe(seconds)
+        if timing.error is not None:
+            code = 'error'
+        else:
+            code = timing.result_code or 'unknown'
+        self.lock.acquire()
+        try:
+            key = (request_type, code)
+            self.results[key] = self.results.get(key, 0) + 1
+        finally:
+            self.lock.release()
+
+    def snapshot(self):
+        """{'latency': {(type, phase): histogram}, 'results': {(type, code): count}}"""
+        self.lock.acquire()
+        try:
+            histograms = self.histograms.items()
+            results = dict(self.results)
+        finally:
+            self.lock.release()
+        return {
+            'latency': dict((key, histogram.snapshot()) for key, histogram in histograms),
+            'results': results,
+        }
+
+    def prometheus(self, prefix='pythorizenet'):
+        """The histograms and result counters in Prometheus text format."""
+        snapshot = self.snapshot()
+        lines = ['# TYPE %s_request_seconds histogram' % prefix]
+        for (request_type, phase), histogram in sorted(snapshot['latency'].items()):
+            labels = 'type="%s",phase="%s"' % (request_type, phase)
+            seen = 0
+            for bound, count in zip(histogram['buckets'] + ('+Inf',), histogram['counts']):
+                seen += count
+                lines.append('%s_request_seconds_bucket{%s,le="%s"} %d' % (prefix, labels, bound, seen))
+            lines.append('%s_request_seconds_sum{%s} %f' % (prefix, labels, histogram['sum']))
+            lines.append('%s_request_seconds_count{%s} %d' % (prefix, labels, histogram['count']))
+        lines.append('# TYPE %s_requests_total counter' % prefix)
+        for (request_type, code), count in sorted(snapshot['results'].items()):
+            lines.append('%s_requests_total{type="%s",result="%s"} %d' % (prefix, request_type, code, count))
+        return '\n'.join(lines) + '\n'
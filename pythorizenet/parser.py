@@ -0,0 +1,92 @@
+"""Streaming parser for XML API responses.
+
+ResponseParser drives lxml's parser with a target object, so no element
+tree is ever built: only the text of the requested paths is kept, and
+namespaces are matched on local names instead of being stripped from the
+document first. Memory use depends on the fields kept, not on the size of
+the response.
+
+lxml is only imported once the first response is parsed, so programs that
+only use AIM never load it.
+"""
+
+MESSAGES = {
+    ('messages', 'resultCode'): 'resultCode',
+    ('messages', 'message', 'code'): 'code',
+    ('messages', 'message', 'text'): 'text',
+}
+
+def _local(tag):
+    if tag[:1] == '{':
+        return tag[tag.index('}') + 1:]
+    return tag
+
+class _Target(object):
+    def __init__(self, fields, lists):
+        self.fields = fields
+        self.lists = lists
+        self.path = ()
+        self.root = None
+        self.values = {}
+        self.text = None
+
+    def start(self, tag, attrib):
+        tag = _local(tag)
+        if self.root is None:
+            self.root = tag
+        else:
+            self.path += (tag,)
+        if self.path in self.fields or self.path in self.lists:
+            self.text = []
+
+    def data(self, data):
+        if self.text is not None:
+            self.text.append(data)
+
+    def end(self, tag):
+        path = self.path
+        if self.text is not None and (path in self.fields or path in self.lists):
+            value = ''.join(self.text)
+            self.text = None
+            if path in self.lists:
+                self.values.setdefault(self.lists[path], []).append(value)
+            elif self.fields[path] not in self.values:
+                # Only the first occurrence counts, like Element.find().
+                self.values[self.fields[path]] = value
+        self.path = path[:-1]
+
+    def close(self):
+        return self
+
+class ResponseParser(object):
+    """Feed a response in chunks, then close() for (root tag, values).
+
+    fields maps element paths below the root, as tuples of local names, to
+    the key their text is stored under; lists does the same for repeated
+    elements, collecting every value. An error in the document is held
+    back until close(), so a parser fed as a response is read (see
+    AuthorizeNet.send) never fails the read itself."""
+    def __init__(self, fields, lists=None):
+        from lxml import etree
+        self.target = _Target(fields, lists or {})
+        self.parser = etree.XMLParser(target=self.target, resolve_entities=False)
+        self.error = None
+
+    def feed(self, data):
+        if self.error is not None:
+            return
+        try:
+            self.parser.feed(data)
+        except Exception, e:
+            self.error = e
+
+    def close(self):
+        if self.error is not None:
+            raise self.error
+        target = self.parser.close()
+        return target.root, target.values
+
+def parse(data, fields, lists=None):
+    parser = ResponseParser(fields, lists)
+    parser.feed(data)
+    return parser.close()
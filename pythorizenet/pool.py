@@ -0,0 +1,201 @@
+import httplib
+import select
+import socket
+import ssl
+import threading
+import time
+
+DEFAULT_POOL_SIZE = 10
+DEFAULT_IDLE_TIMEOUT = 60
+DEFAULT_WARM_UP_TIMEOUT = 10
+
+_ssl_context = None
+_ssl_context_lock = threading.Lock()
+
+def default_ssl_context():
+    """The SSL context shared by every connection in the process."""
+    # Loading the CA store takes tens of milliseconds; httplib would do it
+    # again for every connection.
+    global _ssl_context
+    if _ssl_context is None:
+        _ssl_context_lock.acquire()
+        try:
+            if _ssl_context is None:
+                _ssl_context = ssl.create_default_context()
+        finally:
+            _ssl_context_lock.release()
+    return _ssl_context
+
+def set_ssl_context(context):
+    """Use context for connections made from now on."""
+    global _ssl_context
+    _ssl_context = context
+
+class HTTPSConnection(httplib.HTTPSConnection):
+    """Records how long the TCP connect and the TLS handshake took."""
+    connect_time = None
+    tls_time = None
+
+    def connect(self):
+        started = time.time()
+        httplib.HTTPConnection.connect(self)
+        self.connect_time = time.time() - started
+        started = time.time()
+        self.sock = self._context.wrap_socket(self.sock, server_hostname=self.host)
+        self.tls_time = time.time() - started
+
+class ConnectionPool(object):
+    """Thread-safe pool of keep-alive HTTPS connections to a single host."""
+    def __init__(self, host, max_size=DEFAULT_POOL_SIZE, idle_timeout=DEFAULT_IDLE_TIMEOUT, ssl_context=None):
+        self.host = host
+        self.max_size = max_size
+        self.idle_timeout = idle_timeout
+        self.ssl_context = ssl_context
+        self.lock = threading.Lock()
+        self.idle = []
+
+    def _connect(self):
+        return HTTPSConnection(self.host, context=self.ssl_context or default_ssl_context())
+
+    def _is_stale(self, conn):
+        if conn.sock is None:
+            return True
+        # An idle keep-alive socket should never be readable. If it is, the
+        # gateway has either closed it or sent something we did not ask for.
+        try:
+            readable, writable, errored = select.select([conn.sock], [], [], 0)
+        except (select.error, socket.error, ValueError):
+            return True
+        if readable and isinstance(conn.sock, ssl.SSLSocket):
+            # TLS 1.3 servers send session tickets after the handshake, so a
+            # connection that has not been used yet can be readable with
+            # nothing in it for us.
+            timeout = conn.sock.gettimeout()
+            try:
+                conn.sock.settimeout(0)
+                conn.sock.recv(1)
+            except ssl.SSLWantReadError:
+                return False
+            except (ssl.SSLError, socket.error):
+                return True
+            finally:
+                if conn.sock is not None:
+                    conn.sock.settimeout(timeout)
+        return bool(readable)
+
+    def get(self):
+        """Return (conn, reused). Expired and stale sockets are discarded."""
+        now = time.time()
+        while True:
+            self.lock.acquire()
+            try:
+                if not self.idle:
+                    break
+                conn, last_used = self.idle.pop()
+            finally:
+                self.lock.release()
+            if now - last_used > self.idle_timeout or self._is_stale(conn):
+                conn.close()
+                continue
+            return conn, True
+        return self._connect(), False
+
+    def put(self, conn):
+        self.lock.acquire()
+        try:
+            if len(self.idle) < self.max_size:
+                self.idle.append((conn, time.time()))
+                return
+        finally:
+            self.lock.release()
+        conn.close()
+
+    def warm_up(self, count, timeout=DEFAULT_WARM_UP_TIMEOUT):
+        """Connect (and handshake) until count connections are idle, at most
+        max_size, in parallel. Returns how many were opened; failures are
+        left for the first real requests to run into."""
+        self.lock.acquire()
+        try:
+            missing = min(count, self.max_size) - len(self.idle)
+        finally:
+            self.lock.release()
+        opened = []
+        def connect():
+            conn = self._connect()
+            conn.timeout = timeout
+            try:
+                conn.connect()
+            except Exception:
+                # Certificate mismatches included: whatever it is, the
+                # request that needs the connection will run into it too.
+                conn.close()
+                return
+            opened.append(conn)
+            self.put(conn)
+        threads = [threading.Thread(target=connect) for i in xrange(max(0, missing))]
+        for thread in threads:
+            thread.daemon = True
+            thread.start()
+        for thread in threads:
+            thread.join()
+        return len(opened)
+
+    def evict(self):
+        """Close every idle connection that has outlived idle_timeout."""
+        now = time.time()
+        self.lock.acquire()
+        try:
+            expired = [conn for conn, last_used in self.idle if now - last_used > self.idle_timeout]
+            self.idle = [(conn, last_used) for conn, last_used in self.idle if now - last_used <= self.idle_timeout]
+        finally:
+            self.lock.release()
+        for conn in expired:
+            conn.close()
+
+    def close(self):
+        self.lock.acquire()
+        try:
+            idle, self.idle = self.idle, []
+        finally:
+            self.lock.release()
+        for conn, last_used in idle:
+            conn.close()
+
+_pools = {}
+_pools_lock = threading.Lock()
+
+def get_pool(host, max_size=DEFAULT_POOL_SIZE, idle_timeout=DEFAULT_IDLE_TIMEOUT):
+    """Return the pool shared by every client talking to host."""
+    _pools_lock.acquire()
+    try:
+        pool = _pools.get(host)
+        if pool is None:
+            pool = _pools[host] = ConnectionPool(host, max_size, idle_timeout)
+        return pool
+    finally:
+        _pools_lock.release()
+
+def set_pool(host, pool):
+    """Use pool for every client talking to host from now on."""
+    _pools_lock.acquire()
+    try:
+        previous = _pools.get(host)
+        _pools[host] = pool
+    finally:
+        _pools_lock.release()
+    if previous is not None and previous is not pool:
+        previous.close()
+
+def warm_up(host, count, timeout=DEFAULT_WARM_UP_TIMEOUT):
+    """Open count connections to host ahead of the first requests."""
+    return get_pool(host).warm_up(count, timeout)
+
+def close_pools():
+    _pools_lock.acquire()
+    try:
+        pools = _pools.values()
+        _pools.clear()
+    finally:
+        _pools_lock.release()
+    for pool in pools:
+        pool.close()
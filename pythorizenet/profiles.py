@@ -0,0 +1,130 @@
+"""A cache for CIM customer and payment profile lookups.
+
+    cache = ProfileCache(ttl=300, max_bytes=8 * 1024 * 1024)
+    customer = Customer(HOST_PROD, login, key)
+    customer.set_profile_cache(cache)
+    customer.set_profile_id(profile_id)
+    customer.get()          # gateway round trip
+    customer.get()          # served from the cache
+
+Successful getCustomerProfile and getCustomerPaymentProfile results are
+kept for ttl seconds. The least recently used are dropped once there are
+more than max_entries of them or their estimated size passes max_bytes.
+Customer.create, createPayment and createShipping drop every entry for
+the profile they change; AsyncCustomer shares the same lookups and drops
+entries once its requests complete. Changes made outside this process are
+only seen once the entry expires, so keep the ttl short if that matters.
+"""
+
+import sys
+import threading
+import time
+from collections import OrderedDict
+
+DEFAULT_TTL = 300
+DEFAULT_MAX_ENTRIES = 10000
+DEFAULT_MAX_BYTES = 16 * 1024 * 1024
+
+def _sizeof(result):
+    size = sys.getsizeof(result) + sys.getsizeof(result.__dict__)
+    for value in result.__dict__.itervalues():
+        size += sys.getsizeof(value)
+        if isinstance(value, list):
+            size += sum([sys.getsizeof(item) for item in value])
+    return size
+
+class ProfileCache(object):
+    def __init__(self, ttl=DEFAULT_TTL, max_entries=DEFAULT_MAX_ENTRIES, max_bytes=DEFAULT_MAX_BYTES):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.entries = OrderedDict()
+        # (login, profile_id) -> keys of every entry for that profile.
+        self.profiles = {}
+        self.size = 0
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    def get(self, login, profile_id, payment_profile_id=None):
+        key = (login, str(profile_id), payment_profile_id and str(payment_profile_id))
+        self.lock.acquire()
+        try:
+            entry = self.entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            result, size, expires = entry
+            if expires <= time.time():
+                self._remove(key)
+                self.misses += 1
+                return None
+            del self.entries[key]
+            self.entries[key] = entry
+            self.hits += 1
+            return result
+        finally:
+            self.lock.release()
+
+    def put(self, login, profile_id, payment_profile_id, result):
+        key = (login, str(profile_id), payment_profile_id and str(payment_profile_id))
+        size = _sizeof(result)
+        if size > self.max_bytes:
+            return
+        self.lock.acquire()
+        try:
+            if key in self.entries:
+                self._remove(key)
+            self.entries[key] = (result, size, time.time() + self.ttl)
+            self.profiles.setdefault(key[:2], set()).add(key)
+            self.size += size
+            while len(self.entries) > self.max_entries or self.size > self.max_bytes:
+                self._remove(iter(self.entries).next())
+                self.evictions += 1
+        finally:
+            self.lock.release()
+
+    def invalidate(self, login, profile_id):
+        """Drop the profile and every payment profile cached for it."""
+        self.lock.acquire()
+        try:
+            keys = self.profiles.get((login, str(profile_id)))
+            if keys:
+                for key in list(keys):
+                    self._remove(key)
+                self.invalidations += 1
+        finally:
+            self.lock.release()
+
+    def clear(self):
+        self.lock.acquire()
+        try:
+            self.entries.clear()
+            self.profiles.clear()
+            self.size = 0
+        finally:
+            self.lock.release()
+
+    def _remove(self, key):
+        result, size, expires = self.entries.pop(key)
+        self.size -= size
+        keys = self.profiles[key[:2]]
+        keys.discard(key)
+        if not keys:
+            del self.profiles[key[:2]]
+
+    def stats(self):
+        self.lock.acquire()
+        try:
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'invalidations': self.invalidations,
+                'entries': len(self.entries),
+                'bytes': self.size,
+            }
+        finally:
+            self.lock.release()
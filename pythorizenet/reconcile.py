@@ -0,0 +1,211 @@
+"""Reconcile large logs of raw AIM responses, one response per line.
+
+    totals = reconcile('responses.log', login, salt, processes=8)
+    save(totals, 'responses.npz')
+
+The log is memory-mapped and cut into chunks on line boundaries; each
+worker process maps the file itself and reads only its own chunk, so no
+response data is copied between processes. Workers check each response's
+MD5 hash (when a salt is given) and return per-chunk totals as arrays,
+which are then merged by transaction ID.
+
+The result has one row per transaction ID, sorted by ID, with the number
+and amount (in cents) of approved, declined and held responses, plus the
+number of errors, test-mode responses and hash mismatches. Lines whose
+transaction ID is not a number are counted as errors under ID 0, the ID
+the gateway gives requests it turned down outright. save() writes
+it as a compressed column-per-array .npz file and load() reads it back.
+
+NumPy is needed (pip install pythorizenet[bulk]); it is imported on first
+use. From the command line:
+
+    python -m pythorizenet.reconcile responses.log -o totals.npz --login L --salt S
+"""
+
+import mmap
+import multiprocessing
+import os
+
+from pythorizenet.aim import FIELD_DELIM, TESTING_PREFIX, HashVerifier
+
+COUNT_COLUMNS = ('approved', 'declined', 'held', 'errors', 'test', 'bad_hash')
+CENTS_COLUMNS = ('approved_cents', 'declined_cents', 'held_cents')
+COLUMNS = ('transaction_id',) + COUNT_COLUMNS + CENTS_COLUMNS
+CHUNKS_PER_PROCESS = 4
+
+# Response code -> (count column, amount column)
+_CODES = {'1': (0, 6), '2': (1, 7), '4': (2, 8)}
+
+def _numpy():
+    try:
+        import numpy
+    except ImportError:
+        raise Exception('numpy is required for reconciliation!')
+    return numpy
+
+def _cents(amount):
+    if not amount:
+        return 0
+    sign = 1
+    if amount[0] in '+-':
+        if amount[0] == '-':
+            sign = -1
+        amount = amount[1:]
+    dollars, dot, cents = amount.partition('.')
+    if not (dollars + cents).isdigit():
+        raise ValueError('Bad amount %r!' % amount)
+    return sign * (int(dollars or 0) * 100 + int((cents + '00')[:2]))
+
+def split(path, chunks):
+    """Return (start, end) byte ranges covering path, cut after newlines."""
+    size = os.path.getsize(path)
+    if size == 0:
+        return []
+    source = open(path, 'rb')
+    try:
+        data = mmap.mmap(source.fileno(), 0, access=mmap.ACCESS_READ)
+        try:
+            ranges = []
+            start = 0
+            for index in xrange(1, chunks + 1):
+                end = size * index // chunks
+                if end < size:
+                    end = data.find('\n', max(end, start))
+                    end = size if end == -1 else end + 1
+                if end > start:
+                    ranges.append((start, end))
+                    start = end
+                if start >= size:
+                    break
+            return ranges
+        finally:
+            data.close()
+    finally:
+        source.close()
+
+def reconcile_chunk(path, start, end, delim=FIELD_DELIM, login=None, salt=None):
+    """Totals for the responses in path[start:end], as a dict of arrays."""
+    numpy = _numpy()
+    verifier = None
+    if salt is not None:
+        verifier = HashVerifier(login or '', salt)
+    totals = {}
+    source = open(path, 'rb')
+    try:
+        data = mmap.mmap(source.fileno(), 0, access=mmap.ACCESS_READ)
+        try:
+            data.seek(start)
+            readline = data.readline
+            while data.tell() < end:
+                line = readline().rstrip('\r\n')
+                if not line:
+                    continue
+                fields = line.split(delim)
+                trans_id = len(fields) > 6 and fields[6] or '0'
+                numeric = trans_id.isdigit()
+                if not numeric:
+                    # Not from the gateway: an error against no transaction
+                    # rather than totals that would merge into another's.
+                    trans_id = '0'
+                row = totals.get(trans_id)
+                if row is None:
+                    row = totals[trans_id] = [0] * 9
+                columns = _CODES.get(fields[0])
+                try:
+                    if columns is None or len(fields) < 10 or not numeric:
+                        raise ValueError
+                    cents = _cents(fields[9])
+                except ValueError:
+                    row[3] += 1
+                    continue
+                row[columns[0]] += 1
+                row[columns[1]] += cents
+                if fields[3].startswith(TESTING_PREFIX):
+                    row[4] += 1
+                if verifier is not None:
+                    received = len(fields) > 37 and fields[37] or ''
+                    if received.upper() != verifier.hash(fields[6], fields[9]):
+                        row[5] += 1
+        finally:
+            data.close()
+    finally:
+        source.close()
+    ids = numpy.array([int(trans_id) for trans_id in totals], dtype=numpy.uint64)
+    values = numpy.array(totals.values(), dtype=numpy.int64).reshape(len(totals), 9)
+    result = {'transaction_id': ids}
+    for index, name in enumerate(COUNT_COLUMNS + CENTS_COLUMNS):
+        result[name] = values[:, index]
+    return result
+
+def _work(args):
+    return reconcile_chunk(*args)
+
+def merge(partials):
+    """Combine chunk totals into one row per transaction ID."""
+    numpy = _numpy()
+    partials = [partial for partial in partials if len(partial['transaction_id'])]
+    if not partials:
+        merged = {'transaction_id': numpy.zeros(0, dtype=numpy.uint64)}
+        for name in COUNT_COLUMNS + CENTS_COLUMNS:
+            merged[name] = numpy.zeros(0, dtype=numpy.int64)
+        return merged
+    ids = numpy.concatenate([partial['transaction_id'] for partial in partials])
+    order = numpy.argsort(ids, kind='mergesort')
+    ids = ids[order]
+    starts = numpy.concatenate(([0], numpy.flatnonzero(ids[1:] != ids[:-1]) + 1))
+    merged = {'transaction_id': ids[starts]}
+    for name in COUNT_COLUMNS + CENTS_COLUMNS:
+        column = numpy.concatenate([partial[name] for partial in partials])[order]
+        merged[name] = numpy.add.reduceat(column, starts)
+    for name in COUNT_COLUMNS:
+        merged[name] = merged[name].astype(numpy.uint32)
+    return merged
+
+def reconcile(path, login=None, salt=None, delim=FIELD_DELIM, processes=None, chunks=None):
+    """Reconcile the log at path with a pool of worker processes."""
+    if processes is None:
+        processes = multiprocessing.cpu_count()
+    if chunks is None:
+        chunks = processes * CHUNKS_PER_PROCESS
+    jobs = [(path, start, end, delim, login, salt) for start, end in split(path, chunks)]
+    if processes == 1:
+        return merge(map(_work, jobs))
+    pool = multiprocessing.Pool(processes)
+    try:
+        return merge(pool.imap_unordered(_work, jobs))
+    finally:
+        pool.close()
+        pool.join()
+
+def save(totals, path):
+    _numpy().savez_compressed(path, **totals)
+
+def load(path):
+    archive = _numpy().load(path)
+    try:
+        return dict((name, archive[name]) for name in archive.files)
+    finally:
+        archive.close()
+
+def main():
+    import optparse
+    parser = optparse.OptionParser(usage='%prog [options] LOG')
+    parser.add_option('-o', '--output', help='write the totals to this .npz file')
+    parser.add_option('--login', default='')
+    parser.add_option('--salt', help='MD5 hash salt; hashes are not checked without it')
+    parser.add_option('--delim', default=FIELD_DELIM)
+    parser.add_option('-j', '--processes', type='int', default=None)
+    options, args = parser.parse_args()
+    if len(args) != 1:
+        parser.error('You must provide the log to reconcile!')
+    totals = reconcile(args[0], options.login, options.salt, options.delim, options.processes)
+    print '%d transactions' % len(totals['transaction_id'])
+    for name in COUNT_COLUMNS:
+        print '%-10s %d' % (name, totals[name].sum())
+    for name in CENTS_COLUMNS:
+        print '%-15s %.2f' % (name, totals[name].sum() / 100.0)
+    if options.output:
+        save(totals, options.output)
+
+if __name__ == '__main__':
+    main()
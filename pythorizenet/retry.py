@@ -0,0 +1,162 @@
+"""Retry policy and per-host circuit breakers for gateway calls.
+
+A payment request must never be sent twice by accident, so RetryPolicy
+only retries a call that failed before the gateway could have acted on
+it: the connection could not be made (refused, timed out, reset during
+the handshake), the gateway turned the request away unseen (Refused), or
+a kept-alive socket turned out to be closed while the request was being
+written. Once the whole request has gone out the gateway may have acted
+on it, so anything that goes wrong from then on, even the connection
+closing without a byte of response, is raised.
+
+Every host has a CircuitBreaker. After `threshold` consecutive network
+failures (not counting stale sockets, nor timeouts that only mean the
+caller's own deadline ran out) it opens and calls fail fast with
+CircuitOpen for reset_timeout seconds; then a single trial call is let
+through, closing the circuit again if it succeeds. A trial that ends
+without telling either way, or takes longer than reset_timeout, makes
+way for another.
+"""
+
+import httplib
+import socket
+import ssl
+import threading
+import time
+
+STAGE_CONNECT = 'connect'
+STAGE_SEND = 'send'
+STAGE_WAIT = 'wait'
+STAGE_READ = 'read'
+
+DEFAULT_ATTEMPTS = 3
+DEFAULT_BACKOFF = 0.1
+DEFAULT_MAX_BACKOFF = 2.0
+DEFAULT_THRESHOLD = 5
+DEFAULT_RESET_TIMEOUT = 30
+DEADLINE_SLACK = 0.01
+
+CIRCUIT_CLOSED = 'closed'
+CIRCUIT_OPEN = 'open'
+CIRCUIT_HALF_OPEN = 'half-open'
+
+class CircuitOpen(socket.error):
+    pass
+
+class Refused(socket.error):
+    """The gateway turned the request away without acting on it, such as
+    an HTTP/2 stream it refused. It is sent again, but as a counted attempt
+    after a backoff, and counts against the circuit breaker: a gateway
+    that keeps refusing is not a healthy one."""
+
+def is_stale(error, stage, reused):
+    """True if a kept-alive socket turned out to be closed while the
+    request was being written to it."""
+    return reused and stage == STAGE_SEND and not isinstance(error, (socket.timeout, Refused))
+
+def deadline_exceeded(error, deadline):
+    """True if error is a timeout from running out of the caller's deadline,
+    which says nothing about the gateway's health."""
+    # Socket timeouts may fire a little early, poll() rounds to milliseconds.
+    return isinstance(error, socket.timeout) and deadline is not None and time.time() >= deadline - DEADLINE_SLACK
+
+class RetryPolicy(object):
+    def __init__(self, attempts=DEFAULT_ATTEMPTS, backoff=DEFAULT_BACKOFF, max_backoff=DEFAULT_MAX_BACKOFF):
+        self.attempts = attempts
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+
+    def retryable(self, error, stage, reused):
+        if isinstance(error, CircuitOpen):
+            return False
+        if isinstance(error, Refused):
+            return True
+        if stage == STAGE_CONNECT:
+            # A certificate or protocol mismatch will not fix itself.
+            return isinstance(error, socket.error) and (isinstance(error, socket.timeout) or not isinstance(error, ssl.SSLError))
+        return is_stale(error, stage, reused)
+
+    def delay(self, attempt):
+        """Seconds to wait before the given (1-based) retry."""
+        return min(self.max_backoff, self.backoff * (2 ** (attempt - 1)))
+
+NO_RETRY = RetryPolicy(attempts=1)
+
+class CircuitBreaker(object):
+    def __init__(self, host, threshold=DEFAULT_THRESHOLD, reset_timeout=DEFAULT_RESET_TIMEOUT):
+        self.host = host
+        self.threshold = threshold
+        self.reset_timeout = reset_timeout
+        self.state = CIRCUIT_CLOSED
+        self.failures = 0
+        self.opened = None
+        # When the trial call in flight was let through, if there is one.
+        self.trial = None
+        self.lock = threading.Lock()
+
+    def allow(self):
+        """Raise CircuitOpen unless a call may go to the host now."""
+        self.lock.acquire()
+        try:
+            if self.state == CIRCUIT_CLOSED:
+                return
+            now = time.time()
+            if self.state == CIRCUIT_OPEN and now - self.opened >= self.reset_timeout:
+                self.state = CIRCUIT_HALF_OPEN
+                self.trial = None
+            if self.state == CIRCUIT_HALF_OPEN and (self.trial is None or now - self.trial >= self.reset_timeout):
+                self.trial = now
+                return
+        finally:
+            self.lock.release()
+        raise CircuitOpen('Circuit for %s is open, failing fast!' % self.host)
+
+    def success(self):
+        self.lock.acquire()
+        try:
+            self.state = CIRCUIT_CLOSED
+            self.failures = 0
+            self.trial = None
+        finally:
+            self.lock.release()
+
+    def failure(self):
+        self.lock.acquire()
+        try:
+            self.failures += 1
+            if self.state == CIRCUIT_HALF_OPEN or self.failures >= self.threshold:
+                self.state = CIRCUIT_OPEN
+                self.opened = time.time()
+                self.trial = None
+        finally:
+            self.lock.release()
+
+    def release(self):
+        """The call let through ended without saying anything about the
+        host's health; let another one through in its place."""
+        self.lock.acquire()
+        try:
+            self.trial = None
+        finally:
+            self.lock.release()
+
+_breakers = {}
+_breakers_lock = threading.Lock()
+
+def get_breaker(host):
+    """Return the circuit breaker shared by every client talking to host."""
+    _breakers_lock.acquire()
+    try:
+        breaker = _breakers.get(host)
+        if breaker is None:
+            breaker = _breakers[host] = CircuitBreaker(host)
+        return breaker
+    finally:
+        _breakers_lock.release()
+
+def set_breaker(host, breaker):
+    _breakers_lock.acquire()
+    try:
+        _breakers[host] = breaker
+    finally:
+        _breakers_lock.release()
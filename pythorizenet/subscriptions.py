@@ -0,0 +1,252 @@
+"""Stream ARB subscription creates and updates from a CSV or JSONL file.
+
+    pipeline = SubscriptionImport(HOST_PROD, login, key, 'subscriptions.csv',
+        'results.csv', checkpoint='results.checkpoint', concurrency=16)
+    stats = pipeline.run()
+
+Rows are read one at a time and each is turned into a Recurring request
+only when a worker picks it up, so memory use does not depend on the size
+of the file. Results are appended to `output` in input order as they
+complete, one line per row, and running the same import again carries on
+after the last complete row in the output. With a checkpoint file the
+position is also saved every checkpoint_every rows, so a resumed run only
+rescans the output written since.
+
+Rows that were in flight when a run died are sent again on resume. The
+gateway rejects a duplicate of an existing subscription and updates are
+idempotent, so this is safe for both actions.
+
+The source is read as UTF-8 unless another encoding is given.
+
+Columns (CSV header or JSON keys), all optional except what the gateway
+needs for the action:
+
+    action              create, update or cancel (default: `action`)
+    subscription_id     required for update and cancel
+    amount, card_num, exp_year, exp_month
+    start_date          YYYY-MM-DD
+    length, unit        billing interval (default 1 months)
+    occurrences         total occurrences (default ongoing)
+    trial_occurrences, trial_amount
+    first_name, last_name, company, address, city, state, zip, country
+"""
+
+import csv
+import datetime
+import json
+import os
+from collections import OrderedDict
+
+from pythorizenet.arb import Recurring, PERIOD_ONGOING, UNIT_MONTH
+from pythorizenet.batch import Batch, DEFAULT_CONCURRENCY
+
+FORMAT_CSV = 'csv'
+FORMAT_JSONL = 'jsonl'
+ACTIONS = ('create', 'update', 'cancel')
+OUTPUT_COLUMNS = ('row', 'action', 'subscription_id', 'result_code', 'code', 'reason', 'error')
+DEFAULT_CHECKPOINT_EVERY = 100
+# UTF-8, skipping the byte order mark Excel writes before the header.
+DEFAULT_ENCODING = 'utf-8-sig'
+
+def _format(path, format):
+    if format is not None:
+        return format
+    if os.path.splitext(path)[1].lower() == '.csv':
+        return FORMAT_CSV
+    return FORMAT_JSONL
+
+def _decode(value, encoding):
+    if isinstance(value, str):
+        return value.decode(encoding)
+    if isinstance(value, list):
+        return [_decode(item, encoding) for item in value]
+    return value
+
+def read_rows(path, format=None, skip=0, encoding=DEFAULT_ENCODING):
+    """Yield each row of a CSV or JSONL file as a dict of unicode strings,
+    after the first skip. The file is decoded with encoding."""
+    format = _format(path, format)
+    source = open(path, 'rb')
+    try:
+        if format == FORMAT_CSV:
+            rows = (dict((_decode(name, encoding), _decode(value, encoding)) for name, value in row.iteritems())
+                for row in csv.DictReader(source))
+        else:
+            rows = (json.loads(line.decode(encoding)) for line in source if line.strip())
+        for index, row in enumerate(rows):
+            if index >= skip:
+                yield row
+    finally:
+        source.close()
+
+class _Row(object):
+    """A row that becomes a Recurring request once a worker runs it."""
+    __slots__ = ('pipeline', 'number', 'row')
+
+    def __init__(self, pipeline, number, row):
+        self.pipeline = pipeline
+        self.number = number
+        self.row = row
+
+    def create(self):
+        return self.pipeline.recurring(self.row).create()
+
+    def update(self):
+        return self.pipeline.recurring(self.row).update()
+
+    def cancel(self):
+        return self.pipeline.recurring(self.row).cancel()
+
+class SubscriptionImport(object):
+    def __init__(self, host, login, key, source, output, checkpoint=None, action='create',
+            concurrency=DEFAULT_CONCURRENCY, format=None, output_format=None,
+            checkpoint_every=DEFAULT_CHECKPOINT_EVERY, encoding=DEFAULT_ENCODING):
+        if action not in ACTIONS:
+            raise Exception('Unknown subscription action %s!' % action)
+        self.host = host
+        self.login = login
+        self.key = key
+        self.source = source
+        self.format = _format(source, format)
+        self.encoding = encoding
+        self.output = output
+        self.output_format = _format(output, output_format)
+        self.checkpoint = checkpoint
+        self.checkpoint_every = checkpoint_every
+        self.action = action
+        self.concurrency = concurrency
+        self.stats = None
+
+    def recurring(self, row):
+        """Build the Recurring request for one input row."""
+        get = lambda name: row.get(name) or None
+        recurring = Recurring(self.host, self.login, self.key)
+        if get('subscription_id'):
+            recurring.set_subscription_id(get('subscription_id'))
+        if get('start_date') or get('occurrences') or get('length'):
+            start = None
+            if get('start_date'):
+                # strptime is not safe to call first from several threads
+                # at once on Python 2.
+                year, month, day = get('start_date').split('-')
+                start = datetime.datetime(int(year), int(month), int(day))
+            recurring.set_schedule(int(get('occurrences') or PERIOD_ONGOING), start,
+                int(get('length') or 1), get('unit') or UNIT_MONTH)
+        if get('amount'):
+            recurring.set_amount(get('amount'))
+        if get('trial_occurrences'):
+            recurring.set_trial(int(get('trial_occurrences')), get('trial_amount') or '0.00')
+        if get('card_num'):
+            recurring.set_credit(get('card_num'), [get('exp_year') or '', get('exp_month') or ''])
+        if get('first_name') or get('last_name'):
+            recurring.set_customer(get('first_name'), get('last_name'), get('company'), get('address'),
+                get('city'), get('state'), get('zip'), get('country'))
+        return recurring
+
+    def _resume(self):
+        """Return (rows already done, output size to keep)."""
+        rows, offset = 0, 0
+        if self.checkpoint and os.path.exists(self.checkpoint):
+            state = json.load(open(self.checkpoint))
+            rows, offset = state['rows'], state['offset']
+        if not os.path.exists(self.output):
+            if rows:
+                raise Exception('Checkpoint %s has no output file %s!' % (self.checkpoint, self.output))
+            return 0, 0
+        output = open(self.output, 'rb')
+        try:
+            if offset == 0 and self.output_format == FORMAT_CSV:
+                header = output.readline()
+                if header.endswith('\n'):
+                    offset = output.tell()
+            output.seek(offset)
+            # Rows written after the last checkpoint are done too; a partly
+            # written last line is not.
+            for line in output:
+                if not line.endswith('\n'):
+                    break
+                rows += 1
+                offset += len(line)
+        finally:
+            output.close()
+        return rows, offset
+
+    def _save(self, rows, offset):
+        if not self.checkpoint:
+            return
+        temp = self.checkpoint + '.tmp'
+        out = open(temp, 'wb')
+        try:
+            json.dump({'source': self.source, 'rows': rows, 'offset': offset}, out)
+        finally:
+            out.close()
+        os.rename(temp, self.checkpoint)
+
+    def _values(self, item):
+        row = item.transaction.row
+        values = {
+            'row': item.transaction.number,
+            'action': item.operation,
+            'subscription_id': row.get('subscription_id') or '',
+            'result_code': '',
+            'code': '',
+            'reason': '',
+            'error': '',
+        }
+        if item.error is not None:
+            values['error'] = str(item.error)
+        else:
+            result = item.result
+            values['result_code'] = result.resultCode
+            values['code'] = result.code or ''
+            values['reason'] = result.reason or ''
+            if result.subscription_id:
+                values['subscription_id'] = result.subscription_id
+        return values
+
+    def _write(self, output, writer, item):
+        values = self._values(item)
+        if writer is None:
+            output.write(json.dumps(OrderedDict((name, values[name]) for name in OUTPUT_COLUMNS)) + '\n')
+            return
+        fields = []
+        for name in OUTPUT_COLUMNS:
+            value = values[name]
+            if isinstance(value, unicode):
+                value = value.encode('utf-8')
+            # One line per row, so a resumed run can count them.
+            fields.append(str(value).replace('\r', ' ').replace('\n', ' '))
+        writer.writerow(fields)
+
+    def _jobs(self, skip):
+        for number, row in enumerate(read_rows(self.source, self.format, skip, self.encoding), skip + 1):
+            action = row.get('action') or self.action
+            yield _Row(self, number, row), action
+
+    def run(self):
+        """Run (or resume) the import and return the BatchStats."""
+        done, offset = self._resume()
+        output = open(self.output, 'ab')
+        try:
+            output.truncate(offset)
+            output.seek(offset)
+            writer = None
+            if self.output_format == FORMAT_CSV:
+                writer = csv.writer(output, lineterminator='\n')
+                if offset == 0:
+                    writer.writerow(OUTPUT_COLUMNS)
+            batch = Batch(self._jobs(done), concurrency=self.concurrency, ordered=True)
+            self.stats = batch.stats
+            since = 0
+            for item in batch:
+                self._write(output, writer, item)
+                output.flush()
+                done += 1
+                since += 1
+                if since >= self.checkpoint_every:
+                    self._save(done, output.tell())
+                    since = 0
+            self._save(done, output.tell())
+        finally:
+            output.close()
+        return self.stats
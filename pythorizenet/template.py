@@ -0,0 +1,224 @@
+"""Precompiled XML request templates.
+
+A request shape is described once with text(), opt(), group() and
+repeat(), and compiled into a Python function in which every run of
+constant markup is a single string literal. Rendering a request then only
+escapes and joins the values, with output byte-identical to building the
+same tree with lxml and serializing it with
+etree.tostring(root, xml_declaration=True, encoding='utf-8').
+
+Template.stream() renders the same bytes as a sequence of chunks instead,
+so a large document can be sent without ever holding all of it.
+"""
+
+import re
+
+XML_DECLARATION = "<?xml version='1.0' encoding='utf-8'?>\n"
+# Fragments rendered between the chunks a streamed document is cut into.
+STREAM_FRAGMENTS = 1024
+INVALID_STRING = 'All strings must be XML compatible: Unicode or ASCII, no NULL bytes or control characters'
+
+_special = re.compile('[&<>\r\x00-\x08\x0b\x0c\x0e-\x1f\x80-\xff]')
+_invalid = re.compile(u'[\x00-\x08\x0b\x0c\x0e-\x1f]')
+
+NODE_TEXT = 0
+NODE_OPT = 1
+NODE_GROUP = 2
+NODE_REPEAT = 3
+
+def escape(value):
+    """Escape a text value the way lxml does, returning UTF-8 bytes."""
+    if value.__class__ is str:
+        if _special.search(value) is None:
+            return value
+        try:
+            value.decode('ascii')
+        except UnicodeDecodeError:
+            raise ValueError(INVALID_STRING)
+    elif isinstance(value, unicode):
+        value = value.encode('utf-8')
+        if _special.search(value) is None:
+            return value
+    elif isinstance(value, str):
+        return escape(str(value))
+    else:
+        raise TypeError('Element text must be a string, not %s' % type(value).__name__)
+    if _invalid.search(value):
+        raise ValueError(INVALID_STRING)
+    return value.replace('&', '&amp;').replace('<', '&lt;').replace('>', '&gt;').replace('\r', '&#13;')
+
+def text(tag, key):
+    """An element that is always present; None renders as <tag/>."""
+    return (NODE_TEXT, tag, key, None)
+
+def opt(tag, key):
+    """An element that is left out when its value is None."""
+    return (NODE_OPT, tag, key, None)
+
+def group(tag, children, when=None):
+    """A container element, left out unless `when` is true (if given)."""
+    return (NODE_GROUP, tag, when, children)
+
+def repeat(tag, key, children):
+    """A container element rendered once per dict in the list at key."""
+    return (NODE_REPEAT, tag, key, children)
+
+ADDRESS = [
+    text('firstName', 'firstName'),
+    text('lastName', 'lastName'),
+    opt('company', 'company'),
+    opt('address', 'address'),
+    opt('city', 'city'),
+    opt('state', 'state'),
+    opt('zip', 'zip'),
+    opt('country', 'country'),
+]
+
+def address_values(first_name, last_name, company=None, address=None, city=None, state=None, zip=None, country=None):
+    """Values for ADDRESS; optional parts are only sent when set."""
+    values = {'firstName': first_name, 'lastName': last_name}
+    if company:
+        values['company'] = company
+    if address:
+        values['address'] = address
+    if city:
+        values['city'] = city
+    if state:
+        values['state'] = state
+    if zip:
+        values['zip'] = zip
+    if country:
+        values['country'] = country
+    return values
+
+def _never_empty(node):
+    kind, tag, key, children = node
+    if kind == NODE_TEXT:
+        return True
+    return kind == NODE_GROUP and key is None and _has_content(children)
+
+def _has_content(children):
+    return any(_never_empty(child) for child in children)
+
+class _Compiler(object):
+    def __init__(self, streaming=False):
+        self.lines = []
+        self.pending = ''
+        self.names = 0
+        self.streaming = streaming
+
+    def name(self, prefix):
+        self.names += 1
+        return '%s%d' % (prefix, self.names)
+
+    def emit(self, depth, line):
+        self.lines.append('    ' * depth + line)
+
+    def flush(self, depth):
+        if self.pending:
+            self.emit(depth, 'append(%r)' % self.pending)
+            self.pending = ''
+
+    def nodes(self, depth, nodes, values):
+        for node in nodes:
+            kind, tag, key, children = node
+            if kind == NODE_TEXT:
+                # Constant markup before the element is folded into both
+                # branches, so the element costs a single append.
+                self.emit(depth, 'value = %s.get(%r)' % (values, key))
+                self.emit(depth, 'if value is None:')
+                self.emit(depth + 1, 'append(%r)' % (self.pending + '<%s/>' % tag))
+                self.emit(depth, 'else:')
+                self.emit(depth + 1, 'append(%r + escape(value) + %r)' % (self.pending + '<%s>' % tag, '</%s>' % tag))
+                self.pending = ''
+            elif kind == NODE_OPT:
+                self.flush(depth)
+                self.emit(depth, 'value = %s.get(%r)' % (values, key))
+                self.emit(depth, 'if value is not None:')
+                self.emit(depth + 1, 'append(%r + escape(value) + %r)' % ('<%s>' % tag, '</%s>' % tag))
+            elif kind == NODE_GROUP:
+                if key is None:
+                    self.element(depth, node, values)
+                else:
+                    self.flush(depth)
+                    self.emit(depth, 'if %s.get(%r):' % (values, key))
+                    self.element(depth + 1, node, values)
+                    self.flush(depth + 1)
+            else:
+                self.flush(depth)
+                item = self.name('item')
+                self.emit(depth, 'for %s in %s.get(%r) or ():' % (item, values, key))
+                self.element(depth + 1, node, item)
+                self.flush(depth + 1)
+                if self.streaming:
+                    # Only repeated elements make a document large.
+                    self.emit(depth + 1, 'if len(out) >= %d:' % STREAM_FRAGMENTS)
+                    self.emit(depth + 2, 'sent += len(out)')
+                    self.emit(depth + 2, "yield ''.join(out)")
+                    self.emit(depth + 2, 'del out[:]')
+
+    def element(self, depth, node, values, start=None, empty=None):
+        kind, tag, key, children = node
+        if start is None:
+            start = '<%s>' % tag
+            empty = '<%s/>' % tag
+        if _has_content(children):
+            self.pending += start
+            self.nodes(depth, children, values)
+            self.pending += '</%s>' % tag
+            return
+        # lxml writes a childless element as <tag/>, which is only known
+        # once the children have been rendered.
+        self.flush(depth)
+        mark = self.name('mark')
+        # Streaming keeps count of the fragments already sent; if any were
+        # sent since the mark, the element had children.
+        length = self.streaming and 'sent + len(out)' or 'len(out)'
+        self.emit(depth, '%s = %s' % (mark, length))
+        self.emit(depth, 'append(%r)' % start)
+        self.nodes(depth, children, values)
+        self.flush(depth)
+        self.emit(depth, 'if %s == %s + 1:' % (length, mark))
+        self.emit(depth + 1, 'out[-1] = %r' % empty)
+        self.emit(depth, 'else:')
+        self.emit(depth + 1, 'append(%r)' % ('</%s>' % tag))
+
+def _compile(tag, attrs, children, streaming):
+    compiler = _Compiler(streaming)
+    compiler.emit(0, 'def render(values):')
+    compiler.emit(1, 'out = []')
+    compiler.emit(1, 'append = out.append')
+    if streaming:
+        compiler.emit(1, 'sent = 0')
+    compiler.element(1, (NODE_GROUP, tag, None, children), 'values',
+        '%s<%s%s>' % (XML_DECLARATION, tag, attrs), '%s<%s%s/>' % (XML_DECLARATION, tag, attrs))
+    compiler.flush(1)
+    if streaming:
+        compiler.emit(1, "yield ''.join(out)")
+    else:
+        compiler.emit(1, "return ''.join(out)")
+    source = '\n'.join(compiler.lines) + '\n'
+    namespace = {'escape': escape}
+    exec compile(source, '<template %s>' % tag, 'exec') in namespace
+    return source, namespace['render']
+
+class Stream(object):
+    """A rendered document as an iterable of chunks. Every iteration renders
+    it again, so only one chunk is held in memory at a time."""
+    def __init__(self, render, values):
+        self.render = render
+        self.values = values
+
+    def __iter__(self):
+        return self.render(self.values)
+
+class Template(object):
+    def __init__(self, tag, xmlns, children):
+        self.tag = tag
+        attrs = ' xmlns="%s"' % escape(xmlns).replace('"', '&quot;')
+        self.source, self.render = _compile(tag, attrs, children, False)
+        self.stream_source, self._stream = _compile(tag, attrs, children, True)
+
+    def stream(self, values):
+        """The same document as render(values), as a Stream of chunks."""
+        return Stream(self._stream, values)
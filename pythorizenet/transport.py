@@ -0,0 +1,245 @@
+"""The wire under AuthorizeNet.
+
+A transport carries single request attempts to one host; AuthorizeNet
+layers deadlines, retries, the circuit breaker and limits on top. Every
+client for a host uses the transport registered with set_transport(), a
+PooledTransport unless told otherwise:
+
+    set_transport(HOST_PROD, HTTP2Transport(HOST_PROD))
+
+PooledTransport keeps HTTP/1.1 connections alive in the host's
+ConnectionPool, BlockingTransport opens a new connection for every request
+and closes it afterwards, and pythorizenet.http2.HTTP2Transport multiplexes
+concurrent requests over one HTTP/2 connection.
+
+To write another, subclass Transport and implement request(). It must keep
+progress up to date for the retry policy: progress[0] is the STAGE_* the
+attempt has reached, progress[1] the HTTP status once known and
+progress[2] whether the attempt went out on a connection that had been
+used before.
+"""
+
+import socket
+import threading
+import time
+
+from pythorizenet.compression import Body
+from pythorizenet.pool import HTTPSConnection, default_ssl_context, get_pool
+from pythorizenet.retry import STAGE_SEND, STAGE_WAIT, STAGE_READ
+
+READ_SIZE = 65536
+
+def budget(timeout, deadline):
+    """timeout cut down to what is left before deadline."""
+    if deadline is None:
+        return timeout
+    remaining = deadline - time.time()
+    if remaining <= 0:
+        raise socket.timeout('Gateway request deadline exceeded!')
+    if timeout is None:
+        return remaining
+    return min(timeout, remaining)
+
+class Transport(object):
+    def request(self, client, data, deadline, timing, progress, fresh=False, headers=(), feed=None):
+        """POST data to client.path as client.mime, with any extra headers,
+        and return (status, body), the body decoded by its Content-Encoding
+        (see pythorizenet.compression). If feed is given, the body is passed
+        to it piece by piece as it is read instead, and None returned in its
+        place. fresh asks for a connection that has not been used before,
+        because the last one turned out to be closed."""
+        raise NotImplementedError
+
+    def warm_up(self, count, timeout):
+        """Open up to count connections ahead of time; return how many."""
+        return 0
+
+    def close(self):
+        pass
+
+class PooledTransport(Transport):
+    """HTTP/1.1 with keep-alive connections from a ConnectionPool, by
+    default the one get_pool() returns for the host at the time."""
+    def __init__(self, host, pool=None):
+        self.host = host
+        self._pool = pool
+
+    @property
+    def pool(self):
+        if self._pool is not None:
+            return self._pool
+        return get_pool(self.host)
+
+    def _get(self, fresh):
+        pool = self.pool
+        if fresh:
+            return pool._connect(), False
+        return pool.get()
+
+    def _done(self, conn, response):
+        if response.will_close:
+            conn.close()
+        else:
+            self.pool.put(conn)
+
+    def request(self, client, data, deadline, timing, progress, fresh=False, headers=(), feed=None):
+        conn, reused = self._get(fresh)
+        progress[2] = reused
+        if timing is not None:
+            timing.reused = reused
+        try:
+            if conn.sock is None:
+                self._connect(client, conn, deadline, timing)
+            progress[0] = STAGE_SEND
+            self._write(client, conn, data, deadline, timing, headers)
+            progress[0] = STAGE_WAIT
+            response = self._wait(conn, timing)
+            progress[0] = STAGE_READ
+            body = self._read(client, conn, response, deadline, timing, feed)
+        except:
+            conn.close()
+            raise
+        progress[1] = response.status
+        self._done(conn, response)
+        return response.status, body
+
+    def _connect(self, client, conn, deadline, timing):
+        conn.timeout = budget(client.connect_timeout, deadline)
+        if timing is None:
+            conn.connect()
+            return
+        started = time.time()
+        conn.connect()
+        timing.connect = time.time() - started
+        tls = getattr(conn, 'tls_time', None)
+        if tls is not None:
+            timing.connect -= tls
+            timing.tls = tls
+
+    def _write(self, client, conn, data, deadline, timing, headers):
+        conn.sock.settimeout(budget(client.read_timeout, deadline))
+        if timing is not None:
+            started = time.time()
+        # httplib asks for identity unless told we ask for something else.
+        conn.putrequest('POST', client.path, skip_accept_encoding='accept-encoding' in dict(headers))
+        conn.putheader('content-type', client.mime)
+        for name, value in headers:
+            conn.putheader(name, value)
+        if isinstance(data, str):
+            conn.putheader('content-length', len(data))
+            # Headers and body in one write, or Nagle and delayed ACKs stall
+            # every request on a kept-alive socket.
+            conn.endheaders(data)
+        else:
+            self._write_chunked(conn, data)
+        if timing is not None:
+            timing.upload = time.time() - started
+
+    def _write_chunked(self, conn, data):
+        conn.putheader('transfer-encoding', 'chunked')
+        # Each chunk is held back until the next one is rendered, so the
+        # last goes out with the terminating chunk instead of in a small
+        # write of its own, which Nagle and delayed ACKs would stall.
+        write = conn.endheaders
+        previous = None
+        for chunk in data:
+            if not chunk:
+                continue
+            if previous is not None:
+                write('%x\r\n%s\r\n' % (len(previous), previous))
+                write = conn.send
+            previous = chunk
+        if previous is None:
+            write('0\r\n\r\n')
+        else:
+            write('%x\r\n%s\r\n0\r\n\r\n' % (len(previous), previous))
+
+    def _wait(self, conn, timing):
+        if timing is None:
+            return conn.getresponse()
+        started = time.time()
+        response = conn.getresponse()
+        timing.wait = time.time() - started
+        return response
+
+    def _read(self, client, conn, response, deadline, timing, feed):
+        if timing is not None:
+            started = time.time()
+        encoding = response.getheader('content-encoding')
+        if deadline is None and encoding is None and feed is None:
+            body = response.read()
+        else:
+            decoded = Body(encoding, feed)
+            while True:
+                if deadline is not None:
+                    # A per-recv timeout alone would let a slowly trickling
+                    # response run past the deadline.
+                    conn.sock.settimeout(budget(client.read_timeout, deadline))
+                chunk = response.read(READ_SIZE)
+                if not chunk:
+                    break
+                decoded.add(chunk)
+            body = decoded.finish()
+        if timing is not None:
+            timing.download = time.time() - started
+        return body
+
+    def warm_up(self, count, timeout):
+        return self.pool.warm_up(count, timeout)
+
+    def close(self):
+        if self._pool is not None:
+            self._pool.close()
+
+class BlockingTransport(PooledTransport):
+    """One new HTTP/1.1 connection per request, closed once it is done."""
+    def __init__(self, host, ssl_context=None):
+        PooledTransport.__init__(self, host)
+        self.ssl_context = ssl_context
+
+    def _get(self, fresh):
+        return HTTPSConnection(self.host, context=self.ssl_context or default_ssl_context()), False
+
+    def _done(self, conn, response):
+        conn.close()
+
+    def warm_up(self, count, timeout):
+        return 0
+
+    def close(self):
+        pass
+
+_transports = {}
+_transports_lock = threading.Lock()
+
+def get_transport(host):
+    """Return the transport shared by every client talking to host."""
+    _transports_lock.acquire()
+    try:
+        transport = _transports.get(host)
+        if transport is None:
+            transport = _transports[host] = PooledTransport(host)
+        return transport
+    finally:
+        _transports_lock.release()
+
+def set_transport(host, transport):
+    """Use transport for every client talking to host from now on."""
+    _transports_lock.acquire()
+    try:
+        previous = _transports.get(host)
+        _transports[host] = transport
+    finally:
+        _transports_lock.release()
+    if previous is not None and previous is not transport:
+        previous.close()
+
+def close_transports():
+    _transports_lock.acquire()
+    try:
+        transports = _transports.values()
+        _transports.clear()
+    finally:
+        _transports_lock.release()
+    for transport in transports:
+        transport.close()
@@ -20,6 +20,8 @@ def main():
         'long_description'        : "AIM and ARB API interfaces for performing real-time credit card authorizations/captures as well as automated recurring billing.",
         'packages'                : ['pythorizenet'],
         'install_requires'        : ['lxml >= 1.3.4'],
+        'extras_require'          : {'bulk': ['numpy'], 'http2': ['h2 >= 3, < 4']},
+        'test_suite'              : 'tests',
     }
     setup(**kwargs)
 
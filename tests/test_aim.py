@@ -0,0 +1,106 @@
+import unittest
+
+from pythorizenet.aim import TransactionResult, FIELDS, RESPONSE_CODES, TESTING_PREFIX
+
+ATTRIBUTES = ('code', 'type', 'subcode', 'reason', 'test', 'approval', 'transaction_id', 'amount', 'hash',
+    'card_type')
+
+class Baseline(object):
+    """The eager, split based parsing TransactionResult replaced."""
+    def __init__(self, data, delim='|'):
+        fields = data.split(delim)
+        self.code = int(fields[0])
+        self.type = RESPONSE_CODES[fields[0]]
+        self.subcode = int(fields[2])
+        self.reason = fields[3]
+        if self.reason.startswith(TESTING_PREFIX):
+            self.test = True
+            self.reason = self.reason.replace(TESTING_PREFIX, '')
+        else:
+            self.test = False
+        self.approval = fields[4]
+        self.transaction_id = fields[6]
+        self.amount = fields[9]
+        self.hash = fields[37]
+        self.card_type = None
+
+def response(delim='|', count=55, **values):
+    fields = [''] * count
+    fields[:12] = ['1', '1', '1', 'This transaction has been approved.', 'A1B2C3', 'Y', '2150000001',
+        'INV-1', 'Widgets', '10.00', 'CC', 'auth_capture']
+    fields[37] = '7A5C1B2D3E4F5061728394A5B6C7D8E9'
+    fields[50] = 'XXXX1111'
+    fields[51] = 'Visa'
+    for name, value in values.items():
+        fields[FIELDS.index(name)] = value
+    return delim.join(fields[:count]), fields[:count]
+
+class ParityTest(unittest.TestCase):
+    def check(self, data, delim='|'):
+        old = Baseline(data, delim)
+        new = TransactionResult(data, delim)
+        for name in ATTRIBUTES:
+            self.assertEqual(getattr(new, name), getattr(old, name), name)
+        for index, value in enumerate(data.split(delim)):
+            self.assertEqual(new.field(index), value)
+        return new
+
+    def test_approval(self):
+        data, fields = response()
+        result = self.check(data)
+        self.assertEqual(result.gateway_card_type, 'Visa')
+        self.assertEqual(result.account_number, 'XXXX1111')
+        named = result.fields()
+        for index, name in enumerate(FIELDS):
+            if name:
+                self.assertEqual(named[name], fields[index])
+
+    def test_every_response_code_and_test_mode(self):
+        for code in sorted(RESPONSE_CODES):
+            self.check(response(response_code=code)[0])
+        result = self.check(response(reason_text=TESTING_PREFIX + 'This transaction has been approved.')[0])
+        self.assertTrue(result.test)
+        self.assertEqual(result.reason, 'This transaction has been approved.')
+
+    def test_custom_delimiters(self):
+        for delim in (',', ';', '\t', '#', '::'):
+            self.check(response(delim)[0], delim)
+        # Empty fields next to each other, and at either end.
+        data, fields = response(',', approval='', avs_response='', balance_on_card='')
+        self.check(data, ',')
+
+    def test_values_holding_another_delimiter(self):
+        data, fields = response(',', description='a|b', invoice_number='x y')
+        result = self.check(data, ',')
+        self.assertEqual(result.description, 'a|b')
+
+    def test_extra_fields_after_the_standard_ones(self):
+        data = response()[0] + '|merchant field|another'
+        result = self.check(data)
+        self.assertEqual(result.field(56), 'another')
+        self.assertEqual(result.field(57), '')
+
+    def test_card_type_is_the_callers(self):
+        result = TransactionResult(response()[0])
+        self.assertTrue(result.card_type is None)
+        result.card_type = 'Amex'
+        self.assertEqual(result.card_type, 'Amex')
+        self.assertEqual(result.gateway_card_type, 'Visa')
+
+    def test_empty_and_unexpected_responses_are_rejected(self):
+        for data in ('', '|', 'nonsense', '5|1|1|x'):
+            self.assertRaises(Exception, TransactionResult, data)
+            self.assertRaises(Exception, Baseline, data)
+
+    def test_short_response(self):
+        # The baseline failed on anything shorter than the hash field; the
+        # missing fields now read as empty.
+        data = '|'.join(['3', '1', '7', 'Credit card expiration date is invalid.'])
+        self.assertRaises(IndexError, Baseline, data)
+        result = TransactionResult(data)
+        self.assertEqual((result.code, result.subcode, result.reason), (3, 7, 'Credit card expiration date is invalid.'))
+        self.assertEqual((result.approval, result.transaction_id, result.hash), ('', '', ''))
+        self.assertEqual(result.fields()['balance_on_card'], '')
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,120 @@
+import BaseHTTPServer
+import socket
+import threading
+import time
+import unittest
+
+from pythorizenet.aio import AsyncAuthorizeNet, AsyncTransaction, Future, Loop
+from pythorizenet.aim import HOST_TEST
+
+RESPONSE = '|'.join(['1', '1', '1', 'Approved', '', 'P', '100'] + [''] * 48)
+
+class Handler(BaseHTTPServer.BaseHTTPRequestHandler):
+    def do_POST(self):
+        data = self.rfile.read(int(self.headers['content-length']))
+        body = RESPONSE
+        if self.path == '/echo':
+            body = data
+        self.send_response(200)
+        self.send_header('content-length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+class PlainAsyncAuthorizeNet(AsyncAuthorizeNet):
+    secure = False
+
+def unused_port():
+    sock = socket.socket()
+    sock.bind(('127.0.0.1', 0))
+    port = sock.getsockname()[1]
+    sock.close()
+    return port
+
+class FutureTest(unittest.TestCase):
+    def test_callbacks_and_then(self):
+        future = Future()
+        seen = []
+        future.add_done_callback(seen.append)
+        doubled = future.then(lambda value: value * 2)
+        failed = future.then(lambda value: 1 / 0)
+        self.assertRaises(Exception, future.result)
+        future.set_result(21)
+        self.assertEqual(seen, [future])
+        self.assertEqual(doubled.result(), 42)
+        self.assertRaises(ZeroDivisionError, failed.result)
+        # Added late, called at once.
+        future.add_done_callback(seen.append)
+        self.assertEqual(len(seen), 2)
+
+    def test_errors_pass_down_the_chain(self):
+        future = Future()
+        chained = future.then(lambda value: value).then(lambda value: value)
+        future.set_exception(socket.timeout('timed out'))
+        self.assertRaises(socket.timeout, chained.result)
+
+class LoopTest(unittest.TestCase):
+    def setUp(self):
+        self.server = BaseHTTPServer.HTTPServer(('127.0.0.1', 0), Handler)
+        thread = threading.Thread(target=self.server.serve_forever)
+        thread.daemon = True
+        thread.start()
+        self.port = self.server.server_address[1]
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def client(self, loop, path='/echo', timeout=5, port=None):
+        conn = PlainAsyncAuthorizeNet('127.0.0.1', path, 'text/plain', loop, timeout)
+        conn.port = port or self.port
+        return conn
+
+    def test_requests_complete(self):
+        loop = Loop()
+        conn = self.client(loop)
+        # Larger than one write, so the request goes out over several steps.
+        large = 'x' * 100000
+        futures = [conn.send('request %d' % i) for i in xrange(5)] + [conn.send(large)]
+        self.assertFalse(futures[0].done)
+        loop.run()
+        self.assertEqual([future.result() for future in futures], ['request %d' % i for i in xrange(5)] + [large])
+        self.assertEqual(loop.pending, [])
+
+    def test_transactions_complete(self):
+        loop = Loop()
+        trans = AsyncTransaction(HOST_TEST, 'login', 'key', loop)
+        trans.conn = self.client(loop, trans.conn.path)
+        trans.set_amount('10.00')
+        trans.set_credit('4222222222222', ['2030', '12'])
+        codes = trans.auth_capture().then(lambda result: (result.code, result.transaction_id))
+        loop.run()
+        self.assertEqual(codes.result(), (1, '100'))
+
+    def test_deadline(self):
+        # Takes the connection and the request, and never answers.
+        listener = socket.socket()
+        listener.bind(('127.0.0.1', 0))
+        listener.listen(5)
+        try:
+            loop = Loop()
+            silent = self.client(loop, timeout=0.2, port=listener.getsockname()[1]).send('data')
+            answered = self.client(loop).send('data')
+            started = time.time()
+            loop.run()
+            self.assertTrue(0.15 <= time.time() - started < 2)
+            self.assertRaises(socket.timeout, silent.result)
+            self.assertEqual(answered.result(), 'data')
+        finally:
+            listener.close()
+
+    def test_refused(self):
+        loop = Loop()
+        refused = self.client(loop, port=unused_port()).send('data')
+        loop.run()
+        self.assertRaises(socket.error, refused.result)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,117 @@
+import BaseHTTPServer
+import errno
+import os
+import shutil
+import socket
+import tempfile
+import threading
+import unittest
+
+from pythorizenet import audit
+from pythorizenet.aio import AsyncAuthorizeNet, AsyncTransaction, Loop
+from pythorizenet.aim import HOST_TEST
+
+RESPONSE = '|'.join(['1', '1', '1', 'Approved', '', 'P', '100'] + [''] * 48)
+
+class Handler(BaseHTTPServer.BaseHTTPRequestHandler):
+    def do_POST(self):
+        self.rfile.read(int(self.headers['content-length']))
+        self.send_response(200)
+        self.send_header('content-length', str(len(RESPONSE)))
+        self.end_headers()
+        self.wfile.write(RESPONSE)
+
+    def log_message(self, *args):
+        pass
+
+class FullDisk(object):
+    """Wraps a log file; the next write gets half way, then fails."""
+    def __init__(self, out):
+        self.out = out
+
+    def write(self, data):
+        self.out.write(data[:len(data) // 2])
+        self.out.flush()
+        raise IOError(errno.ENOSPC, 'No space left on device')
+
+    def __getattr__(self, name):
+        return getattr(self.out, name)
+
+class PlainAsyncAuthorizeNet(AsyncAuthorizeNet):
+    secure = False
+
+def unused_port():
+    sock = socket.socket()
+    sock.bind(('127.0.0.1', 0))
+    port = sock.getsockname()[1]
+    sock.close()
+    return port
+
+class WriteErrorTest(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.path = os.path.join(self.directory, 'gateway.audit')
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_records_after_a_failed_write_are_kept(self):
+        log = audit.AuditLog(self.path, fsync=False)
+        log.record('host', '/', 'AUTH_ONLY', 'first', RESPONSE, None, 0)
+        log.flush()
+        log.out = FullDisk(log.out)
+        log.record('host', '/', 'AUTH_ONLY', 'lost', RESPONSE, None, 0)
+        self.assertRaises(IOError, log.flush)
+        log.record('host', '/', 'AUTH_ONLY', 'third', RESPONSE, None, 0)
+        self.assertRaises(IOError, log.close)
+        self.assertEqual([record.request for record in audit.read(self.path)], ['first', 'third'])
+        # Reopened, the log keeps them and appends after them.
+        log = audit.AuditLog(self.path, fsync=False)
+        log.record('host', '/', 'AUTH_ONLY', 'fourth', RESPONSE, None, 0)
+        log.close()
+        self.assertEqual([record.request for record in audit.read(self.path)], ['first', 'third', 'fourth'])
+
+class AsyncAuditTest(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.log = audit.AuditLog(os.path.join(self.directory, 'gateway.audit'), fsync=False)
+        audit.add_sink(self.log)
+        self.server = BaseHTTPServer.HTTPServer(('127.0.0.1', 0), Handler)
+        thread = threading.Thread(target=self.server.serve_forever)
+        thread.daemon = True
+        thread.start()
+
+    def tearDown(self):
+        audit.remove_sink(self.log)
+        self.log.close()
+        self.server.shutdown()
+        self.server.server_close()
+        shutil.rmtree(self.directory)
+
+    def transaction(self, loop, port):
+        trans = AsyncTransaction(HOST_TEST, 'login', 'key', loop)
+        trans.conn = PlainAsyncAuthorizeNet('127.0.0.1', trans.conn.path, trans.conn.mime, loop, 5)
+        trans.conn.port = port
+        trans.set_amount('10.00')
+        trans.set_credit('4222222222222', ['2030', '12'])
+        return trans
+
+    def test_async_exchanges_are_recorded(self):
+        loop = Loop()
+        approved = self.transaction(loop, self.server.server_address[1]).auth_capture()
+        refused = self.transaction(loop, unused_port()).authorize()
+        loop.run()
+        self.assertEqual(approved.result().field(0), '1')
+        self.assertRaises(socket.error, refused.result)
+        self.log.flush()
+        records = sorted(audit.read(self.log.path), key=lambda record: record.request_type)
+        self.assertEqual([record.request_type for record in records], ['AUTH_CAPTURE', 'AUTH_ONLY'])
+        self.assertEqual(records[0].response, RESPONSE)
+        self.assertEqual(records[0].result().field(6), '100')
+        self.assertEqual(records[0].path, '/gateway/transact.dll')
+        self.assertFalse('4222222222222' in records[0].request)
+        self.assertTrue(records[1].error.startswith('error:'))
+        self.assertTrue(records[1].response is None)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,114 @@
+import threading
+import time
+import unittest
+
+from pythorizenet.batch import Batch, capture_all
+
+class Job(object):
+    """Stands in for a Transaction; takes delay seconds per operation."""
+    running = 0
+    most = 0
+    lock = threading.Lock()
+
+    def __init__(self, value, delay=0, error=None):
+        self.value = value
+        self.delay = delay
+        self.error = error
+
+    def _run(self, operation):
+        Job.lock.acquire()
+        Job.running += 1
+        Job.most = max(Job.most, Job.running)
+        Job.lock.release()
+        try:
+            time.sleep(self.delay)
+            if self.error is not None:
+                raise self.error
+            return (operation, self.value)
+        finally:
+            Job.lock.acquire()
+            Job.running -= 1
+            Job.lock.release()
+
+    def capture(self):
+        return self._run('capture')
+
+    def void(self):
+        return self._run('void')
+
+class BatchTest(unittest.TestCase):
+    def setUp(self):
+        Job.most = 0
+
+    def test_items_come_back_in_order(self):
+        # The first ones take longest.
+        jobs = [Job(i, (10 - i) * 0.005) for i in xrange(10)]
+        items = Batch(jobs, concurrency=4).run()
+        self.assertEqual([item.index for item in items], range(10))
+        self.assertEqual([item.result for item in items], [('capture', i) for i in xrange(10)])
+        self.assertTrue(items[0].transaction is jobs[0])
+        self.assertTrue(all(item.elapsed >= 0 for item in items))
+        self.assertTrue(Job.most <= 4)
+
+    def test_unordered_items_come_back_as_they_complete(self):
+        jobs = [Job(0, 0.2)] + [Job(i, 0) for i in xrange(1, 6)]
+        items = list(capture_all(jobs, concurrency=2))
+        self.assertEqual(sorted(item.index for item in items), range(6))
+        self.assertNotEqual(items[0].index, 0)
+
+    def test_errors_stay_with_their_item(self):
+        error = ValueError('declined')
+        jobs = [Job(0), Job(1, error=error), Job(2)]
+        batch = Batch(jobs, concurrency=2)
+        items = batch.run()
+        self.assertEqual([item.error for item in items], [None, error, None])
+        self.assertEqual(items[2].result, ('capture', 2))
+        self.assertEqual((batch.stats.succeeded, batch.stats.failed, batch.stats.count), (2, 1, 3))
+        self.assertTrue(batch.stats.rate() > 0)
+
+    def test_operations_per_item(self):
+        items = Batch([(Job(0), 'void'), Job(1), (Job(2), 'refund')]).run()
+        self.assertEqual(items[0].result, ('void', 0))
+        self.assertEqual(items[1].result, ('capture', 1))
+        self.assertTrue(isinstance(items[2].error, Exception))
+        # A known operation the transaction does not have.
+        self.assertTrue(isinstance(Batch([Job(0)], 'cancel').run()[0].error, AttributeError))
+        self.assertRaises(Exception, Batch, [], 'refund')
+        self.assertRaises(Exception, Batch, [], concurrency=0)
+
+    def test_failing_iterable(self):
+        def jobs():
+            yield Job(0)
+            yield Job(1)
+            raise IOError('truncated input')
+        batch = Batch(jobs(), concurrency=2)
+        seen = []
+        try:
+            for item in batch:
+                seen.append(item.index)
+        except IOError:
+            pass
+        else:
+            self.fail('The iterable\'s error was not raised!')
+        self.assertEqual(seen, [0, 1])
+
+    def test_input_is_read_a_window_at_a_time(self):
+        consumed = []
+        def jobs():
+            for i in xrange(1000):
+                consumed.append(i)
+                yield Job(i)
+        batch = iter(Batch(jobs(), concurrency=2, window=3))
+        batch.next()
+        time.sleep(0.1)
+        # Six buffered, one given back, one waiting for a slot.
+        self.assertTrue(len(consumed) <= 2 * 3 + 2, len(consumed))
+        self.assertEqual(len(list(batch)), 999)
+
+    def test_empty(self):
+        batch = Batch([])
+        self.assertEqual(batch.run(), [])
+        self.assertEqual(batch.stats.count, 0)
+
+if __name__ == '__main__':
+    unittest.main()
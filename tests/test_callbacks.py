@@ -0,0 +1,79 @@
+import StringIO
+import unittest
+import urllib
+
+from pythorizenet import generate_hash
+from pythorizenet.callbacks import (CallbackReceiver, STATUS_OK, STATUS_MALFORMED, STATUS_BAD_HASH,
+    STATUS_BUSY)
+
+LOGIN = 'login'
+SALT = 'secret'
+
+def body(trans_id='2150000001', amount='10.00', hash=None, **fields):
+    if hash is None:
+        hash = generate_hash(SALT, LOGIN, trans_id, amount)
+    values = [('x_response_code', '1'), ('x_response_reason_text', 'This transaction has been approved.'),
+        ('x_trans_id', trans_id), ('x_amount', amount), ('x_MD5_Hash', hash)]
+    return urllib.urlencode(values + sorted(fields.items()))
+
+class CallbackReceiverTest(unittest.TestCase):
+    def setUp(self):
+        self.handled = []
+
+    def receiver(self, **options):
+        return CallbackReceiver(LOGIN, SALT, self.handled.append, **options)
+
+    def test_valid_hash_is_dispatched(self):
+        receiver = self.receiver().start()
+        self.assertEqual(receiver.receive(body(x_invoice_num='A-1', x_subscription_id='7')), STATUS_OK)
+        self.assertEqual(receiver.receive(body(hash=generate_hash(SALT, LOGIN, '2150000001', '10.00').lower())),
+            STATUS_OK)
+        receiver.stop()
+        self.assertEqual(len(self.handled), 2)
+        result = self.handled[0]
+        self.assertEqual(result.transaction_id, '2150000001')
+        self.assertEqual(result.invoice_number, 'A-1')
+        self.assertEqual(result.reason_text, 'This transaction has been approved.')
+        self.assertEqual(result.extra, {'x_subscription_id': '7'})
+        self.assertEqual(receiver.stats()['handled'], 2)
+
+    def test_forged_hash_is_rejected(self):
+        receiver = self.receiver().start()
+        self.assertEqual(receiver.receive(body(hash='0' * 32)), STATUS_BAD_HASH)
+        self.assertEqual(receiver.receive(body(hash='')), STATUS_BAD_HASH)
+        # A genuine hash does not carry over to another amount.
+        forged = body(amount='10.00').replace('x_amount=10.00', 'x_amount=1000.00')
+        self.assertEqual(receiver.receive(forged), STATUS_BAD_HASH)
+        self.assertEqual(receiver.receive('x_response_code=9'), STATUS_MALFORMED)
+        receiver.stop()
+        self.assertEqual(self.handled, [])
+        stats = receiver.stats()
+        self.assertEqual((stats['bad_hash'], stats['malformed'], stats['accepted']), (3, 1, 0))
+
+    def test_full_queue_answers_busy(self):
+        receiver = self.receiver(queue_size=1)
+        self.assertEqual(receiver.receive(body(), 0), STATUS_OK)
+        self.assertEqual(receiver.receive(body(), 0), STATUS_BUSY)
+        self.assertEqual(receiver.receive(body(), 0.01), STATUS_BUSY)
+        self.assertEqual(receiver.stats()['busy'], 2)
+        receiver.start()
+        receiver.stop()
+        self.assertEqual(len(self.handled), 1)
+
+    def test_salt_is_required(self):
+        self.assertRaises(Exception, CallbackReceiver, LOGIN, None, self.handled.append)
+        self.assertRaises(Exception, CallbackReceiver, LOGIN, '', self.handled.append)
+        receiver = CallbackReceiver(LOGIN, None, self.handled.append, verify=False)
+        self.assertEqual(receiver.receive(body(hash='0' * 32), 0), STATUS_OK)
+
+    def test_wsgi(self):
+        receiver = self.receiver(response='thanks')
+        data = body()
+        started = []
+        environ = {'REQUEST_METHOD': 'POST', 'CONTENT_LENGTH': str(len(data)),
+            'wsgi.input': StringIO.StringIO(data)}
+        self.assertEqual(receiver(environ, lambda status, headers: started.append(status)), ['thanks'])
+        self.assertEqual(started, [STATUS_OK])
+
+if __name__ == '__main__':
+    unittest.main()
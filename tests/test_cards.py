@@ -0,0 +1,72 @@
+import random
+import unittest
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+from pythorizenet import identify_card_type, luhn_valid, AMEX, DISCOVER, MASTERCARD, VISA, UNKNOWN_CARD_TYPE
+from pythorizenet import cards
+
+KNOWN = [
+    ('4222222222222', VISA), ('4111111111111111', VISA), ('4012888888881881', VISA),
+    ('5555555555554444', MASTERCARD), ('5105105105105100', MASTERCARD), ('378282246310005', AMEX),
+    ('371449635398431', AMEX), ('6011111111111117', DISCOVER), ('6500000000000002', DISCOVER),
+    ('3530111333300000', UNKNOWN_CARD_TYPE), ('30569309025904', UNKNOWN_CARD_TYPE),
+]
+
+def corpus(count=3000, seed=0):
+    rand = random.Random(seed)
+    prefixes = ['4', '34', '37', '51', '55', '56', '50', '6011', '6012', '65', '64', '3', '']
+    numbers = [number for number, card_type in KNOWN]
+    for i in xrange(count):
+        prefix = rand.choice(prefixes)
+        length = rand.choice([1, 2, 3, 4, 12, 13, 14, 15, 16, 17, 19])
+        number = (prefix + ''.join([rand.choice('0123456789') for j in xrange(length)]))[:max(length, 1)]
+        numbers.append(number)
+    return numbers
+
+@unittest.skipIf(numpy is None, 'numpy is not installed')
+class ClassifyTest(unittest.TestCase):
+    def check(self, numbers):
+        types, valid = cards.classify(numbers)
+        self.assertEqual(list(types), [identify_card_type(number) for number in numbers])
+        self.assertEqual(list(valid), [luhn_valid(number) for number in numbers])
+
+    def test_matches_the_scalar_helpers(self):
+        numbers = corpus()
+        self.check(numbers)
+        self.check(numpy.array(numbers, dtype='S19'))
+        self.check([unicode(number) for number in numbers])
+
+    def test_known_cards(self):
+        types, valid = cards.classify([number for number, card_type in KNOWN])
+        self.assertEqual(list(types), [card_type for number, card_type in KNOWN])
+        self.assertTrue(valid.all())
+        self.assertFalse(cards.luhn_check(['4222222222223'])[0])
+
+    def test_anything_but_digits_is_unknown_and_invalid(self):
+        numbers = ['', '4111 1111 1111 1111', '4111-1111-1111-111', '411111111111111x', ' 4222222222222']
+        types, valid = cards.classify(numbers)
+        self.assertEqual(list(types), [UNKNOWN_CARD_TYPE] * len(numbers))
+        self.assertFalse(valid.any())
+        self.assertEqual([luhn_valid(number) for number in numbers], [False] * len(numbers))
+
+    def test_short_widths(self):
+        self.check(['0', '18', '059'])
+        self.assertEqual(len(cards.classify([])[0]), 0)
+
+    def test_chunks(self):
+        numbers = corpus(100, 1)
+        size = cards.CHUNK_SIZE
+        cards.CHUNK_SIZE = 7
+        try:
+            self.check(numbers)
+            codes, valid = cards.classify_codes(numbers)
+        finally:
+            cards.CHUNK_SIZE = size
+        self.assertEqual([cards.CARD_TYPES[code] for code in codes], list(cards.identify_card_types(numbers)))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,134 @@
+import random
+import zlib
+import unittest
+
+from pythorizenet import AuthorizeNet, metrics
+from pythorizenet.cim import Customer, HOST_TEST
+from pythorizenet.compression import (Body, CompressedChunks, Decoder, compress, GZIP, DEFLATE,
+    ACCEPT_ENCODING, DEFAULT_THRESHOLD)
+
+def sample(size, seed=0):
+    rand = random.Random(seed)
+    words = ['<customerPaymentProfileId>', '4222222222222', '</paymentProfiles>', 'Jane', '&amp;', '\n']
+    return ''.join([rand.choice(words) for i in xrange(size)])
+
+def pieces(data, size):
+    return [data[i:i + size] for i in xrange(0, len(data), size)]
+
+PROFILE = ('<?xml version="1.0" encoding="utf-8"?><getCustomerProfileResponse xmlns="AnetApi/xml/v1/schema/'
+    'AnetApiSchema.xsd"><messages><resultCode>Ok</resultCode><message><code>I00001</code><text>Successful.</text>'
+    '</message></messages><profile><customerProfileId>10</customerProfileId><paymentProfiles>'
+    '<customerPaymentProfileId>20</customerPaymentProfileId></paymentProfiles></profile>'
+    '</getCustomerProfileResponse>')
+
+class GzipTransport(object):
+    """Answers with a gzipped body, decoded in small pieces like a socket read."""
+    def __init__(self, response):
+        self.response = response
+
+    def request(self, client, data, deadline, timing, progress, fresh=False, headers=(), feed=None):
+        body = Body(GZIP, feed)
+        for piece in pieces(compress(self.response, GZIP), 16):
+            body.add(piece)
+        return 200, body.finish()
+
+class Recorder(metrics.Observer):
+    def __init__(self):
+        self.timings = []
+
+    def request_finished(self, timing):
+        self.timings.append(timing)
+
+def decode(encoding, data, size=7):
+    body = Body(encoding)
+    for piece in pieces(data, size):
+        body.add(piece)
+    return body.finish()
+
+class CompressionTest(unittest.TestCase):
+    def test_round_trips(self):
+        data = sample(2000)
+        for encoding in (GZIP, DEFLATE):
+            compressed = compress(data, encoding)
+            self.assertTrue(len(compressed) < len(data))
+            for size in (1, 2, 7, 4096, len(compressed)):
+                self.assertEqual(decode(encoding, compressed, size), data)
+        self.assertEqual(decode(GZIP, compress('', GZIP)), '')
+
+    def test_deflate_with_and_without_zlib_wrapper(self):
+        data = sample(500)
+        raw = zlib.compressobj(6, zlib.DEFLATED, -zlib.MAX_WBITS)
+        raw = raw.compress(data) + raw.flush()
+        for compressed in (zlib.compress(data), raw):
+            for size in (1, 3, len(compressed)):
+                self.assertEqual(decode(DEFLATE, compressed, size), data)
+        self.assertEqual(decode(' Deflate ', zlib.compress(data)), data)
+
+    def test_truncated_deflate(self):
+        decoder = Decoder(DEFLATE)
+        self.assertEqual(decoder.decompress('x'), '')
+        self.assertRaises(zlib.error, decoder.flush)
+
+    def test_identity_and_unknown(self):
+        self.assertEqual(decode(None, 'plain'), 'plain')
+        self.assertEqual(decode('identity', 'plain'), 'plain')
+        self.assertRaises(Exception, Body, 'br')
+        self.assertRaises(Exception, compress, 'data', 'br')
+
+    def test_chunks_compress_the_same_every_time(self):
+        chunks = pieces(sample(3000, 1), 100)
+        compressed = CompressedChunks(chunks, GZIP)
+        first = ''.join(compressed)
+        self.assertEqual(''.join(compressed), first)
+        self.assertEqual(decode(GZIP, first), ''.join(chunks))
+        self.assertTrue(isinstance(compress(chunks, DEFLATE), CompressedChunks))
+
+    def test_fed_body_is_not_kept(self):
+        data = sample(1000)
+        fed = []
+        body = Body(GZIP, fed.append)
+        for piece in pieces(compress(data, GZIP), 50):
+            body.add(piece)
+        self.assertTrue(body.finish() is None)
+        self.assertEqual(body.chunks, [])
+        self.assertEqual(''.join(fed), data)
+
+class FedResponseMetricsTest(unittest.TestCase):
+    def setUp(self):
+        self.recorder = Recorder()
+        metrics.add_observer(self.recorder)
+
+    def tearDown(self):
+        metrics.remove_observer(self.recorder)
+
+    def test_fed_response_is_measured(self):
+        customer = Customer(HOST_TEST, 'login', 'key')
+        customer.conn.transport = GzipTransport(PROFILE)
+        customer.set_profile_id('10')
+        result = customer.get()
+        self.assertEqual(result.payment_profile_ids, ['20'])
+        timing, = self.recorder.timings
+        self.assertEqual(timing.request_type, 'getCustomerProfileRequest')
+        self.assertEqual(timing.response_size, len(PROFILE))
+        self.assertEqual(timing.result_code, 'Ok')
+
+class EncodeTest(unittest.TestCase):
+    def test_only_large_bodies_are_compressed(self):
+        conn = AuthorizeNet('gateway.invalid', '/', 'text/xml', transport=object())
+        self.assertEqual(conn._encode('data'), ('data', []))
+        conn.set_compression(request=GZIP)
+        self.assertEqual(conn.compress_threshold, DEFAULT_THRESHOLD)
+        small = 'x' * (DEFAULT_THRESHOLD - 1)
+        self.assertEqual(conn._encode(small), (small, [('accept-encoding', ACCEPT_ENCODING)]))
+        large = sample(DEFAULT_THRESHOLD)
+        data, headers = conn._encode(large)
+        self.assertEqual(headers, [('accept-encoding', ACCEPT_ENCODING), ('content-encoding', GZIP)])
+        self.assertEqual(decode(GZIP, data), large)
+        # Chunks are compressed whatever their size.
+        data, headers = conn._encode(['x'])
+        self.assertEqual(decode(GZIP, ''.join(data)), 'x')
+        conn.set_compression(False, DEFLATE, threshold=0)
+        self.assertEqual(conn._encode('x'), (zlib.compress('x', 6), [('content-encoding', DEFLATE)]))
+
+if __name__ == '__main__':
+    unittest.main()
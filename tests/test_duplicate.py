@@ -0,0 +1,164 @@
+import unittest
+
+from pythorizenet.aim import Transaction, HOST_TEST
+from pythorizenet.aio import AsyncTransaction, Future
+from pythorizenet.duplicate import DuplicateCache, DUPLICATE_REASON_CODE, fingerprint
+
+def response(code, trans_id, amount, requestType):
+    fields = [''] * 55
+    fields[0] = code
+    fields[6] = trans_id
+    fields[9] = amount
+    fields[11] = requestType
+    return '|'.join(fields)
+
+class Gateway(object):
+    """Stands in for AuthorizeNet; approves everything unless told not to."""
+    def __init__(self, code='1'):
+        self.code = code
+        self.sent = []
+
+    def send(self, data, request_type=None):
+        self.sent.append(request_type)
+        return response(self.code, str(len(self.sent)), '10.00', request_type)
+
+class AsyncGateway(Gateway):
+    """Stands in for AsyncAuthorizeNet; answers once complete() is called."""
+    def __init__(self, code='1'):
+        Gateway.__init__(self, code)
+        self.futures = []
+
+    def send(self, data, request_type=None):
+        future = Future()
+        self.futures.append((future, Gateway.send(self, data, request_type)))
+        return future
+
+    def complete(self):
+        futures, self.futures = self.futures, []
+        for future, body in futures:
+            future.set_result(body)
+
+class SharedCache(dict):
+    """Stands in for a memcached client."""
+    def set(self, key, value, time):
+        self[key] = value
+
+def transaction(cls=Transaction, gateway=None, cache=None):
+    trans = cls(HOST_TEST, 'login', 'key')
+    trans.conn = gateway or Gateway()
+    trans.set_duplicate_cache(cache or DuplicateCache())
+    trans.set_amount('10.00')
+    trans.set_credit('4222222222222', ['2030', '12'])
+    trans.set_customer('Jane', 'Doe')
+    return trans
+
+class FingerprintTest(unittest.TestCase):
+    def test_follow_ups_are_told_apart_by_trans_id(self):
+        trans = transaction()
+        trans.set_transaction_id('1')
+        first = fingerprint(trans, 'VOID')
+        trans.set_transaction_id('2')
+        self.assertNotEqual(fingerprint(trans, 'VOID'), first)
+        self.assertNotEqual(fingerprint(trans, 'PRIOR_AUTH_CAPTURE'), fingerprint(trans, 'VOID'))
+        trans.set_amount('11.00')
+        self.assertNotEqual(fingerprint(trans, 'PRIOR_AUTH_CAPTURE'), first)
+
+    def test_sales_ignore_trans_id(self):
+        trans = transaction()
+        first = fingerprint(trans, 'AUTH_CAPTURE')
+        trans.set_transaction_id('1')
+        self.assertEqual(fingerprint(trans, 'AUTH_CAPTURE'), first)
+        self.assertNotEqual(fingerprint(trans, 'AUTH_ONLY'), first)
+        trans.set_customer('John', 'Doe')
+        self.assertNotEqual(fingerprint(trans, 'AUTH_CAPTURE'), first)
+
+    def test_card_numbers_are_not_kept(self):
+        trans = transaction()
+        trans.set_credit(u'4222222222222', ['2030', '12'])
+        self.assertFalse('4222222222222' in fingerprint(trans, 'AUTH_CAPTURE'))
+
+    def test_card_numbers_are_hashed_with_a_key(self):
+        trans = transaction()
+        first = fingerprint(trans, 'AUTH_CAPTURE')
+        self.assertEqual(fingerprint(trans, 'AUTH_CAPTURE'), first)
+        self.assertEqual(fingerprint(trans, 'AUTH_CAPTURE', 'secret'), fingerprint(trans, 'AUTH_CAPTURE', 'secret'))
+        self.assertNotEqual(fingerprint(trans, 'AUTH_CAPTURE', 'secret'), first)
+        self.assertNotEqual(fingerprint(trans, 'AUTH_CAPTURE', 'other'), fingerprint(trans, 'AUTH_CAPTURE', 'secret'))
+
+class DuplicateCacheTest(unittest.TestCase):
+    def test_repeat_is_answered_locally(self):
+        trans = transaction()
+        first = trans.auth_capture()
+        second = trans.auth_capture()
+        self.assertEqual(trans.conn.sent, ['AUTH_CAPTURE'])
+        self.assertEqual(first.field(0), '1')
+        self.assertEqual(second.field(0), '3')
+        self.assertEqual(second.field(2), DUPLICATE_REASON_CODE)
+        self.assertEqual(second.field(6), first.field(6))
+
+    def test_follow_ups_for_other_transactions_are_sent(self):
+        trans = transaction()
+        for trans_id in ('1', '2'):
+            trans.set_transaction_id(trans_id)
+            self.assertEqual(trans.void().field(0), '1')
+            self.assertEqual(trans.capture().field(0), '1')
+        self.assertEqual(trans.conn.sent, ['VOID', 'PRIOR_AUTH_CAPTURE'] * 2)
+        self.assertEqual(trans.void().field(2), DUPLICATE_REASON_CODE)
+
+    def test_errors_are_not_recorded(self):
+        trans = transaction(gateway=Gateway('3'))
+        trans.auth_capture()
+        trans.auth_capture()
+        self.assertEqual(len(trans.conn.sent), 2)
+
+    def test_window_of_zero_disables_the_cache(self):
+        trans = transaction()
+        trans.set_duplicate_window(0)
+        trans.auth_capture()
+        trans.auth_capture()
+        self.assertEqual(len(trans.conn.sent), 2)
+
+    def test_shared_cache_needs_a_common_key(self):
+        shared = SharedCache()
+        self.assertRaises(Exception, DuplicateCache, shared=shared)
+        first = transaction(cache=DuplicateCache(shared=shared, key='secret'))
+        second = transaction(cache=DuplicateCache(shared=shared, key='secret'))
+        self.assertEqual(first.auth_capture().field(0), '1')
+        self.assertEqual(second.auth_capture().field(2), DUPLICATE_REASON_CODE)
+        self.assertEqual(second.conn.sent, [])
+
+class AsyncDuplicateTest(unittest.TestCase):
+    def test_async_transactions_use_the_cache(self):
+        cache = DuplicateCache()
+        gateway = AsyncGateway()
+        trans = transaction(AsyncTransaction, gateway, cache)
+        first = trans.auth_capture()
+        # Identical and still in flight: settled with the first.
+        collapsed = trans.auth_capture()
+        self.assertFalse(collapsed.done)
+        gateway.complete()
+        self.assertEqual(first.result().field(0), '1')
+        self.assertEqual(collapsed.result().field(2), DUPLICATE_REASON_CODE)
+        repeat = trans.auth_capture()
+        self.assertEqual(repeat.result().field(2), DUPLICATE_REASON_CODE)
+        self.assertEqual(gateway.sent, ['AUTH_CAPTURE'])
+        self.assertEqual((cache.misses, cache.hits, cache.collapsed), (1, 1, 1))
+        # Shared with synchronous transactions.
+        sync = transaction(cache=cache)
+        self.assertEqual(sync.auth_capture().field(2), DUPLICATE_REASON_CODE)
+        self.assertEqual(sync.conn.sent, [])
+
+    def test_waiters_resend_after_an_error(self):
+        gateway = AsyncGateway('3')
+        trans = transaction(AsyncTransaction, gateway)
+        first = trans.auth_capture()
+        second = trans.auth_capture()
+        gateway.complete()
+        self.assertEqual(first.result().field(0), '3')
+        self.assertFalse(second.done)
+        gateway.complete()
+        self.assertEqual(second.result().field(0), '3')
+        self.assertEqual(len(gateway.sent), 2)
+
+if __name__ == '__main__':
+    unittest.main()
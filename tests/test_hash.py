@@ -0,0 +1,57 @@
+import unittest
+
+from pythorizenet import generate_hash, md5
+from pythorizenet.aim import TransactionResult, HashVerifier
+
+LOGIN = 'login'
+
+def result(trans_id, amount, hash):
+    fields = [''] * 55
+    fields[0] = '1'
+    fields[6] = trans_id
+    fields[9] = amount
+    fields[37] = hash
+    return TransactionResult('|'.join(fields))
+
+class HashVerifierTest(unittest.TestCase):
+    def check(self, salt):
+        verifier = HashVerifier(LOGIN, salt)
+        for trans_id, amount in (('', ''), ('1', '0.00'), ('2147483647', '10.00'), ('9' * 70, '12345.67')):
+            expected = md5(salt + LOGIN + trans_id + amount).hexdigest().upper()
+            self.assertEqual(verifier.hash(trans_id, amount), expected)
+            self.assertEqual(generate_hash(salt, LOGIN, trans_id, amount), expected)
+
+    def test_hash_for_every_prefix_length(self):
+        # Below, at and across the 64 byte MD5 block size.
+        for length in (0, 1, 58, 59, 60, 63, 64, 65, 127, 128, 200):
+            self.check('s' * length)
+
+    def test_saved_state_is_not_consumed(self):
+        verifier = HashVerifier(LOGIN, 's' * 128)
+        self.assertEqual(verifier.hash('1', '1.00'), verifier.hash('1', '1.00'))
+
+    def test_verify(self):
+        salt = 'secret'
+        verifier = HashVerifier(LOGIN, salt)
+        good = generate_hash(salt, LOGIN, '10', '5.00')
+        self.assertTrue(verifier.verify(result('10', '5.00', good)))
+        self.assertTrue(verifier.verify(result('10', '5.00', good.lower())))
+        self.assertFalse(verifier.verify(result('10', '5.01', good)))
+        self.assertFalse(verifier.verify(result('10', '5.00', '')))
+        self.assertTrue(result('10', '5.00', good).validate(LOGIN, salt))
+        self.assertFalse(result('10', '5.00', good).validate(LOGIN, 'other'))
+
+    def test_verify_all_and_mismatches(self):
+        salt = 's' * 100
+        verifier = HashVerifier(LOGIN, salt)
+        results = [result(str(i), '1.00', generate_hash(salt, LOGIN, str(i), '1.00')) for i in xrange(5)]
+        results[1] = result('1', '1.00', 'BAD')
+        results[3] = result('3', '2.00', results[3].field(37))
+        self.assertEqual(verifier.verify_all(results), [True, False, True, False, True])
+        mismatches = list(verifier.mismatches(results))
+        self.assertEqual([(index, expected) for index, found, expected in mismatches],
+            [(1, generate_hash(salt, LOGIN, '1', '1.00')), (3, generate_hash(salt, LOGIN, '3', '2.00'))])
+        self.assertTrue(mismatches[0][1] is results[1])
+
+if __name__ == '__main__':
+    unittest.main()
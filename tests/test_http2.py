@@ -0,0 +1,131 @@
+import os
+import select
+import socket
+import SocketServer
+import threading
+import time
+import unittest
+
+try:
+    import h2.config, h2.connection, h2.events, h2.errors
+except ImportError:
+    h2 = None
+
+from pythorizenet import AuthorizeNet
+from pythorizenet.retry import RetryPolicy, CircuitBreaker, CircuitOpen, is_stale, STAGE_SEND
+from pythorizenet.http2 import HTTP2Transport, StreamRefused
+
+REFUSE = 'refuse'
+GOAWAY = 'goaway'
+
+class _Handler(SocketServer.BaseRequestHandler):
+    """Turns every request away, with REFUSED_STREAM or a GOAWAY."""
+    def handle(self):
+        server = self.server
+        server.connections += 1
+        conn = h2.connection.H2Connection(h2.config.H2Configuration(client_side=False, header_encoding=None))
+        conn.initiate_connection()
+        self.request.sendall(conn.data_to_send())
+        while True:
+            try:
+                data = self.request.recv(65536)
+            except socket.error:
+                return
+            if not data:
+                return
+            for event in conn.receive_data(data):
+                if isinstance(event, h2.events.RequestReceived):
+                    server.requests += 1
+                    if server.mode == REFUSE:
+                        conn.reset_stream(event.stream_id, h2.errors.ErrorCodes.REFUSED_STREAM)
+                    else:
+                        conn.close_connection(last_stream_id=0)
+            self.request.sendall(conn.data_to_send())
+
+class _Server(SocketServer.ThreadingTCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, mode):
+        SocketServer.ThreadingTCPServer.__init__(self, ('127.0.0.1', 0), _Handler)
+        self.mode = mode
+        self.connections = 0
+        self.requests = 0
+
+class RefusedTest(unittest.TestCase):
+    def test_refusals_are_counted_attempts(self):
+        refused = StreamRefused(104, 'HTTP/2 stream refused!')
+        self.assertFalse(is_stale(refused, STAGE_SEND, True))
+        self.assertTrue(RetryPolicy().retryable(refused, STAGE_SEND, False))
+
+@unittest.skipIf(h2 is None, 'h2 is not installed')
+class HTTP2RefusalTest(unittest.TestCase):
+    def start(self, mode):
+        self.server = _Server(mode)
+        thread = threading.Thread(target=self.server.serve_forever)
+        thread.daemon = True
+        thread.start()
+        self.host = '127.0.0.1:%d' % self.server.server_address[1]
+        self.transport = HTTP2Transport(self.host, secure=False)
+        self.breaker = CircuitBreaker(self.host, threshold=5)
+        return AuthorizeNet(self.host, '/gateway/transact.dll', 'text/plain', transport=self.transport,
+            retry=RetryPolicy(3, backoff=0.01), breaker=self.breaker)
+
+    def tearDown(self):
+        self.transport.close()
+        self.server.shutdown()
+        self.server.server_close()
+
+    def test_refused_streams_trip_the_breaker(self):
+        conn = self.start(REFUSE)
+        conn.set_timeouts(total=5)
+        started = time.time()
+        self.assertRaises(StreamRefused, conn.send, 'data')
+        self.assertEqual(self.server.requests, 3)
+        # The fifth refusal in a row opens the circuit.
+        self.assertRaises(CircuitOpen, conn.send, 'data')
+        self.assertEqual(self.server.requests, 5)
+        self.assertRaises(CircuitOpen, conn.send, 'data')
+        self.assertEqual(self.server.requests, 5)
+        self.assertTrue(time.time() - started < 5)
+
+    def test_goaway_is_retried_on_a_new_connection(self):
+        conn = self.start(GOAWAY)
+        self.assertRaises(StreamRefused, conn.send, 'data')
+        self.assertEqual(self.server.requests, 3)
+        self.assertEqual(self.server.connections, 3)
+
+    def test_fresh_replaces_the_connection(self):
+        self.start(REFUSE)
+        client = type('Client', (object,), {'connect_timeout': 5})()
+        first = self.transport._connection(client, None, None, False)
+        self.assertTrue(self.transport._connection(client, None, None, False) is first)
+        second = self.transport._connection(client, None, None, True)
+        self.assertFalse(second is first)
+        self.assertFalse(first.available)
+        first.thread.join(5)
+        self.assertTrue(first.closed)
+        self.assertTrue(second.available)
+
+    def test_close_after_the_connection_is_gone(self):
+        self.start(REFUSE)
+        client = type('Client', (object,), {'connect_timeout': 5})()
+        conn = self.transport._connection(client, None, None, False)
+        wake_write = conn.wake_write
+        conn.close()
+        conn.thread.join(5)
+        self.assertFalse(conn.thread.is_alive())
+        # The wake-up pipe is closed by now; hand its descriptor to another.
+        read, write = os.pipe()
+        os.dup2(write, wake_write)
+        try:
+            conn.close()
+            conn.retire()
+            self.assertEqual(select.select([read], [], [], 0)[0], [])
+        finally:
+            os.close(read)
+            os.close(write)
+            os.close(wake_write)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,149 @@
+import socket
+import threading
+import time
+import unittest
+
+from pythorizenet import AuthorizeNet
+from pythorizenet.limits import TokenBucket, AdaptiveLimiter, get_limiter, set_limiter
+from pythorizenet.retry import RetryPolicy, CircuitBreaker, STAGE_READ
+from pythorizenet.transport import Transport
+
+HOST = 'gateway.invalid'
+LOGIN = 'login'
+
+class AnsweringTransport(Transport):
+    def __init__(self, status=200):
+        self.status = status
+
+    def request(self, client, data, deadline, timing, progress, fresh=False, headers=(), feed=None):
+        progress[0] = STAGE_READ
+        return self.status, 'ok'
+
+class CountingLimiter(AdaptiveLimiter):
+    def __init__(self):
+        AdaptiveLimiter.__init__(self, LOGIN, HOST)
+        self.acquired = 0
+
+    def acquire(self, deadline=None):
+        self.acquired += 1
+        return AdaptiveLimiter.acquire(self, deadline)
+
+class TokenBucketTest(unittest.TestCase):
+    def test_burst_then_rate(self):
+        bucket = TokenBucket(50, burst=2)
+        self.assertEqual(bucket.acquire(), 0.0)
+        self.assertEqual(bucket.acquire(), 0.0)
+        started = time.time()
+        waited = bucket.acquire()
+        self.assertTrue(0 < waited <= 0.02)
+        self.assertTrue(time.time() - started >= waited * 0.9)
+
+    def test_deadline(self):
+        bucket = TokenBucket(1)
+        bucket.acquire()
+        self.assertRaises(socket.timeout, bucket.acquire, time.time() + 0.1)
+        # The refused caller did not take a token.
+        bucket.updated -= 1
+        self.assertEqual(bucket.acquire(time.time() + 0.1), 0.0)
+
+    def test_rate_must_be_positive(self):
+        self.assertRaises(Exception, TokenBucket, 0)
+
+class AdaptiveLimiterTest(unittest.TestCase):
+    def limiter(self, **options):
+        options.setdefault('tolerance', None)
+        return AdaptiveLimiter(LOGIN, HOST, **options)
+
+    def test_slots(self):
+        limiter = self.limiter(initial=2)
+        limiter.acquire()
+        limiter.acquire()
+        self.assertRaises(socket.timeout, limiter.acquire, time.time() + 0.01)
+        self.assertEqual(limiter.stats()['waiting'], 0)
+        waiter = threading.Thread(target=limiter.acquire)
+        waiter.start()
+        time.sleep(0.02)
+        self.assertEqual(limiter.stats()['waiting'], 1)
+        limiter.release()
+        waiter.join(5)
+        self.assertFalse(waiter.is_alive())
+        self.assertEqual(limiter.in_flight, 2)
+
+    def test_additive_increase(self):
+        limiter = self.limiter(initial=4)
+        for i in xrange(2):
+            limiter.acquire()
+        limiter.success(time.time())
+        self.assertAlmostEqual(limiter.limit, 4.25)
+        # Growing needs the slots to be in use.
+        limiter.success(time.time())
+        self.assertAlmostEqual(limiter.limit, 4.25)
+
+    def test_multiplicative_decrease_once_per_round_trip(self):
+        limiter = self.limiter(initial=10, decrease=0.5)
+        started = time.time()
+        for i in xrange(3):
+            limiter.acquire()
+        limiter.success(started, 429)
+        self.assertEqual(limiter.limit, 5)
+        # Sent before the cut: no second cut for the same round trip.
+        limiter.success(started, 503)
+        limiter.failure(started)
+        self.assertEqual(limiter.limit, 5)
+        time.sleep(0.01)
+        limiter.acquire()
+        limiter.failure(time.time())
+        self.assertEqual(limiter.limit, 2.5)
+        stats = limiter.stats()
+        self.assertEqual((stats['throttled'], stats['failures'], stats['decreases']), (2, 2, 2))
+        self.assertEqual(stats['in_flight'], 0)
+
+    def test_min_and_max_limit(self):
+        limiter = self.limiter(initial=2, min_limit=2, max_limit=2)
+        limiter.acquire()
+        limiter.failure(time.time())
+        self.assertEqual(limiter.limit, 2)
+        limiter.acquire()
+        limiter.acquire()
+        limiter.success(time.time())
+        self.assertEqual(limiter.limit, 2)
+        self.assertRaises(Exception, AdaptiveLimiter, LOGIN, HOST, initial=1, min_limit=2)
+
+    def test_slow_responses_cut_the_limit(self):
+        limiter = self.limiter(initial=8, tolerance=2.0, smoothing=1.0)
+        limiter.acquire()
+        limiter.success(time.time() - 0.01)
+        limiter.acquire()
+        limiter.success(time.time() - 0.1)
+        self.assertTrue(limiter.limit < 8)
+
+class RegistryTest(unittest.TestCase):
+    def tearDown(self):
+        set_limiter(LOGIN, HOST, None)
+
+    def test_limiter_set_after_the_client(self):
+        conn = AuthorizeNet(HOST, '/', 'text/plain', login=LOGIN, transport=AnsweringTransport(),
+            retry=RetryPolicy(1), breaker=CircuitBreaker(HOST))
+        self.assertEqual(conn.send('data'), 'ok')
+        limiter = CountingLimiter()
+        set_limiter(LOGIN, HOST, limiter)
+        self.assertTrue(get_limiter(LOGIN, HOST) is limiter)
+        conn.send('data')
+        self.assertEqual(limiter.acquired, 1)
+        self.assertEqual(limiter.in_flight, 0)
+        set_limiter(LOGIN, HOST, None)
+        conn.send('data')
+        self.assertEqual(limiter.acquired, 1)
+
+    def test_given_limiter_wins(self):
+        given = CountingLimiter()
+        set_limiter(LOGIN, HOST, CountingLimiter())
+        conn = AuthorizeNet(HOST, '/', 'text/plain', login=LOGIN, transport=AnsweringTransport(429),
+            retry=RetryPolicy(1), breaker=CircuitBreaker(HOST), limiter=given)
+        conn.send('data')
+        self.assertEqual(given.acquired, 1)
+        self.assertEqual(given.throttled, 1)
+        self.assertEqual(get_limiter(LOGIN, HOST).acquired, 0)
+
+if __name__ == '__main__':
+    unittest.main()
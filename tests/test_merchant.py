@@ -0,0 +1,96 @@
+# -*- coding: utf-8 -*-
+import unittest
+import urlparse
+
+from pythorizenet.aim import Transaction, Merchant, HOST_TEST
+from pythorizenet.duplicate import DuplicateCache, DUPLICATE_REASON_CODE
+
+class Gateway(object):
+    """Stands in for AuthorizeNet; approves everything."""
+    def __init__(self, delim='|'):
+        self.delim = delim
+        self.sent = []
+
+    def send(self, data, request_type=None):
+        self.sent.append((request_type, data))
+        fields = [''] * 55
+        fields[0] = '1'
+        fields[6] = str(len(self.sent))
+        fields[9] = '10.00'
+        fields[11] = request_type
+        return self.delim.join(fields)
+
+def prepare(trans, customer=True):
+    trans.set_amount('10.00')
+    trans.set_credit('4222222222222', ['2030', '1'], '123')
+    if customer:
+        trans.set_customer(u'Jörg', 'Doe', 'ACME', '1 Main St', 'Springfield', 'IL', '62701', '10.0.0.1')
+    return trans
+
+def fields(body):
+    return sorted(urlparse.parse_qsl(body, keep_blank_values=True))
+
+class MerchantFormTest(unittest.TestCase):
+    def transaction(self, is_test=False, duplicate_window=None, delimiter='|'):
+        trans = Transaction(HOST_TEST, 'login', 'key')
+        trans.delimiter = delimiter
+        trans.set_is_test(is_test)
+        trans.set_duplicate_window(duplicate_window)
+        return trans
+
+    def test_same_form_as_a_transaction(self):
+        for options in ({}, {'is_test': True}, {'duplicate_window': 0}, {'duplicate_window': 30, 'delimiter': ','}):
+            merchant = Merchant(HOST_TEST, 'login', 'key', **options)
+            for ccv, avs in ((False, False), (True, True)):
+                expected = prepare(self.transaction(**options))
+                trans = prepare(merchant.transaction())
+                for request in (expected, trans):
+                    request.set_require_ccv(ccv)
+                    request.set_require_avs(avs)
+                for requestType in ('AUTH_ONLY', 'AUTH_CAPTURE'):
+                    self.assertEqual(fields(trans._toPost(requestType)), fields(expected._toPost(requestType)))
+
+    def test_form_fields(self):
+        trans = prepare(Merchant(HOST_TEST, 'login', 'key', is_test=True).transaction())
+        trans.set_require_ccv(True)
+        body = trans._toPost('AUTH_CAPTURE')
+        self.assertTrue(body.startswith('x_login=login&x_tran_key=key&x_version=3.1&'))
+        self.assertEqual(dict(fields(body)), {
+            'x_login': 'login', 'x_tran_key': 'key', 'x_version': '3.1', 'x_recurring_billing': 'NO',
+            'x_delim_data': 'TRUE', 'x_delim_char': '|', 'x_relay_response': 'FALSE', 'x_test_request': 'YES',
+            'x_type': 'AUTH_CAPTURE', 'x_amount': '10.00', 'x_method': 'CC', 'x_card_num': '4222222222222',
+            'x_exp_date': '2030-01', 'x_card_code': '123', 'x_first_name': u'Jörg'.encode('utf-8'),
+            'x_last_name': 'Doe'})
+
+    def test_follow_ups(self):
+        merchant = Merchant(HOST_TEST, 'login', 'key')
+        trans = merchant.transaction()
+        self.assertRaises(Exception, trans._toPost, 'VOID')
+        trans.set_transaction_id('2150000001')
+        self.assertEqual(dict(fields(trans._toPost('VOID')))['x_trans_id'], '2150000001')
+        trans = prepare(merchant.transaction(), customer=False)
+        trans.set_require_ccv(True)
+        trans.payment = trans.payment[:3] + (None,)
+        self.assertRaises(Exception, trans._toPost, 'AUTH_ONLY')
+
+class MerchantTransactionTest(unittest.TestCase):
+    def test_transactions_share_the_merchant(self):
+        merchant = Merchant(HOST_TEST, 'login', 'key', delimiter=',')
+        merchant.conn = gateway = Gateway(',')
+        first, second = prepare(merchant.transaction()), prepare(merchant.transaction(), customer=False)
+        self.assertTrue(first.conn is second.conn is gateway)
+        self.assertEqual(first.auth_capture().transaction_id, '1')
+        self.assertEqual(second.authorize().transaction_id, '2')
+        self.assertEqual([request_type for request_type, data in gateway.sent], ['AUTH_CAPTURE', 'AUTH_ONLY'])
+        self.assertTrue(gateway.sent[0][1].startswith(merchant.prefix))
+        self.assertRaises(AttributeError, setattr, first, 'is_test', True)
+
+    def test_duplicate_cache(self):
+        merchant = Merchant(HOST_TEST, 'login', 'key', duplicate_cache=DuplicateCache())
+        merchant.conn = gateway = Gateway()
+        self.assertEqual(prepare(merchant.transaction()).auth_capture().code, 1)
+        self.assertEqual(prepare(merchant.transaction()).auth_capture().field(2), DUPLICATE_REASON_CODE)
+        self.assertEqual(len(gateway.sent), 1)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,139 @@
+import BaseHTTPServer
+import httplib
+import socket
+import threading
+import unittest
+
+from pythorizenet import AuthorizeNet, metrics
+from pythorizenet.pool import ConnectionPool
+from pythorizenet.retry import RetryPolicy, CircuitBreaker
+from pythorizenet.transport import PooledTransport
+
+RESPONSE = '|'.join(['1', '1', '1', 'Approved', '', 'P', '100'] + [''] * 48)
+XML = ('<?xml version="1.0" encoding="utf-8"?><ARBCreateSubscriptionResponse><messages>'
+    '<resultCode>Error</resultCode></messages></ARBCreateSubscriptionResponse>')
+
+class Handler(BaseHTTPServer.BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def do_POST(self):
+        self.rfile.read(int(self.headers['content-length']))
+        self.send_response(200)
+        self.send_header('content-length', str(len(RESPONSE)))
+        self.end_headers()
+        self.wfile.write(RESPONSE)
+
+    def log_message(self, *args):
+        pass
+
+class PlainPool(ConnectionPool):
+    def _connect(self):
+        return httplib.HTTPConnection(self.host)
+
+class Recorder(metrics.Observer):
+    def __init__(self):
+        self.timings = []
+
+    def request_finished(self, timing):
+        self.timings.append(timing)
+
+class Broken(metrics.Observer):
+    def request_finished(self, timing):
+        raise RuntimeError('observer bug')
+
+def unused_port():
+    sock = socket.socket()
+    sock.bind(('127.0.0.1', 0))
+    port = sock.getsockname()[1]
+    sock.close()
+    return port
+
+def client(host):
+    return AuthorizeNet(host, '/gateway/transact.dll', 'text/plain', transport=PooledTransport(host, PlainPool(host)),
+        retry=RetryPolicy(1), breaker=CircuitBreaker(host))
+
+class NotifyTest(unittest.TestCase):
+    def setUp(self):
+        self.server = BaseHTTPServer.HTTPServer(('127.0.0.1', 0), Handler)
+        thread = threading.Thread(target=self.server.serve_forever)
+        thread.daemon = True
+        thread.start()
+        self.host = '127.0.0.1:%d' % self.server.server_address[1]
+        self.recorder = Recorder()
+        self.broken = Broken()
+        metrics.add_observer(self.broken)
+        metrics.add_observer(self.recorder)
+
+    def tearDown(self):
+        metrics.remove_observer(self.broken)
+        metrics.remove_observer(self.recorder)
+        self.server.shutdown()
+        self.server.server_close()
+
+    def test_every_request_is_reported(self):
+        conn = client(self.host)
+        self.assertEqual(conn.send('x_amount=1.00', 'AUTH_CAPTURE'), RESPONSE)
+        self.assertEqual(conn.send('x_amount=1.00', 'VOID'), RESPONSE)
+        first, second = self.recorder.timings
+        self.assertEqual((first.host, first.path, first.request_type), (self.host, '/gateway/transact.dll', 'AUTH_CAPTURE'))
+        self.assertEqual((first.request_size, first.response_size, first.result_code), (13, len(RESPONSE), '1'))
+        self.assertEqual((first.reused, second.reused), (False, True))
+        self.assertTrue(first.error is None)
+        self.assertEqual([phase for phase, seconds in first.phases()], ['connect', 'upload', 'wait', 'download', 'total'])
+        self.assertEqual([phase for phase, seconds in second.phases()], ['upload', 'wait', 'download', 'total'])
+        self.assertTrue(first.total >= first.wait >= 0)
+
+    def test_failures_are_reported(self):
+        conn = client('127.0.0.1:%d' % unused_port())
+        self.assertRaises(socket.error, conn.send, 'data', 'AUTH_ONLY')
+        timing, = self.recorder.timings
+        self.assertTrue(isinstance(timing.error, socket.error))
+        self.assertTrue(timing.total is not None)
+        self.assertTrue(timing.response_size is None)
+
+    def test_nothing_is_reported_once_removed(self):
+        metrics.remove_observer(self.recorder)
+        client(self.host).send('data')
+        self.assertEqual(self.recorder.timings, [])
+
+class HistogramObserverTest(unittest.TestCase):
+    def timing(self, request_type, code=None, error=None, wait=0.02):
+        timing = metrics.RequestTiming('host', '/', request_type, 10)
+        timing.wait = wait
+        timing.result_code = code
+        timing.error = error
+        timing.finish()
+        return timing
+
+    def test_histograms_and_results(self):
+        observer = metrics.HistogramObserver()
+        observer.request_finished(self.timing('AUTH_CAPTURE', '1'))
+        observer.request_finished(self.timing('AUTH_CAPTURE', '2', wait=3.0))
+        observer.request_finished(self.timing('AUTH_CAPTURE', error=socket.timeout()))
+        observer.request_finished(self.timing(None))
+        snapshot = observer.snapshot()
+        self.assertEqual(snapshot['results'], {('AUTH_CAPTURE', '1'): 1, ('AUTH_CAPTURE', '2'): 1,
+            ('AUTH_CAPTURE', 'error'): 1, ('unknown', 'unknown'): 1})
+        wait = snapshot['latency'][('AUTH_CAPTURE', 'wait')]
+        self.assertEqual(wait['count'], 3)
+        self.assertEqual(wait['counts'][metrics.BUCKETS.index(0.025)], 2)
+        self.assertEqual(wait['counts'][metrics.BUCKETS.index(5.0)], 1)
+        text = observer.prometheus()
+        self.assertTrue('pythorizenet_requests_total{type="AUTH_CAPTURE",result="error"} 1\n' in text)
+        self.assertTrue('pythorizenet_request_seconds_bucket{type="AUTH_CAPTURE",phase="wait",le="+Inf"} 3\n' in text)
+
+    def test_percentile(self):
+        histogram = metrics.Histogram((1, 2, 3))
+        self.assertTrue(histogram.percentile(0.5) is None)
+        for value in (0.5, 0.5, 1.5, 2.5, 10):
+            histogram.observe(value)
+        self.assertEqual([histogram.percentile(fraction) for fraction in (0.2, 0.5, 0.7, 0.8, 1.0)],
+            [1, 2, 3, 3, float('inf')])
+
+    def test_result_code(self):
+        self.assertEqual(metrics.result_code(RESPONSE), '1')
+        self.assertEqual(metrics.result_code(XML), 'Error')
+        self.assertTrue(metrics.result_code('<html>Bad gateway</html>') is None)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,73 @@
+import unittest
+
+from pythorizenet.arb import RecurringResult
+from pythorizenet.cim import CustomerResult, RESULT_FIELDS, RESULT_LISTS
+from pythorizenet.compression import Body
+from pythorizenet.parser import MESSAGES, ResponseParser, parse
+
+PROFILE = ('<?xml version="1.0" encoding="utf-8"?>'
+    '<getCustomerProfileResponse xmlns:xsi="http://www.w3.org/2001/XMLSchema-instance" '
+    'xmlns="AnetApi/xml/v1/schema/AnetApiSchema.xsd">'
+    '<messages><resultCode>Ok</resultCode>'
+    '<message><code>I00001</code><text>Successful.</text></message>'
+    '<message><code>I00002</code><text>Second.</text></message></messages>'
+    '<profile><merchantCustomerId>cust &amp; co</merchantCustomerId><customerProfileId>10</customerProfileId>'
+    '<paymentProfiles><customerPaymentProfileId>20</customerPaymentProfileId></paymentProfiles>'
+    '<paymentProfiles><customerPaymentProfileId>21</customerPaymentProfileId></paymentProfiles>'
+    '</profile></getCustomerProfileResponse>')
+
+SUBSCRIPTION = ('<?xml version="1.0" encoding="utf-8"?>'
+    '<ARBCreateSubscriptionResponse xmlns="AnetApi/xml/v1/schema/AnetApiSchema.xsd">'
+    '<messages><resultCode>Ok</resultCode><message><code>I00001</code><text>Successful.</text></message>'
+    '</messages><subscriptionId>100</subscriptionId></ARBCreateSubscriptionResponse>')
+
+class ParserTest(unittest.TestCase):
+    def test_fields_and_lists(self):
+        root, values = parse(PROFILE, RESULT_FIELDS, RESULT_LISTS)
+        self.assertEqual(root, 'getCustomerProfileResponse')
+        self.assertEqual(values['resultCode'], 'Ok')
+        # Only the first occurrence of a field counts.
+        self.assertEqual(values['code'], 'I00001')
+        self.assertEqual(values['text'], 'Successful.')
+        self.assertEqual(values['merchantCustomerId'], 'cust & co')
+        self.assertEqual(values['customerProfileId'], '10')
+        self.assertEqual(values['customerPaymentProfileIdList'], ['20', '21'])
+
+    def test_namespaces_are_matched_on_local_names(self):
+        prefixed = PROFILE.replace('xmlns="', 'xmlns:a="').replace('<', '<a:').replace('<a:/', '</a:') \
+            .replace('<a:?xml', '<?xml')
+        self.assertEqual(parse(prefixed, RESULT_FIELDS, RESULT_LISTS), parse(PROFILE, RESULT_FIELDS, RESULT_LISTS))
+
+    def test_fed_in_pieces(self):
+        parser = ResponseParser(RESULT_FIELDS, RESULT_LISTS)
+        for i in xrange(len(PROFILE)):
+            parser.feed(PROFILE[i])
+        self.assertEqual(parser.close(), parse(PROFILE, RESULT_FIELDS, RESULT_LISTS))
+
+    def test_errors_wait_for_close(self):
+        parser = ResponseParser(MESSAGES)
+        parser.feed('<html><body>Service Unavailable</bod')
+        parser.feed('y></html>trailing<')
+        self.assertRaises(Exception, parser.close)
+
+    def test_results(self):
+        result = CustomerResult(PROFILE)
+        self.assertEqual(result.resultCode, 'Ok')
+        self.assertEqual(result.profile_id, '10')
+        self.assertEqual(result.merchant_customer_id, 'cust & co')
+        self.assertEqual(result.payment_profile_ids, ['20', '21'])
+        result = RecurringResult(SUBSCRIPTION)
+        self.assertEqual((result.resultCode, result.code, result.subscription_id), ('Ok', 'I00001', '100'))
+
+    def test_result_from_fed_parser(self):
+        parser = ResponseParser(RESULT_FIELDS, RESULT_LISTS)
+        body = Body(None, parser.feed)
+        for i in xrange(0, len(PROFILE), 7):
+            body.add(PROFILE[i:i + 7])
+        # A fed body is not kept.
+        self.assertEqual(body.finish(), None)
+        self.assertEqual(body.chunks, [])
+        self.assertEqual(CustomerResult(parser).payment_profile_ids, ['20', '21'])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,108 @@
+import BaseHTTPServer
+import httplib
+import threading
+import time
+import unittest
+
+from pythorizenet import AuthorizeNet
+from pythorizenet.pool import ConnectionPool
+from pythorizenet.retry import RetryPolicy, CircuitBreaker
+from pythorizenet.transport import PooledTransport
+
+class Handler(BaseHTTPServer.BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def setup(self):
+        BaseHTTPServer.BaseHTTPRequestHandler.setup(self)
+        self.server.connections += 1
+
+    def do_POST(self):
+        self.rfile.read(int(self.headers['content-length']))
+        self.server.requests += 1
+        self.send_response(200)
+        self.send_header('content-length', '2')
+        self.end_headers()
+        self.wfile.write('ok')
+        # Hang up without saying so, like a gateway dropping idle sockets.
+        self.close_connection = self.server.hang_up
+
+    def log_message(self, *args):
+        pass
+
+class Server(BaseHTTPServer.HTTPServer):
+    def __init__(self):
+        BaseHTTPServer.HTTPServer.__init__(self, ('127.0.0.1', 0), Handler)
+        self.connections = 0
+        self.requests = 0
+        self.hang_up = False
+
+class PlainPool(ConnectionPool):
+    def _connect(self):
+        return httplib.HTTPConnection(self.host)
+
+class ConnectionPoolTest(unittest.TestCase):
+    def setUp(self):
+        self.server = Server()
+        thread = threading.Thread(target=self.server.serve_forever)
+        thread.daemon = True
+        thread.start()
+        self.host = '127.0.0.1:%d' % self.server.server_address[1]
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def client(self, pool):
+        return AuthorizeNet(self.host, '/', 'text/plain', transport=PooledTransport(self.host, pool),
+            retry=RetryPolicy(1), breaker=CircuitBreaker(self.host))
+
+    def test_connections_are_reused(self):
+        pool = PlainPool(self.host)
+        conn = self.client(pool)
+        for i in xrange(3):
+            self.assertEqual(conn.send('data'), 'ok')
+        self.assertEqual((self.server.requests, self.server.connections), (3, 1))
+        self.assertEqual(len(pool.idle), 1)
+        first, reused = pool.get()
+        self.assertTrue(reused)
+        second, reused = pool.get()
+        self.assertFalse(reused)
+        self.assertTrue(second.sock is None)
+
+    def test_closed_connections_are_not_reused(self):
+        self.server.hang_up = True
+        pool = PlainPool(self.host)
+        conn = self.client(pool)
+        self.assertEqual(conn.send('data'), 'ok')
+        time.sleep(0.05)
+        self.assertEqual(conn.send('data'), 'ok')
+        self.assertEqual((self.server.requests, self.server.connections), (2, 2))
+        self.assertEqual(conn.breaker.failures, 0)
+
+    def test_idle_timeout(self):
+        pool = PlainPool(self.host, idle_timeout=0.05)
+        conn = self.client(pool)
+        conn.send('data')
+        stale = pool.idle[0][0]
+        time.sleep(0.1)
+        conn.send('data')
+        self.assertEqual(self.server.connections, 2)
+        self.assertTrue(stale.sock is None)
+        time.sleep(0.1)
+        pool.evict()
+        self.assertEqual(pool.idle, [])
+
+    def test_max_size(self):
+        pool = PlainPool(self.host, max_size=1)
+        first, second = pool._connect(), pool._connect()
+        for conn in (first, second):
+            conn.connect()
+            pool.put(conn)
+        self.assertEqual([conn for conn, last_used in pool.idle], [first])
+        self.assertTrue(second.sock is None)
+        pool.close()
+        self.assertEqual(pool.idle, [])
+        self.assertTrue(first.sock is None)
+
+if __name__ == '__main__':
+    unittest.main()
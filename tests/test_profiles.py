@@ -0,0 +1,129 @@
+import time
+import unittest
+
+from pythorizenet.aio import AsyncCustomer, Future
+from pythorizenet.cim import Customer, HOST_TEST
+from pythorizenet.profiles import ProfileCache
+
+RESPONSE = ('<?xml version="1.0" encoding="utf-8"?>'
+    '<%(root)s xmlns="AnetApi/xml/v1/schema/AnetApiSchema.xsd">'
+    '<messages><resultCode>%(code)s</resultCode><message><code>I00001</code><text>Successful.</text></message>'
+    '</messages>%(body)s</%(root)s>')
+
+BODIES = {
+    'getCustomerProfileRequest': '<profile><customerProfileId>10</customerProfileId></profile>',
+    'getCustomerPaymentProfileRequest': '<paymentProfile><customerPaymentProfileId>20</customerPaymentProfileId>'
+        '</paymentProfile>',
+    'createCustomerProfileRequest': '<customerProfileId>10</customerProfileId>',
+    'createCustomerPaymentProfileRequest': '<customerPaymentProfileId>21</customerPaymentProfileId>',
+    'createCustomerShippingAddressRequest': '<customerAddressId>30</customerAddressId>',
+}
+
+def response(requestType, code='Ok'):
+    root = requestType.replace('Request', 'Response')
+    return RESPONSE % {'root': root, 'code': code, 'body': BODIES[requestType]}
+
+class Gateway(object):
+    """Stands in for AuthorizeNet."""
+    def __init__(self, code='Ok'):
+        self.code = code
+        self.sent = []
+
+    def send(self, data, request_type=None, feed=None):
+        self.sent.append(request_type)
+        body = response(request_type, self.code)
+        if feed is None:
+            return body
+        feed(body)
+
+class AsyncGateway(Gateway):
+    """Stands in for AsyncAuthorizeNet; answers once complete() is called."""
+    def __init__(self, code='Ok'):
+        Gateway.__init__(self, code)
+        self.futures = []
+
+    def send(self, data, request_type=None):
+        future = Future()
+        self.futures.append((future, Gateway.send(self, data, request_type)))
+        return future
+
+    def complete(self):
+        futures, self.futures = self.futures, []
+        for future, body in futures:
+            future.set_result(body)
+
+def customer(cache, gateway=None, cls=Customer):
+    customer = cls(HOST_TEST, 'login', 'key')
+    customer.conn = gateway or Gateway()
+    customer.set_profile_cache(cache)
+    customer.set_profile_id('10')
+    customer.set_payment_profile_id('20')
+    return customer
+
+class ProfileCacheTest(unittest.TestCase):
+    def test_lookups_are_cached_until_invalidated(self):
+        cache = ProfileCache()
+        sync = customer(cache)
+        first = sync.get()
+        self.assertTrue(sync.get() is first)
+        self.assertTrue(sync.getPayment() is sync.getPayment())
+        self.assertEqual(sync.conn.sent, ['getCustomerProfileRequest', 'getCustomerPaymentProfileRequest'])
+        sync.add_payment('4222222222222', ['2030', '12'])
+        sync.createPayment()
+        self.assertEqual(cache.stats()['entries'], 0)
+        self.assertFalse(sync.get() is first)
+
+    def test_failures_are_not_cached(self):
+        sync = customer(ProfileCache(), Gateway('Error'))
+        sync.get()
+        sync.get()
+        self.assertEqual(len(sync.conn.sent), 2)
+
+    def test_expiry_and_eviction(self):
+        cache = ProfileCache(ttl=0.05, max_entries=1)
+        sync = customer(cache)
+        sync.get()
+        sync.getPayment()
+        self.assertEqual(cache.stats()['evictions'], 1)
+        sync.getPayment()
+        time.sleep(0.1)
+        sync.getPayment()
+        self.assertEqual(len(sync.conn.sent), 3)
+
+    def test_async_customers_share_the_cache(self):
+        cache = ProfileCache()
+        gateway = AsyncGateway()
+        async = customer(cache, gateway, AsyncCustomer)
+        fetched = async.get()
+        gateway.complete()
+        self.assertEqual(fetched.result().profile_id, '10')
+        sync = customer(cache)
+        self.assertTrue(sync.get() is fetched.result())
+        self.assertEqual(sync.conn.sent, [])
+        cached = async.get()
+        self.assertTrue(cached.result() is fetched.result())
+        # Changes made through the async client drop what it changed.
+        async.add_shipping('Jane', 'Doe')
+        created = async.createShipping()
+        self.assertEqual(cache.stats()['entries'], 1)
+        gateway.complete()
+        self.assertEqual(created.result().shipping_address_id, '30')
+        self.assertEqual(cache.stats()['entries'], 0)
+        sync.get()
+        created = async.create()
+        gateway.complete()
+        self.assertEqual(created.result().profile_id, '10')
+        self.assertEqual(cache.stats()['entries'], 0)
+        self.assertEqual(gateway.sent, ['getCustomerProfileRequest', 'createCustomerShippingAddressRequest',
+            'createCustomerProfileRequest'])
+
+    def test_async_lookups_need_ids(self):
+        async = customer(ProfileCache(), AsyncGateway(), AsyncCustomer)
+        async.set_payment_profile_id(None)
+        self.assertRaises(Exception, async.getPayment)
+        async.set_profile_id(None)
+        self.assertRaises(Exception, async.get)
+        self.assertEqual(async.conn.sent, [])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,133 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+from pythorizenet import generate_hash
+from pythorizenet.reconcile import _cents, split, reconcile, save, load, COLUMNS
+
+LOGIN = 'login'
+SALT = 'secret'
+
+def response(code, trans_id, amount, reason='Approved', hash=None, delim='|'):
+    fields = [''] * 55
+    fields[0] = code
+    fields[3] = reason
+    fields[6] = trans_id
+    fields[9] = amount
+    if hash is None:
+        hash = generate_hash(SALT, LOGIN, trans_id, amount)
+    fields[37] = hash
+    return delim.join(fields)
+
+class CentsTest(unittest.TestCase):
+    def test_amounts(self):
+        for amount, cents in (('', 0), ('10', 1000), ('10.', 1000), ('.5', 50), ('10.05', 1005), ('1.239', 123),
+                ('-0.50', -50), ('-12.34', -1234), ('+1.5', 150)):
+            self.assertEqual(_cents(amount), cents, amount)
+
+    def test_bad_amounts(self):
+        for amount in ('-', '.', '1.2.3', ' 1', '--1', '1e3', 'abc', '1,000.00'):
+            self.assertRaises(ValueError, _cents, amount)
+
+class SplitTest(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_chunks_end_on_line_boundaries(self):
+        path = os.path.join(self.directory, 'lines')
+        data = ''.join('%d\n' % i for i in xrange(1000))
+        open(path, 'wb').write(data)
+        for chunks in (1, 3, 7, 2000):
+            ranges = split(path, chunks)
+            self.assertEqual(''.join(data[start:end] for start, end in ranges), data)
+            for start, end in ranges:
+                self.assertEqual(data[end - 1], '\n')
+        open(path, 'wb').close()
+        self.assertEqual(split(path, 4), [])
+
+@unittest.skipIf(numpy is None, 'numpy is not installed')
+class ReconcileTest(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.path = os.path.join(self.directory, 'responses.log')
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def write(self, lines):
+        out = open(self.path, 'wb')
+        out.write('\r\n'.join(lines) + '\n\n')
+        out.close()
+
+    def rows(self, totals):
+        return dict((int(trans_id), dict((name, int(totals[name][index])) for name in COLUMNS[1:]))
+            for index, trans_id in enumerate(totals['transaction_id']))
+
+    def test_responses_are_matched_by_transaction_id(self):
+        lines = [
+            response('1', '20', '10.00'),
+            response('2', '30', '5.25'),
+            response('1', '10', '1.00', '(TESTMODE) Approved'),
+            response('1', '20', '-0.50'),
+            response('4', '20', '2.00'),
+            response('1', '10', '1.00', hash='0' * 32),
+            response('3', '30', '5.25'),
+            response('1', '40', 'nonsense'),
+        ]
+        self.write(lines * 3)
+        expected = {
+            10: {'approved': 2, 'approved_cents': 200, 'test': 1, 'bad_hash': 1},
+            20: {'approved': 2, 'approved_cents': 950, 'held': 1, 'held_cents': 200},
+            30: {'declined': 1, 'declined_cents': 525, 'errors': 1},
+            40: {'errors': 1},
+        }
+        for trans_id, columns in expected.items():
+            expected[trans_id] = dict((name, columns.get(name, 0) * 3) for name in COLUMNS[1:])
+        for chunks in (1, 2, 5, 50):
+            totals = reconcile(self.path, LOGIN, SALT, processes=1, chunks=chunks)
+            self.assertEqual(list(totals['transaction_id']), [10, 20, 30, 40])
+            self.assertEqual(self.rows(totals), expected)
+        self.assertEqual(self.rows(reconcile(self.path, LOGIN, SALT, processes=2)), expected)
+        # Without a salt nothing is checked.
+        self.assertEqual(reconcile(self.path, processes=1)['bad_hash'].sum(), 0)
+
+    def test_non_numeric_ids_do_not_merge_into_others(self):
+        self.write([response('1', '0', '1.00'), response('1', 'abc', '5.00'), response('1', 'xyz', '7.00'),
+            response('1', '', '2.00'), 'garbage'])
+        rows = self.rows(reconcile(self.path, LOGIN, SALT, processes=1))
+        self.assertEqual(rows.keys(), [0])
+        self.assertEqual((rows[0]['approved'], rows[0]['approved_cents'], rows[0]['errors']), (2, 300, 3))
+
+    def test_custom_delimiter(self):
+        self.write([response('1', '5', '3.00', delim=','), response('2', '6', '4.00', delim=',')])
+        rows = self.rows(reconcile(self.path, LOGIN, SALT, ',', processes=1))
+        self.assertEqual((rows[5]['approved_cents'], rows[6]['declined_cents']), (300, 400))
+        self.assertEqual(rows[5]['bad_hash'] + rows[6]['bad_hash'], 0)
+
+    def test_empty_log(self):
+        self.write([])
+        totals = reconcile(self.path, processes=1)
+        self.assertEqual(len(totals['transaction_id']), 0)
+        self.assertEqual(sorted(totals), sorted(COLUMNS))
+
+    def test_save_and_load(self):
+        self.write([response('1', '20', '10.00'), response('2', '21', '1.00')])
+        totals = reconcile(self.path, LOGIN, SALT, processes=1)
+        path = os.path.join(self.directory, 'totals.npz')
+        save(totals, path)
+        loaded = load(path)
+        self.assertEqual(sorted(loaded), sorted(totals))
+        for name in totals:
+            self.assertEqual(list(loaded[name]), list(totals[name]))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,180 @@
+import errno
+import httplib
+import socket
+import ssl
+import time
+import unittest
+
+from pythorizenet import AuthorizeNet, DEFAULT_CONNECT_TIMEOUT, DEFAULT_READ_TIMEOUT
+from pythorizenet.aio import AsyncAuthorizeNet, Loop
+from pythorizenet.retry import (RetryPolicy, CircuitBreaker, CircuitOpen, is_stale, deadline_exceeded, NO_RETRY,
+    STAGE_CONNECT, STAGE_SEND, STAGE_WAIT, STAGE_READ, CIRCUIT_CLOSED, CIRCUIT_OPEN, CIRCUIT_HALF_OPEN)
+from pythorizenet.transport import Transport
+
+HOST = 'gateway.invalid'
+RESET = socket.error(errno.ECONNRESET, 'Connection reset by peer')
+REFUSED = socket.error(errno.ECONNREFUSED, 'Connection refused')
+
+class ScriptedTransport(Transport):
+    """Fails each attempt with the next (stage, reused, error) in script,
+    and answers once it runs out."""
+    def __init__(self, script):
+        self.script = list(script)
+        self.attempts = []
+
+    def request(self, client, data, deadline, timing, progress, fresh=False, headers=(), feed=None):
+        self.attempts.append(fresh)
+        if not self.script:
+            progress[0] = STAGE_READ
+            return 200, 'ok'
+        stage, reused, error = self.script.pop(0)
+        progress[0] = stage
+        progress[2] = reused
+        if callable(error):
+            error = error()
+        raise error
+
+def client(script, attempts=3, threshold=5):
+    transport = ScriptedTransport(script)
+    conn = AuthorizeNet(HOST, '/', 'text/plain', transport=transport,
+        retry=RetryPolicy(attempts, backoff=0), breaker=CircuitBreaker(HOST, threshold))
+    return conn, transport
+
+class ClassificationTest(unittest.TestCase):
+    def test_is_stale(self):
+        self.assertTrue(is_stale(RESET, STAGE_SEND, True))
+        self.assertFalse(is_stale(RESET, STAGE_SEND, False))
+        self.assertFalse(is_stale(socket.timeout(), STAGE_SEND, True))
+        # Once the request is out the gateway may have acted on it.
+        self.assertFalse(is_stale(httplib.BadStatusLine("''"), STAGE_WAIT, True))
+        self.assertFalse(is_stale(RESET, STAGE_WAIT, True))
+        self.assertFalse(is_stale(RESET, STAGE_READ, True))
+
+    def test_retryable(self):
+        policy = RetryPolicy()
+        self.assertTrue(policy.retryable(REFUSED, STAGE_CONNECT, False))
+        self.assertTrue(policy.retryable(socket.timeout(), STAGE_CONNECT, False))
+        self.assertFalse(policy.retryable(ssl.SSLError(1, 'certificate verify failed'), STAGE_CONNECT, False))
+        self.assertFalse(policy.retryable(CircuitOpen('open'), STAGE_CONNECT, False))
+        self.assertTrue(policy.retryable(RESET, STAGE_SEND, True))
+        self.assertFalse(policy.retryable(RESET, STAGE_SEND, False))
+        self.assertFalse(policy.retryable(httplib.BadStatusLine("''"), STAGE_WAIT, True))
+        self.assertFalse(policy.retryable(socket.timeout(), STAGE_READ, True))
+
+    def test_delay(self):
+        policy = RetryPolicy(backoff=0.1, max_backoff=0.3)
+        self.assertEqual([policy.delay(attempt) for attempt in (1, 2, 3, 4)], [0.1, 0.2, 0.3, 0.3])
+
+    def test_deadline_exceeded(self):
+        self.assertTrue(deadline_exceeded(socket.timeout(), time.time()))
+        self.assertFalse(deadline_exceeded(socket.timeout(), time.time() + 1))
+        self.assertFalse(deadline_exceeded(socket.timeout(), None))
+        self.assertFalse(deadline_exceeded(RESET, time.time()))
+
+class CircuitBreakerTest(unittest.TestCase):
+    def test_opens_after_threshold(self):
+        breaker = CircuitBreaker(HOST, threshold=2, reset_timeout=60)
+        breaker.failure()
+        breaker.allow()
+        self.assertEqual(breaker.state, CIRCUIT_CLOSED)
+        breaker.failure()
+        self.assertEqual(breaker.state, CIRCUIT_OPEN)
+        self.assertRaises(CircuitOpen, breaker.allow)
+
+    def test_success_resets_the_count(self):
+        breaker = CircuitBreaker(HOST, threshold=2)
+        breaker.failure()
+        breaker.success()
+        breaker.failure()
+        self.assertEqual(breaker.state, CIRCUIT_CLOSED)
+
+    def test_half_open_lets_one_trial_through(self):
+        breaker = CircuitBreaker(HOST, threshold=1, reset_timeout=0.05)
+        breaker.failure()
+        self.assertRaises(CircuitOpen, breaker.allow)
+        time.sleep(0.1)
+        breaker.allow()
+        self.assertEqual(breaker.state, CIRCUIT_HALF_OPEN)
+        self.assertRaises(CircuitOpen, breaker.allow)
+        breaker.failure()
+        self.assertEqual(breaker.state, CIRCUIT_OPEN)
+        time.sleep(0.1)
+        breaker.allow()
+        breaker.success()
+        self.assertEqual(breaker.state, CIRCUIT_CLOSED)
+        breaker.allow()
+        breaker.allow()
+
+    def test_unfinished_trial_expires(self):
+        breaker = CircuitBreaker(HOST, threshold=1, reset_timeout=0.05)
+        breaker.failure()
+        time.sleep(0.1)
+        breaker.allow()
+        self.assertRaises(CircuitOpen, breaker.allow)
+        time.sleep(0.1)
+        breaker.allow()
+        breaker.release()
+        breaker.allow()
+        self.assertEqual(breaker.state, CIRCUIT_HALF_OPEN)
+
+class SendTest(unittest.TestCase):
+    def test_connect_failures_are_retried_and_counted(self):
+        conn, transport = client([(STAGE_CONNECT, False, REFUSED)] * 2)
+        self.assertEqual(conn.send('data'), 'ok')
+        self.assertEqual(len(transport.attempts), 3)
+        self.assertEqual(conn.breaker.state, CIRCUIT_CLOSED)
+        conn, transport = client([(STAGE_CONNECT, False, REFUSED)] * 3)
+        self.assertRaises(socket.error, conn.send, 'data')
+        self.assertEqual(conn.breaker.failures, 3)
+
+    def test_stale_socket_is_replaced_without_counting(self):
+        conn, transport = client([(STAGE_SEND, True, RESET)] * 2, attempts=1)
+        self.assertEqual(conn.send('data'), 'ok')
+        self.assertEqual(transport.attempts, [False, True, True])
+        self.assertEqual(conn.breaker.failures, 0)
+
+    def test_nothing_is_resent_once_the_request_is_out(self):
+        for stage, error in ((STAGE_WAIT, httplib.BadStatusLine("''")), (STAGE_READ, RESET)):
+            conn, transport = client([(stage, True, error)])
+            self.assertRaises(type(error), conn.send, 'data')
+            self.assertEqual(len(transport.attempts), 1)
+
+    def test_no_retry(self):
+        conn, transport = client([(STAGE_CONNECT, False, REFUSED)])
+        conn.retry = NO_RETRY
+        self.assertRaises(socket.error, conn.send, 'data')
+        self.assertEqual(len(transport.attempts), 1)
+
+    def test_deadline_timeouts_do_not_open_the_circuit(self):
+        conn, transport = client([(STAGE_WAIT, False, socket.timeout('deadline'))] * 3, threshold=2)
+        for i in xrange(3):
+            self.assertRaises(socket.timeout, conn.send, 'data', deadline=time.time())
+        self.assertEqual(conn.breaker.failures, 0)
+        self.assertEqual(conn.send('data'), 'ok')
+
+    def test_trial_ending_in_a_deadline_timeout_is_released(self):
+        conn, transport = client([(STAGE_CONNECT, False, REFUSED), (STAGE_WAIT, False, socket.timeout('deadline'))],
+            attempts=1, threshold=1)
+        conn.breaker.reset_timeout = 0.05
+        self.assertRaises(socket.error, conn.send, 'data')
+        self.assertEqual(conn.breaker.state, CIRCUIT_OPEN)
+        time.sleep(0.1)
+        self.assertRaises(socket.timeout, conn.send, 'data', deadline=time.time())
+        self.assertEqual(conn.breaker.state, CIRCUIT_HALF_OPEN)
+        self.assertEqual(conn.send('data'), 'ok')
+        self.assertEqual(conn.breaker.state, CIRCUIT_CLOSED)
+
+    def test_read_timeouts_open_the_circuit(self):
+        conn, transport = client([(STAGE_WAIT, False, socket.timeout('timed out'))] * 2, threshold=2)
+        for i in xrange(2):
+            self.assertRaises(socket.timeout, conn.send, 'data', deadline=time.time() + 60)
+        self.assertRaises(CircuitOpen, conn.send, 'data')
+
+class AsyncTimeoutTest(unittest.TestCase):
+    def test_default_timeout(self):
+        conn = AsyncAuthorizeNet(HOST, '/', 'text/plain', Loop())
+        self.assertEqual(conn.timeout, DEFAULT_CONNECT_TIMEOUT + DEFAULT_READ_TIMEOUT)
+        self.assertEqual(AsyncAuthorizeNet(HOST, '/', 'text/plain', Loop(), 5).timeout, 5)
+
+if __name__ == '__main__':
+    unittest.main()
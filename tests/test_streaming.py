@@ -0,0 +1,115 @@
+import BaseHTTPServer
+import httplib
+import threading
+import unittest
+
+from pythorizenet import AuthorizeNet
+from pythorizenet.cim import Customer, HOST_TEST
+from pythorizenet.pool import ConnectionPool
+from pythorizenet.retry import RetryPolicy, CircuitBreaker
+from pythorizenet.template import Stream
+from pythorizenet.transport import PooledTransport
+
+RESPONSE = ('<?xml version="1.0" encoding="utf-8"?><createCustomerProfileResponse xmlns="AnetApi/xml/v1/schema/'
+    'AnetApiSchema.xsd"><messages><resultCode>Ok</resultCode><message><code>I00001</code><text>Successful.</text>'
+    '</message></messages><customerProfileId>10</customerProfileId></createCustomerProfileResponse>')
+
+class Handler(BaseHTTPServer.BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def do_POST(self):
+        if self.headers.getheader('transfer-encoding', '').lower() == 'chunked':
+            body, chunks = self._read_chunked()
+        else:
+            body, chunks = self.rfile.read(int(self.headers['content-length'])), None
+        self.server.requests.append((body, chunks))
+        self.send_response(200)
+        self.send_header('content-length', str(len(RESPONSE)))
+        self.end_headers()
+        self.wfile.write(RESPONSE)
+
+    def _read_chunked(self):
+        chunks = []
+        while True:
+            size = int(self.rfile.readline().split(';')[0], 16)
+            if not size:
+                break
+            chunks.append(self.rfile.read(size))
+            self.rfile.readline()
+        while self.rfile.readline() not in ('\r\n', '\n', ''):
+            pass
+        return ''.join(chunks), len(chunks)
+
+    def log_message(self, *args):
+        pass
+
+class PlainPool(ConnectionPool):
+    def _connect(self):
+        return httplib.HTTPConnection(self.host)
+
+class StreamingTest(unittest.TestCase):
+    def setUp(self):
+        self.server = BaseHTTPServer.HTTPServer(('127.0.0.1', 0), Handler)
+        self.server.requests = []
+        thread = threading.Thread(target=self.server.serve_forever)
+        thread.daemon = True
+        thread.start()
+        self.host = '127.0.0.1:%d' % self.server.server_address[1]
+        self.transport = PooledTransport(self.host, PlainPool(self.host))
+
+    def tearDown(self):
+        self.transport.close()
+        self.server.shutdown()
+        self.server.server_close()
+
+    def customer(self, payments):
+        customer = Customer(HOST_TEST, 'login', 'key')
+        customer.conn.set_transport(self.transport)
+        customer.set_customer_id('1')
+        for i in xrange(payments):
+            customer.add_payment('4222222222222', ('2030', '12'))
+            customer.add_billto('Jane', 'Doe %d' % i, address='%d Main St' % i)
+        return customer
+
+    def test_large_requests_are_streamed(self):
+        customer = self.customer(3000)
+        expected = customer._toXml('createCustomerProfileRequest')
+        self.assertTrue(isinstance(customer._body('createCustomerProfileRequest'), Stream))
+        self.assertEqual(customer.create().profile_id, '10')
+        body, chunks = self.server.requests[-1]
+        self.assertEqual(body, expected)
+        self.assertTrue(chunks > 1)
+
+    def test_small_requests_are_not(self):
+        customer = self.customer(2)
+        self.assertEqual(customer.create().profile_id, '10')
+        self.assertEqual(self.server.requests[-1], (customer._toXml('createCustomerProfileRequest'), None))
+        customer.set_stream_threshold(2)
+        customer.create()
+        self.assertEqual(self.server.requests[-1][0], customer._toXml('createCustomerProfileRequest'))
+        self.assertEqual(self.server.requests[-1][1], 1)
+        customer = self.customer(1000)
+        customer.set_stream_threshold(None)
+        customer.create()
+        self.assertEqual(self.server.requests[-1][1], None)
+
+    def test_streams_can_be_sent_again(self):
+        customer = self.customer(500)
+        stream = customer._body('createCustomerProfileRequest')
+        conn = AuthorizeNet(self.host, '/xml/v1/request.api', 'text/xml', transport=self.transport,
+            retry=RetryPolicy(1), breaker=CircuitBreaker(self.host))
+        conn.send(stream)
+        conn.send(stream)
+        first, second = self.server.requests
+        self.assertEqual(first, second)
+        self.assertEqual(first[0], customer._toXml('createCustomerProfileRequest'))
+
+    def test_empty_chunks(self):
+        conn = AuthorizeNet(self.host, '/', 'text/plain', transport=self.transport,
+            retry=RetryPolicy(1), breaker=CircuitBreaker(self.host))
+        conn.send(['', 'a', '', 'bc', ''])
+        conn.send([])
+        self.assertEqual(self.server.requests, [('abc', 2), ('', 0)])
+
+if __name__ == '__main__':
+    unittest.main()
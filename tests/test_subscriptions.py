@@ -0,0 +1,54 @@
+# -*- coding: utf-8 -*-
+import codecs
+import os
+import shutil
+import tempfile
+import unittest
+
+from pythorizenet.arb import HOST_TEST
+from pythorizenet.subscriptions import SubscriptionImport, read_rows
+
+HEADER = 'action,amount,card_num,exp_year,exp_month,first_name,last_name,city\n'
+ROW = u'create,10.00,4222222222222,2030,12,Jörg,Müller,München\n'
+
+class SubscriptionImportTest(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def write(self, name, data):
+        path = os.path.join(self.directory, name)
+        source = open(path, 'wb')
+        source.write(data)
+        source.close()
+        return path
+
+    def test_csv_rows_are_decoded(self):
+        path = self.write('rows.csv', codecs.BOM_UTF8 + HEADER + ROW.encode('utf-8'))
+        rows = list(read_rows(path))
+        self.assertEqual(len(rows), 1)
+        self.assertEqual(rows[0]['action'], u'create')
+        self.assertEqual(rows[0]['first_name'], u'Jörg')
+        self.assertEqual(rows[0]['city'], u'München')
+
+    def test_other_encodings(self):
+        path = self.write('rows.csv', HEADER + ROW.encode('latin-1'))
+        rows = list(read_rows(path, encoding='latin-1'))
+        self.assertEqual(rows[0]['last_name'], u'Müller')
+
+    def test_jsonl_rows(self):
+        path = self.write('rows.jsonl', u'{"first_name": "Jörg", "amount": "1.00"}\n\n'.encode('utf-8'))
+        self.assertEqual(list(read_rows(path)), [{u'first_name': u'Jörg', u'amount': u'1.00'}])
+
+    def test_non_ascii_rows_render(self):
+        path = self.write('rows.csv', HEADER + ROW.encode('utf-8'))
+        pipeline = SubscriptionImport(HOST_TEST, 'login', 'key', path, os.path.join(self.directory, 'out.csv'))
+        row = read_rows(path).next()
+        xml = pipeline.recurring(row)._toXml('ARBCreateSubscriptionRequest')
+        self.assertTrue(u'<firstName>Jörg</firstName>'.encode('utf-8') in xml)
+        self.assertTrue(u'<city>München</city>'.encode('utf-8') in xml)
+
+if __name__ == '__main__':
+    unittest.main()
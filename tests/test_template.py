@@ -0,0 +1,126 @@
+# -*- coding: utf-8 -*-
+import datetime
+import random
+import unittest
+
+from lxml import etree
+
+from pythorizenet import TYPE_CREDIT
+from pythorizenet.arb import Recurring, ANET_XMLNS
+from pythorizenet.cim import Customer, TEMPLATES as CIM_TEMPLATES
+from pythorizenet.template import Template, text, opt, group, escape
+
+def lxml_subscription(self, requestType):
+    """Recurring._toXml as it was before templates, building an lxml tree."""
+    root = etree.Element(requestType, xmlns=ANET_XMLNS)
+    auth = etree.SubElement(root, "merchantAuthentication")
+    etree.SubElement(auth, "name").text = self.login
+    etree.SubElement(auth, "transactionKey").text = self.key
+    if self.subscription_id:
+        etree.SubElement(root, 'subscriptionId').text = str(self.subscription_id)
+    if requestType != 'ARBCancelSubscriptionRequest':
+        subscription = etree.SubElement(root, 'subscription')
+        if self.schedule:
+            (start, total, count, unit) = self.schedule
+            schedule = etree.SubElement(subscription, 'paymentSchedule')
+            interval = etree.SubElement(schedule, 'interval')
+            etree.SubElement(interval, 'length').text = str(count)
+            etree.SubElement(interval, 'unit').text = str(unit)
+            etree.SubElement(schedule, 'startDate').text = start.strftime('%Y-%m-%d')
+            if self.trial:
+                total += self.trial[0]
+                etree.SubElement(schedule, 'trialOccurrences').text = str(self.trial[0])
+            etree.SubElement(schedule, 'totalOccurrences').text = str(total)
+        if self.amount:
+            etree.SubElement(subscription, 'amount').text = str(self.amount)
+        if self.trial:
+            etree.SubElement(subscription, 'trialAmount').text = str(self.trial[1])
+        if self.payment:
+            type = self.payment[0]
+            if type == TYPE_CREDIT:
+                (card_num, card_exp) = self.payment[1]
+                payment = etree.SubElement(subscription, 'payment')
+                credit = etree.SubElement(payment, 'creditCard')
+                etree.SubElement(credit, 'cardNumber').text = card_num
+                etree.SubElement(credit, 'expirationDate').text = '%s-%s' % card_exp
+        if self.customer:
+            (first_name, last_name, company, address, city, state, zip, country) = self.customer
+            customer = etree.SubElement(subscription, 'billTo')
+            etree.SubElement(customer, 'firstName').text = first_name
+            etree.SubElement(customer, 'lastName').text = last_name
+            if company:
+                etree.SubElement(customer, 'company').text = company
+            if address:
+                etree.SubElement(customer, 'address').text = address
+            if city:
+                etree.SubElement(customer, 'city').text = city
+            if state:
+                etree.SubElement(customer, 'state').text = state
+            if zip:
+                etree.SubElement(customer, 'zip').text = zip
+            if country:
+                etree.SubElement(customer, 'country').text = country
+    return etree.tostring(root, xml_declaration=True, encoding='utf-8')
+
+WORDS = ['', 'Smith', 'A & B', '<tag>', 'x > y', 'line\r\nbreak', u'J\xf6rg', u'M\xfcnchen', '"quoted"', "it's"]
+
+class TemplateTest(unittest.TestCase):
+    def word(self, rnd):
+        return rnd.choice(WORDS) or None
+
+    def test_subscription_matches_lxml(self):
+        rnd = random.Random(5)
+        for i in xrange(500):
+            recurring = Recurring('localhost', rnd.choice(['login', 'a&b']), 'key<1>')
+            if rnd.random() < 0.7:
+                recurring.set_schedule(rnd.choice([9999, 12]), datetime.datetime(2030, 1, rnd.randint(1, 28)),
+                    rnd.randint(1, 12), rnd.choice(['months', 'days']))
+            if rnd.random() < 0.7:
+                recurring.set_amount('%d.%02d' % (rnd.randint(0, 999), rnd.randint(0, 99)))
+            if rnd.random() < 0.3:
+                recurring.set_trial(rnd.randint(1, 3), '0.00')
+            if rnd.random() < 0.7:
+                recurring.set_credit('4222222222222', ['2030', str(rnd.randint(1, 12))])
+            if rnd.random() < 0.7:
+                recurring.set_customer(rnd.choice(WORDS[1:]), rnd.choice(WORDS[1:]),
+                    *[self.word(rnd) for j in xrange(6)])
+            if rnd.random() < 0.5:
+                recurring.set_subscription_id(rnd.randint(1, 10 ** 9))
+            for requestType in ('ARBCreateSubscriptionRequest', 'ARBUpdateSubscriptionRequest',
+                    'ARBCancelSubscriptionRequest'):
+                self.assertEqual(recurring._toXml(requestType), lxml_subscription(recurring, requestType))
+
+    def test_profile_stream_matches_render(self):
+        rnd = random.Random(6)
+        for i in xrange(50):
+            customer = Customer('localhost', 'login', 'key')
+            customer.set_profile_id(rnd.choice([None, 123]))
+            customer.set_customer_id(rnd.choice([None, 'cust & co']))
+            for j in xrange(rnd.randint(0, 3000)):
+                kind = rnd.randint(0, 2)
+                if kind == 0:
+                    customer.add_payment('4222222222222', ['2030', '12'], rnd.choice([None, '123']))
+                elif kind == 1:
+                    customer.add_billto(rnd.choice(WORDS[1:]), 'Smith', city=self.word(rnd))
+                else:
+                    customer.add_shipping(rnd.choice(WORDS[1:]), 'Smith', zip=self.word(rnd))
+            for requestType, template in CIM_TEMPLATES.items():
+                values = customer._values(requestType)
+                self.assertEqual(''.join(template.stream(values)), template.render(values))
+
+    def test_empty_group(self):
+        template = Template('root', 'ns', [group('outer', [opt('inner', 'inner')]), text('t', 't')])
+        self.assertEqual(template.render({}), "<?xml version='1.0' encoding='utf-8'?>\n"
+            '<root xmlns="ns"><outer/><t/></root>')
+        self.assertEqual(template.render({'inner': 'a', 't': 'b'}), "<?xml version='1.0' encoding='utf-8'?>\n"
+            '<root xmlns="ns"><outer><inner>a</inner></outer><t>b</t></root>')
+
+    def test_escape(self):
+        self.assertEqual(escape('a&b<c>d\re'), 'a&amp;b&lt;c&gt;d&#13;e')
+        self.assertEqual(escape(u'J\xf6rg'), 'J\xc3\xb6rg')
+        self.assertRaises(ValueError, escape, 'J\xc3\xb6rg')
+        self.assertRaises(ValueError, escape, 'nul\x00')
+        self.assertRaises(TypeError, escape, 12)
+
+if __name__ == '__main__':
+    unittest.main()